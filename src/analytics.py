@@ -0,0 +1,246 @@
+"""Rolling / per-year performance analytics and block-bootstrap confidence intervals on daily returns."""
+from __future__ import annotations
+import argparse
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import models
+from batch_backtest import TRADING_DAYS, metrics_from_daily_returns
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ROLLING_WINDOW: int = 126           # 约半年
+N_RESAMPLES: int = 2000
+CONFIDENCE: float = 0.95
+# 一批重采样最多展开的格子数（S x 批大小 x 天数），控制 bootstrap 的内存
+MAX_BOOTSTRAP_CELLS: int = 2**22
+
+
+@dataclass
+class RollingMetrics:
+    """Rolling statistics of ``S`` daily return series; arrays have shape ``(S, n_dates)``.
+
+    The return / volatility / Sharpe definitions are those of
+    ``calculate_performance_metrics`` applied to the trailing window (NaN
+    days skipped); cells whose window has fewer than ``min_periods`` valid
+    days are NaN. ``window=None`` means expanding.
+    """
+    window: int|None
+    annualized_return: np.ndarray
+    annualized_volatility: np.ndarray
+    sharpe_ratio: np.ndarray
+    drawdown: np.ndarray
+    drawdown_days: np.ndarray       # 距上一个净值高点的交易日数
+
+    def to_frame(self, dates:pd.DatetimeIndex, i:int=0)->pd.DataFrame:
+        """Series ``i`` as one row per date."""
+        return pd.DataFrame({
+            "date": dates,
+            "annualized_return": self.annualized_return[i],
+            "annualized_volatility": self.annualized_volatility[i],
+            "sharpe_ratio": self.sharpe_ratio[i],
+            "drawdown": self.drawdown[i],
+            "drawdown_days": self.drawdown_days[i],
+        })
+
+
+def _window_sums(prefix:np.ndarray, window:int|None)->np.ndarray:
+    """Trailing-``window`` sums from inclusive prefix sums along the last axis (expanding if None)."""
+    if window is None or window >= prefix.shape[-1]:
+        return prefix
+    sums = prefix.copy()
+    sums[..., window:] -= prefix[..., :-window]
+    return sums
+
+def drawdown_series(daily_returns:np.ndarray)->tuple[np.ndarray, np.ndarray]:
+    """Drawdown from the running peak of the equity curve and the days since that peak.
+
+    Missing days count as a zero return, as in ``metrics_from_daily_returns``.
+    """
+    daily_returns = np.atleast_2d(daily_returns)
+    equity_curve = np.cumprod(np.where(np.isnan(daily_returns), 1.0, 1 + daily_returns), axis=1)
+    running_max = np.maximum.accumulate(equity_curve, axis=1)
+    drawdown = (equity_curve - running_max) / running_max
+    days = np.arange(daily_returns.shape[1])
+    last_peak = np.maximum.accumulate(np.where(equity_curve >= running_max, days, 0), axis=1)
+    return drawdown, days - last_peak
+
+def rolling_metrics(daily_returns:np.ndarray,
+                    window:int|None=ROLLING_WINDOW,
+                    min_periods:int|None=None)->RollingMetrics:
+    """Rolling (or expanding) return, volatility, Sharpe and drawdown in one pass over the dates.
+
+    Running counts and sums of ``x``, ``x^2`` and ``log(1 + x)`` are
+    accumulated once with ``cumsum``; each window is the difference of two
+    prefix sums, so the cost is O(T) whatever the window.
+    """
+    daily_returns = np.atleast_2d(np.asarray(daily_returns, dtype=np.float64))
+    valid = ~np.isnan(daily_returns)
+    if min_periods is None:
+        min_periods = window if window is not None else 2
+    # 先减去整段均值再累加平方和：方差不变，前缀和相减时不丢精度
+    count_all = valid.sum(axis=1, keepdims=True)
+    center = np.where(valid, daily_returns, 0.0).sum(axis=1, keepdims=True) / np.maximum(count_all, 1)
+    x = np.where(valid, daily_returns - center, 0.0)
+    n = _window_sums(np.cumsum(valid, axis=1), window)
+    s1 = _window_sums(np.cumsum(x, axis=1), window)
+    s2 = _window_sums(np.cumsum(x * x, axis=1), window)
+    slog = _window_sums(np.cumsum(np.where(valid, np.log1p(daily_returns), 0.0), axis=1), window)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        annualized_return = np.expm1(slog * TRADING_DAYS / n)
+        variance = np.maximum(s2 - s1 * s1 / n, 0.0) / (n - 1)
+        annualized_volatility = np.sqrt(variance) * np.sqrt(TRADING_DAYS)
+        sharpe_ratio = np.where(annualized_volatility != 0, annualized_return / annualized_volatility, np.nan)
+    enough = n >= max(min_periods, 1)
+    annualized_return = np.where(enough, annualized_return, np.nan)
+    annualized_volatility = np.where(enough & (n > 1), annualized_volatility, np.nan)
+    sharpe_ratio = np.where(enough & (n > 1), sharpe_ratio, np.nan)
+    drawdown, drawdown_days = drawdown_series(daily_returns)
+    return RollingMetrics(window=window, annualized_return=annualized_return,
+                          annualized_volatility=annualized_volatility, sharpe_ratio=sharpe_ratio,
+                          drawdown=drawdown, drawdown_days=drawdown_days)
+
+def yearly_metrics(daily_returns:np.ndarray, dates:pd.DatetimeIndex)->list[list[models.YearMetrics]]:
+    """``BacktestMetrics`` per calendar year for each of the ``S`` series (years without data are left out)."""
+    daily_returns = np.atleast_2d(daily_returns)
+    years = pd.DatetimeIndex(dates).year.to_numpy()
+    result: list[list[models.YearMetrics]] = [[] for _ in range(daily_returns.shape[0])]
+    # 每年一次，所有策略一起算
+    for year in np.unique(years):
+        for i, metrics in enumerate(metrics_from_daily_returns(daily_returns[:, years == year])):
+            if metrics["n_days"]:
+                result[i].append(models.YearMetrics(year=int(year), **metrics))
+    return result
+
+def default_block_length(n_days:int)->int:
+    """Rule-of-thumb block length ``n^(1/3)`` (at least 1)."""
+    return max(1, int(round(n_days ** (1 / 3))))
+
+def block_bootstrap(daily_returns:np.ndarray,
+                    n_resamples:int=N_RESAMPLES,
+                    block_length:int|None=None,
+                    seed:int=0,
+                    max_cells:int=MAX_BOOTSTRAP_CELLS)->tuple[np.ndarray, np.ndarray]:
+    """Circular block-bootstrap distributions of the annualized return and the Sharpe ratio.
+
+    Returns two ``(S, n_resamples)`` arrays. NaN days are dropped first; a
+    resample strings together blocks of ``block_length`` consecutive days
+    starting at random days (wrapping around at the end) up to the series'
+    own length. Resamples are drawn as index arrays and gathered in batches
+    of at most ``max_cells`` values, never one Python iteration per resample.
+    """
+    daily_returns = np.atleast_2d(np.asarray(daily_returns, dtype=np.float64))
+    n_series = daily_returns.shape[0]
+    valid = ~np.isnan(daily_returns)
+    lengths = valid.sum(axis=1)
+    width = int(lengths.max()) if n_series else 0
+    annualized_return = np.full((n_series, n_resamples), np.nan)
+    sharpe_ratio = np.full((n_series, n_resamples), np.nan)
+    if width == 0:
+        return annualized_return, sharpe_ratio
+
+    # 有效日按原顺序挪到每行前面，每行在自己的长度内环形取块
+    order = np.argsort(~valid, axis=1, kind="stable")
+    packed = np.take_along_axis(daily_returns, order, axis=1)[:, :width]
+    block_length = block_length or default_block_length(width)
+    n_blocks = -(-width // block_length)
+    block_of = np.arange(width) // block_length
+    offset = np.arange(width) % block_length
+    modulus = np.maximum(lengths, 1)[:, None, None]
+    mask = (np.arange(width) < lengths[:, None])[:, None, :]
+    n = lengths[:, None].astype(np.float64)
+    rows = np.arange(n_series)[:, None, None]
+
+    rng = np.random.default_rng(seed)
+    batch = max(1, max_cells // (n_series * width))
+    for start in range(0, n_resamples, batch):
+        stop = min(start + batch, n_resamples)
+        starts = (rng.random((n_series, stop - start, n_blocks)) * modulus).astype(np.int64)
+        sample = packed[rows, (starts[..., block_of] + offset) % modulus]
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            slog = np.where(mask, np.log1p(sample), 0.0).sum(axis=-1)
+            mean = np.where(mask, sample, 0.0).sum(axis=-1) / n
+            squared = np.where(mask, (sample - mean[..., None]) ** 2, 0.0).sum(axis=-1)
+            ann = np.expm1(slog * TRADING_DAYS / n)
+            vol = np.sqrt(squared / (n - 1)) * np.sqrt(TRADING_DAYS)
+            annualized_return[:, start:stop] = np.where(n > 0, ann, np.nan)
+            sharpe_ratio[:, start:stop] = np.where((n > 1) & (vol != 0), ann / vol, np.nan)
+    return annualized_return, sharpe_ratio
+
+def confidence_interval(estimate:float, samples:np.ndarray, confidence:float=CONFIDENCE)->models.ConfidenceInterval:
+    """Percentile interval of the bootstrap ``samples`` (NaN resamples ignored)."""
+    samples = samples[~np.isnan(samples)]
+    if samples.size:
+        lower, upper = np.quantile(samples, [(1 - confidence) / 2, (1 + confidence) / 2])
+    else:
+        lower = upper = np.nan
+    return models.ConfidenceInterval(estimate=estimate, lower=float(lower), upper=float(upper), confidence=confidence)
+
+def _nan_stat(func, values:np.ndarray)->float:
+    values = values[~np.isnan(values)]
+    return float(func(values)) if values.size else float("nan")
+
+def robustness_metrics(daily_returns:np.ndarray,
+                    dates:pd.DatetimeIndex,
+                    window:int=ROLLING_WINDOW,
+                    n_resamples:int=N_RESAMPLES,
+                    block_length:int|None=None,
+                    confidence:float=CONFIDENCE,
+                    seed:int=0)->list[models.RobustnessMetrics]:
+    """``RobustnessMetrics`` for every row of an ``(S, n_dates)`` daily return matrix."""
+    daily_returns = np.atleast_2d(np.asarray(daily_returns, dtype=np.float64))
+    rolling = rolling_metrics(daily_returns, window)
+    yearly = yearly_metrics(daily_returns, dates)
+    point = metrics_from_daily_returns(daily_returns)
+    block_length = block_length or default_block_length(int((~np.isnan(daily_returns)).sum(axis=1).max(initial=0)))
+    boot_return, boot_sharpe = block_bootstrap(daily_returns, n_resamples, block_length, seed)
+    results = []
+    for i in range(daily_returns.shape[0]):
+        results.append(models.RobustnessMetrics(
+            rolling_window=window,
+            rolling_sharpe_min=_nan_stat(np.min, rolling.sharpe_ratio[i]),
+            rolling_sharpe_median=_nan_stat(np.median, rolling.sharpe_ratio[i]),
+            rolling_sharpe_max=_nan_stat(np.max, rolling.sharpe_ratio[i]),
+            rolling_volatility_max=_nan_stat(np.max, rolling.annualized_volatility[i]),
+            max_drawdown_days=int(rolling.drawdown_days[i].max(initial=0)),
+            sharpe_ratio_ci=confidence_interval(point[i]["sharpe_ratio"], boot_sharpe[i], confidence),
+            annualized_return_ci=confidence_interval(point[i]["annualized_return"], boot_return[i], confidence),
+            n_resamples=n_resamples,
+            block_length=block_length,
+            yearly=yearly[i],
+        ))
+    return results
+
+def load_daily_returns(path:Path)->pd.Series:
+    """Portfolio daily returns of a saved run: a compact run directory or a signals CSV."""
+    if path.is_dir():
+        daily = pd.read_parquet(path / "daily.parquet")
+        return daily.set_index("date")["strategy_return"].sort_index()
+    data = pd.read_csv(path, usecols=["date", "strategy_return"], parse_dates=["date"])
+    return data.groupby("date")["strategy_return"].mean().sort_index()
+
+def main()->None:
+    parser = argparse.ArgumentParser(description="Rolling, per-year and bootstrap statistics of a saved backtest run.")
+    parser.add_argument("run", type=Path, help="compact run directory or signals CSV written by backtest.py")
+    parser.add_argument("--window", type=int, default=ROLLING_WINDOW, help="rolling window in trading days")
+    parser.add_argument("--resamples", type=int, default=N_RESAMPLES)
+    parser.add_argument("--block-length", type=int, default=None, help="bootstrap block length (default: n^(1/3))")
+    parser.add_argument("--output", type=Path, default=None, help="CSV for the rolling series (default: next to the run)")
+    args = parser.parse_args()
+
+    daily = load_daily_returns(args.run)
+    values = daily.to_numpy()[None]
+    rolling = rolling_metrics(values, args.window).to_frame(daily.index)
+    output = args.output or args.run.with_name(f"{args.run.stem}_rolling.csv")
+    rolling.to_csv(output, index=False)
+    result = robustness_metrics(values, daily.index, args.window, args.resamples, args.block_length)[0]
+    logger.info(f"Saved rolling series to {output}\nRobustness:\n{result.model_dump_json(indent=4)}")
+
+if __name__ == "__main__":
+    main()
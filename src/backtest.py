@@ -1,20 +1,58 @@
 from __future__ import annotations
+import argparse
 import pandas as pd
 import numpy as np
 from pathlib import Path
 import logging
 import strategies
 import models
+import factor_registry
+from factor_store import FactorStore
+from telemetry import Telemetry, track
+import date_panel
+import ranking
+import result_cache
+from result_cache import ResultCache
+import run_output
+from run_output import RunWriter
 
 from typing import Callable
-from consts import INITIAL_CAPITAL, INPUT_FILE, OUTPUT_DIR
+from consts import INITIAL_CAPITAL, INPUT_FILE, OUTPUT_DIR, FACTOR_STORE_DIR, PROCESSED_DATA_DIR
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 logger = logging.getLogger(__name__)
 SigFuncType = Callable[[pd.DataFrame], pd.DataFrame]
+# 回测本身需要的列（calculate_strategy_returns 用到）
+BACKTEST_COLUMNS: list[str] = ["return_1day"]
 
 
 
+def load_factor_data(columns:list[str]|None=None,
+                    store_dir:Path=FACTOR_STORE_DIR,
+                    csv_file:Path=INPUT_FILE,
+                    raw_file:Path=PROCESSED_DATA_DIR / "combined_stocks_data.csv")->pd.DataFrame:
+    """Load factor columns from the columnar factor store.
+
+    Falls back to the factor CSV file, and if that does not exist either,
+    computes just the requested columns from the raw price data through the
+    factor dependency graph.
+    """
+    store = FactorStore(store_dir)
+    if store.exists() and (columns is None or set(columns) <= set(store.columns())):
+        data = store.read(columns=columns, memory_map=True)
+        logger.info(f"Loaded {data.shape[0]} rows x {data.shape[1]} columns from factor store {store_dir}")
+        return data
+    usecols = None if columns is None else list(dict.fromkeys(["date", "ticker", *columns]))
+    if csv_file.exists():
+        logger.warning(f"Factor store {store_dir} not usable, falling back to {csv_file}")
+        return pd.read_csv(csv_file, usecols=usecols, parse_dates=['date'])
+    if columns is None:
+        raise FileNotFoundError(f"Neither {store_dir} nor {csv_file} exists")
+    # 只按需计算策略用到的因子子图
+    logger.warning(f"No precomputed factors found, computing {len(columns)} columns from {raw_file}")
+    data = pd.read_csv(raw_file, parse_dates=['date'])
+    data = factor_registry.compute_factors(data, columns)
+    return data[usecols]
 
 def calculate_strategy_returns(data:pd.DataFrame, initial_capital: float=float(INITIAL_CAPITAL))->pd.DataFrame:
     """Calculate strategy returns based on generated signals."""
@@ -64,39 +102,139 @@ def calculate_performance_metrics(data:pd.DataFrame)->dict:
         "n_days": n_days
     }
 
+def run_strategy(data:pd.DataFrame,
+                strategy:str,
+                signal_func:SigFuncType,
+                signal_kwargs:dict={},
+                telemetry:Telemetry|None=None,
+                )->tuple[pd.DataFrame, models.StrategyRunResult]:
+    """Run a strategy and its backtest in memory, returning the backtest frame and the result.
+    telemetry 不为空时记录 signals / returns / metrics 三个阶段，并附到结果上。"""
+    config = models.StrategyConfig(strategy_name=strategy, parameters=signal_kwargs)
+    with track(telemetry, "signals") as stage:
+        df = stage.observe(signal_func(data, **signal_kwargs))
+    with track(telemetry, "returns") as stage:
+        df = stage.observe(calculate_strategy_returns(df))
+    with track(telemetry, "metrics") as stage:
+        metrics_dict = calculate_performance_metrics(df)
+        backtest_metrics = models.BacktestMetrics(**metrics_dict)
+    run_result = models.StrategyRunResult(strategy_config=config, backtest_result=backtest_metrics)
+    if telemetry is not None:
+        run_result.telemetry = telemetry.summary()
+    return df, run_result
+
+def strategy_cache_key(data:pd.DataFrame,
+                    strategy:str,
+                    signal_func:SigFuncType,
+                    signal_kwargs:dict)->str:
+    """Content key of a run: the columns the strategy reads, the strategy / backtest code and the parameters."""
+    columns = ["date", "ticker", *dict.fromkeys([*strategies.required_columns(signal_func, signal_kwargs), *BACKTEST_COLUMNS])]
+    source = result_cache.fingerprint_frame(data, columns)
+    code = result_cache.code_version(signal_func, strategies, ranking, date_panel,
+                                     calculate_strategy_returns, calculate_performance_metrics)
+    return result_cache.cache_key("backtest", source, code, strategy, signal_kwargs)
+
 def generate_backtest_signals(data:pd.DataFrame, 
                             strategy: str, 
                             signal_func:SigFuncType,
                             save_data_path:Path=(Path("results/backtest/signals.csv")),
                             signal_kwargs:dict={},
+                            telemetry:Telemetry|None=None,
+                            profile_file:Path|None=None,
+                            cache:ResultCache|None=None,
+                            output_format:str="csv",
+                            writer:RunWriter|None=None,
                             )->models.StrategyRunResult:
-    """Generate backtest signals using the specified strategy function and calculate performance metrics."""
-    config = models.StrategyConfig(name=strategy, parameters=signal_kwargs)
-    df = data.copy()
-    df = signal_func(df, **signal_kwargs)
-    df = calculate_strategy_returns(df)
-    metrics_dict = calculate_performance_metrics(df)
-    backtest_metrics = models.BacktestMetrics(**metrics_dict)
-    run_result = models.StrategyRunResult(strategy_config=config, backtest_result=backtest_metrics)
+    """Generate backtest signals using the specified strategy function and calculate performance metrics.
+    telemetry 不为空时结果里带上各阶段（含 save）的耗时 / 内存，profile_file 为 cProfile 输出路径。
+    cache 不为空时，同样的数据 + 策略代码 + 参数直接返回缓存的结果（前提是 save_data_path 还是那次写出的文件）。
+    output_format="compact" 时 save_data_path 是一个目录，只存持仓变化事件 / 收益 / 净值（见 run_output），
+    给了 writer 就在后台线程写，函数立即返回。"""
+    if output_format not in ("csv", "compact"):
+        raise ValueError(f"Unknown output format {output_format!r}, expected 'csv' or 'compact'")
+    key_file = save_data_path.with_suffix(".cache_key")
+    key = None
+    if cache is not None:
+        with track(telemetry, "cache"):
+            key = strategy_cache_key(data, strategy, signal_func, signal_kwargs)
+            cached = cache.get_result(key)
+        if cached is not None and key_file.exists() and key_file.read_text() == key:
+            if telemetry is not None:
+                cached.telemetry = telemetry.finish(profile_file)
+            logger.info(f"Backtest Results for strategy {strategy} (cached):\n{cached.model_dump_json(indent=4)}")
+            return cached
+
+    df, run_result = run_strategy(data, strategy, signal_func, signal_kwargs, telemetry=telemetry)
+    # telemetry 属于单次运行，不进缓存 / 结果文件
+    stored_result = run_result.model_copy(update={"telemetry": None})
+    with track(telemetry, "save") as stage:
+        stage.observe(df)
+        save_data_path.parent.mkdir(parents=True, exist_ok=True)
+        if output_format == "csv":
+            save = lambda: df.to_csv(save_data_path, index=False)
+        else:
+            save = lambda: run_output.write_run(df, save_data_path, stored_result)
+        if key is not None:
+            cache.put_result(key, stored_result)
+
+        def job()->None:
+            save()
+            # 缓存 key 在数据写完之后才落盘，写到一半不会被当成命中
+            if key is not None:
+                key_file.write_text(key)
+
+        if writer is not None:
+            writer.submit(job)
+        else:
+            job()
+    if telemetry is not None:
+        run_result.telemetry = telemetry.finish(profile_file)
     logger.info(f"Backtest Results for strategy {strategy}:\n{run_result.model_dump_json(indent=4)}")
-    save_data_path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(save_data_path, index=False)
-    return models.StrategyRunResult(strategy_config=config, backtest_result=backtest_metrics)
+    return run_result
 
 def main()->None:
-    
-    data = pd.read_csv(INPUT_FILE, parse_dates=['date'])
+    parser = argparse.ArgumentParser(description="Backtest the built-in strategies on the factor data.")
+    parser.add_argument("--no-telemetry", action="store_true", help="do not record per-stage timings / memory")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"write a cProfile dump per strategy to {OUTPUT_DIR} and trace allocations per stage (slower)")
+    parser.add_argument("--no-cache", action="store_true", help="always recompute instead of reusing cached results")
+    parser.add_argument("--output-format", choices=["csv", "compact"], default="csv",
+                        help="csv: full frame per strategy; compact: position events + returns, written in the background")
+    args = parser.parse_args()
     strategy_map = [
-        ("Momentum Strategy", strategies.momentum_strategy, {"factors": ["return_20day", "return_60day", "return_120day", "return_250day"], "top_n": 10}),
+        ("Momentum Strategy", strategies.momentum_strategy, {"factors": ["return_20day", "return_60day", "return_120day", "return_250day"], "top_n": 10, "long_short": False}),
         ("Mean Reversion Strategy", strategies.mean_reversion_strategy, {"top_n": 10}),
         ("MA Crossover Strategy", strategies.ma_crossover_strategy, {}),
         ("Volume Breakout Strategy", strategies.volume_breakout_strategy, {}),
-        ("RSI Strategy", strategies.rsi_strategy, {"lower_threshold": 30, "upper_threshold": 70}),
+        ("RSI Strategy", strategies.rsi_strategy, {"lower_threshold": 30, "upper_threshold": 70, "rsi_col": "rsi_10"}),
     ]
-    for name, strategy_fun, kwargs in strategy_map:
-        logger.info(f"Generating backtest signals for {name}...")
-        save_path = OUTPUT_DIR / f"{name.replace(' ', '_').lower()}_signals.csv"
-        generate_backtest_signals(data, strategy=name, signal_func=strategy_fun, save_data_path=save_path, signal_kwargs=kwargs)
+    # 只加载各策略实际用到的因子列
+    columns = set(BACKTEST_COLUMNS)
+    for _, strategy_fun, kwargs in strategy_map:
+        columns.update(strategies.required_columns(strategy_fun, kwargs))
+    load_telemetry = None if args.no_telemetry else Telemetry(trace_allocations=args.profile)
+    with track(load_telemetry, "load") as stage:
+        data = stage.observe(load_factor_data(sorted(columns)))
+    if load_telemetry is not None:
+        load_telemetry.finish()
+    cache = None if args.no_cache else ResultCache()
+    with RunWriter() as writer:
+        for name, strategy_fun, kwargs in strategy_map:
+            logger.info(f"Generating backtest signals for {name}...")
+            stem = name.replace(' ', '_').lower()
+            if args.output_format == "csv":
+                save_path = OUTPUT_DIR / f"{stem}_signals.csv"
+            else:
+                save_path = OUTPUT_DIR / f"{stem}_run"
+            telemetry = None
+            if not args.no_telemetry:
+                # 数据只加载一次，每个策略的 telemetry 都带上这次 load
+                telemetry = Telemetry(trace_allocations=args.profile, profile=args.profile)
+                telemetry.prepend(load_telemetry)
+            generate_backtest_signals(data, strategy=name, signal_func=strategy_fun, save_data_path=save_path, signal_kwargs=kwargs,
+                                      telemetry=telemetry, profile_file=OUTPUT_DIR / f"{stem}.prof" if args.profile else None,
+                                      cache=cache, output_format=args.output_format,
+                                      writer=writer if args.output_format == "compact" else None)
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,17 @@
+import argparse
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import logging
+from consts import FACTOR_STORE_DIR
+from factor_store import FactorStore
+import factor_engine
+import factor_registry
+import parallel_factors
+import compact as compact_dtypes
+from telemetry import Telemetry, track
+import result_cache
+from result_cache import ResultCache
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -59,24 +70,102 @@ def calculate_momentum_factors(data:pd.DataFrame)->pd.DataFrame:
         data[f"rsi_{period}"] = 100 - (100 / (1 + rs))
     return data
 
-def calculate_all_factors(input_file:Path, output_file:Path)->pd.DataFrame:
-    """Calculate all basic financial factors for stock data."""
-    data = pd.read_csv(input_file, parse_dates=['date'])
-    data = calculate_returns_factors(data)
-    data = calculate_moving_averages(data)
-    data = calculate_volatility(data)
-    data = calculate_volume_factors(data)
-    data = calculate_momentum_factors(data)
-    output_file.parent.mkdir(parents=True, exist_ok=True)
-    data.to_csv(output_file, index=False)
+def factor_cache_base(data:pd.DataFrame, compact:bool=False)->str:
+    """Cache key prefix for factor columns computed from ``data`` by the current factor code."""
+    source = result_cache.fingerprint_frame(data, ["date", "ticker", *factor_registry.SOURCE_COLUMNS])
+    code = result_cache.code_version(factor_engine, factor_registry)
+    return result_cache.cache_key("factors", source, code, compact)
+
+def calculate_all_factors(input_file:Path,
+                        output_file:Path|None=None,
+                        store_dir:Path|None=None,
+                        partition_by:str|None=None,
+                        engine:str="panel",
+                        columns:list[str]|None=None,
+                        telemetry:Telemetry|None=None,
+                        compact:bool=False,
+                        cache:ResultCache|None=None,
+                        n_workers:int|None=1)->pd.DataFrame:
+    """Calculate all basic financial factors for stock data.
+    结果写到 output_file（CSV）和/或 store_dir（分区 Parquet 因子库），两者都可选；写因子库是整体替换，
+    partition_by 为空时沿用因子库记录的分区方式（新库按 ticker）。
+    engine="panel" 用 factor_engine 的向量化面板计算，engine="pandas" 用下面逐 ticker 的 groupby 实现。
+    columns 不为空时只按 factor_registry 的依赖图计算这些列（及其依赖）。
+    telemetry 不为空时记录 load / 每个因子族 / save 各阶段的耗时和内存。
+    compact=True 时 ticker 为 categorical，因子列存成 float32（计算仍用 float64）。
+    cache 不为空时按输入行情 + 因子代码版本查找已算过的因子列，只补算缺失的列（仅 panel 引擎）。
+    n_workers 不为 1 时 panel 引擎按 ticker 分片多进程计算（None = 全部核心），结果与单进程一致。"""
+    with track(telemetry, "load") as stage:
+        data = stage.observe(pd.read_csv(input_file, parse_dates=['date']))
+    input_columns = list(data.columns)
+    wanted = list(columns) if columns is not None else factor_engine.factor_columns()
+    cache_base, hits = None, []
+    if cache is not None and engine == "panel":
+        with track(telemetry, "cache") as stage:
+            cache_base = factor_cache_base(data, compact)
+            cached = {c: cache.get_array(result_cache.cache_key(cache_base, c)) for c in wanted}
+            hits = [c for c, values in cached.items() if values is not None]
+            data = stage.observe(data.assign(**{c: cached[c] for c in hits}))
+        logger.info(f"Factor cache: {len(hits)}/{len(wanted)} columns cached")
+        if hits:
+            # 部分命中：剩下的列按依赖图补算，命中的列直接作为依赖复用
+            columns = wanted
+    if columns is not None:
+        with track(telemetry, "factors") as stage:
+            data = stage.observe(factor_registry.compute_factors(data, columns))
+    elif engine == "panel" and n_workers != 1:
+        data = parallel_factors.compute_all_factors(data, telemetry=telemetry, n_workers=n_workers,
+                                                    dtype=compact_dtypes.FACTOR_DTYPE if compact else np.float64)
+    elif engine == "panel":
+        data = factor_engine.compute_all_factors(data, telemetry=telemetry,
+                                                 dtype=compact_dtypes.FACTOR_DTYPE if compact else np.float64)
+    elif engine == "pandas":
+        families = [
+            ("returns", calculate_returns_factors),
+            ("moving_averages", calculate_moving_averages),
+            ("volatility", calculate_volatility),
+            ("volume", calculate_volume_factors),
+            ("momentum", calculate_momentum_factors),
+        ]
+        for family, calculate in families:
+            with track(telemetry, f"factors.{family}") as stage:
+                data = stage.observe(calculate(data))
+    else:
+        raise ValueError(f"Unknown factor engine {engine!r}, expected 'panel' or 'pandas'")
+    if cache_base is not None:
+        for c in wanted:
+            if c not in hits:
+                cache.put_array(result_cache.cache_key(cache_base, c), data[c].to_numpy())
+        data = data[[*input_columns, *(c for c in wanted if c not in input_columns)]]
+    if compact:
+        # panel 引擎直接输出 float32；另外两条路径用 pandas 算完再降精度
+        data = compact_dtypes.categorical_tickers(data)
+        if columns is not None or engine != "panel":
+            data = compact_dtypes.compact_factors(data)
+    if output_file is not None or store_dir is not None:
+        with track(telemetry, "save") as stage:
+            stage.observe(data)
+            if output_file is not None:
+                output_file.parent.mkdir(parents=True, exist_ok=True)
+                data.to_csv(output_file, index=False)
+            if store_dir is not None:
+                FactorStore(store_dir, partition_by=partition_by).write(data)
     return data
 
 def main()->None: 
+    parser = argparse.ArgumentParser(description="Calculate the basic factors into the factor store.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes to shard the tickers over (0 = all cores)")
+    parser.add_argument("--trace-allocations", action="store_true",
+                        help="measure per-stage memory with tracemalloc instead of peak RSS (slower)")
+    args = parser.parse_args()
     INPUT_DIR = Path("data/processed")
-    OUTPUT_DIR = Path("data/factors")
     INPUT_FILE = INPUT_DIR / "combined_stocks_data.csv" # combined_stocks_data.csv exists from download_data.py
-    OUTPUT_FILE = OUTPUT_DIR / "stocks_with_factors.csv" # stocks_with_factors.csv will be created
-    calculate_all_factors(INPUT_FILE, OUTPUT_FILE)
+    telemetry = Telemetry(trace_allocations=args.trace_allocations)
+    calculate_all_factors(INPUT_FILE, store_dir=FACTOR_STORE_DIR, telemetry=telemetry, cache=ResultCache(),
+                          n_workers=args.workers or None) # data/factors/store/ticker=XXX/*.parquet
+    telemetry.finish()
+    logger.info(f"Factor stages:\n{telemetry.table().to_string(index=False)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
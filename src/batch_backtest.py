@@ -0,0 +1,123 @@
+"""Matrix-based backtester: many signal sets over one (date x ticker) returns matrix at once."""
+from __future__ import annotations
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import models
+from consts import INITIAL_CAPITAL
+from date_panel import DatePanel
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS: int = 252
+
+
+@dataclass
+class BatchBacktestResult:
+    """Backtest paths for ``S`` strategies; matrices have shape ``(S, n_dates, n_tickers)``.
+
+    Cells a strategy has no row for are NaN in ``positions``,
+    ``strategy_returns`` and ``equity_curve``.
+    """
+    positions: np.ndarray
+    strategy_returns: np.ndarray
+    equity_curve: np.ndarray
+    daily_returns: np.ndarray       # (S, n_dates)，每天横截面平均收益
+    metrics: list[models.BacktestMetrics]
+
+
+def previous_present(present:np.ndarray)->np.ndarray:
+    """Index of the previous present cell along the date axis (-1 if none).
+
+    Works on ``(..., n_dates, n_tickers)``; this is ``groupby('ticker').shift(1)``
+    expressed on a matrix where absent cells are skipped.
+    """
+    dates = np.arange(present.shape[-2]).reshape(-1, 1)
+    last = np.where(present, dates, -1)
+    np.maximum.accumulate(last, axis=-2, out=last)
+    prev = np.full_like(last, -1)
+    prev[..., 1:, :] = last[..., :-1, :]
+    return prev
+
+def metrics_from_daily_returns(daily_returns:np.ndarray)->list[dict]:
+    """``calculate_performance_metrics`` for every row of an ``(S, n_dates)`` matrix.
+
+    NaN days are skipped, exactly like the ``dropna()`` on the per-date means.
+    """
+    daily_returns = np.atleast_2d(daily_returns)
+    valid = ~np.isnan(daily_returns)
+    n_days = valid.sum(axis=1)
+    growth = np.where(valid, 1 + daily_returns, 1.0)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        total_return = growth.prod(axis=1) - 1
+        annualized_return = (1 + total_return) ** (TRADING_DAYS / n_days) - 1
+        mean = np.where(valid, daily_returns, 0.0).sum(axis=1, keepdims=True) / n_days[:, None]
+        squared = np.where(valid, (daily_returns - mean) ** 2, 0.0).sum(axis=1)
+        std = np.where(n_days > 1, np.sqrt(squared / (n_days - 1)), np.nan)
+        annualized_volatility = std * np.sqrt(TRADING_DAYS)
+        sharpe_ratio = np.where(annualized_volatility != 0, annualized_return / annualized_volatility, np.nan)
+        # 缺失日收益按 0 处理，不影响最大回撤
+        equity_curve = np.cumprod(growth, axis=1)
+        running_max = np.maximum.accumulate(equity_curve, axis=1)
+        max_drawdown = ((equity_curve - running_max) / running_max).min(axis=1, initial=0.0)
+        win_rate = (np.where(valid, daily_returns, 0.0) > 0).sum(axis=1) / n_days
+    return [
+        {
+            "total_return": float(total_return[i]),
+            "annualized_return": float(annualized_return[i]),
+            "annualized_volatility": float(annualized_volatility[i]),
+            "sharpe_ratio": float(sharpe_ratio[i]),
+            "max_drawdown": float(max_drawdown[i]),
+            "win_rate": float(win_rate[i]),
+            "n_days": int(n_days[i]),
+        }
+        for i in range(daily_returns.shape[0])
+    ]
+
+def run_batch(signals:np.ndarray,
+            returns:np.ndarray,
+            initial_capital:float=float(INITIAL_CAPITAL))->BatchBacktestResult:
+    """Backtest ``signals`` of shape ``(S, n_dates, n_tickers)`` (or one ``(n_dates, n_tickers)`` set).
+
+    NaN in ``signals`` marks cells the strategy has no row for. Like
+    ``calculate_strategy_returns``, each ticker holds yesterday's signal
+    (its previous present row), earns ``position * return_1day`` and
+    compounds its own equity curve from ``initial_capital``.
+    """
+    signals = signals[None] if signals.ndim == 2 else signals
+    present = ~np.isnan(signals)
+    prev = previous_present(present)
+    held = np.take_along_axis(signals, np.maximum(prev, 0), axis=-2)
+    positions = np.where(prev >= 0, held, 0.0)
+    positions = np.where(present, positions, np.nan)
+    strategy_returns = positions * returns[None]
+    equity_curve = initial_capital * np.cumprod(np.where(np.isnan(strategy_returns), 0.0, strategy_returns) + 1, axis=-2)
+    equity_curve = np.where(present, equity_curve, np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        counts = (~np.isnan(strategy_returns)).sum(axis=-1)
+        sums = np.where(np.isnan(strategy_returns), 0.0, strategy_returns).sum(axis=-1)
+        daily_returns = np.where(counts > 0, sums / counts, np.nan)
+    metrics = [models.BacktestMetrics(**m) for m in metrics_from_daily_returns(daily_returns)]
+    return BatchBacktestResult(positions=positions, strategy_returns=strategy_returns,
+                               equity_curve=equity_curve, daily_returns=daily_returns, metrics=metrics)
+
+def signal_matrices(panel:DatePanel, frames:list[pd.DataFrame])->np.ndarray:
+    """Stack the ``signal`` column of strategy output frames into ``(S, n_dates, n_tickers)``."""
+    signals = np.full((len(frames), *panel.shape), np.nan)
+    for i, frame in enumerate(frames):
+        rows, cols = panel.locate(frame)
+        signals[i, rows, cols] = frame["signal"].to_numpy(dtype=np.float64)
+    return signals
+
+def backtest_frames(data:pd.DataFrame,
+                    frames:list[pd.DataFrame],
+                    initial_capital:float=float(INITIAL_CAPITAL))->BatchBacktestResult:
+    """Backtest several strategy outputs that share the factor data ``data`` in one call."""
+    panel = DatePanel.from_frame(data)
+    returns = panel.pivot(data["return_1day"])
+    return run_batch(signal_matrices(panel, frames), returns, initial_capital)
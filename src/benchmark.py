@@ -0,0 +1,238 @@
+"""Offline benchmark harness: times each pipeline stage on synthetic data and gates regressions."""
+from __future__ import annotations
+import argparse
+import gc
+import json
+import logging
+import platform
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+import backtest
+import basic_factors
+import factor_engine
+import strategies
+from consts import BENCHMARK_DIR
+from synthetic_data import generate_ohlcv
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 规模档位：(ticker 数, 交易日数)
+TIERS: dict[str, tuple[int, int]] = {
+    "small": (50, 500),
+    "medium": (200, 1250),
+    "large": (500, 2500),
+}
+BENCHMARK_STRATEGIES: dict[str, dict[str, Any]] = {
+    "momentum_strategy": {"long_short": True},
+    "mean_reversion_strategy": {"top_n": 10},
+    "ma_crossover_strategy": {},
+    "volume_breakout_strategy": {},
+    "rsi_strategy": {"lower_threshold": 30, "upper_threshold": 70, "rsi_col": "rsi_10"},
+}
+# calculate_strategy_returns / calculate_performance_metrics 用这个策略的输出
+RETURNS_STRATEGY: str = "momentum_strategy"
+
+
+@dataclass
+class StageTiming:
+    """Timing of one stage on one tier; ``seconds`` is the best of ``runs``."""
+    tier: str
+    stage: str
+    n_tickers: int
+    n_days: int
+    n_rows: int
+    seconds: float
+    runs: list[float]
+    peak_memory_mb: float
+
+
+@dataclass
+class BenchmarkReport:
+    created: str
+    environment: dict[str, str]
+    config: dict[str, Any]
+    results: list[StageTiming] = field(default_factory=list)
+
+    def save(self, path:Path)->None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(asdict(self), indent=2))
+
+    @classmethod
+    def load(cls, path:Path)->BenchmarkReport:
+        raw = json.loads(Path(path).read_text())
+        raw["results"] = [StageTiming(**r) for r in raw["results"]]
+        return cls(**raw)
+
+
+@dataclass
+class Regression:
+    tier: str
+    stage: str
+    metric: str         # "seconds" 或 "peak_memory_mb"
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self)->float:
+        return self.current / self.baseline if self.baseline else float("inf")
+
+
+def environment()->dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+def measure(func:Callable[[Any], Any], make_input:Callable[[], Any], repeat:int=3)->tuple[list[float], float]:
+    """Wall times of ``repeat`` calls and the peak traced memory (MB) of one extra call.
+
+    ``make_input`` runs outside the timed region before every call; the
+    strategies and backtest functions leave their input untouched, so the
+    stages below just hand back the same frame. Memory is measured in a
+    separate call since tracemalloc slows allocation-heavy code down.
+    """
+    runs = []
+    for _ in range(repeat):
+        arg = make_input()
+        gc.collect()
+        start = time.perf_counter()
+        func(arg)
+        runs.append(time.perf_counter() - start)
+        del arg
+    arg = make_input()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return runs, peak / 1024 / 1024
+
+def benchmark_tier(tier:str,
+                n_tickers:int,
+                n_days:int,
+                seed:int=0,
+                repeat:int=3,
+                engine:str="panel")->list[StageTiming]:
+    """Time every pipeline stage on one synthetic panel."""
+    bars = generate_ohlcv(n_tickers, n_days, seed=seed)
+    timings = []
+
+    def record(stage:str, func:Callable[[Any], Any], make_input:Callable[[], Any])->None:
+        runs, peak = measure(func, make_input, repeat)
+        timings.append(StageTiming(tier=tier, stage=stage, n_tickers=n_tickers, n_days=n_days, n_rows=len(bars),
+                                   seconds=min(runs), runs=runs, peak_memory_mb=peak))
+        logger.info(f"[{tier}] {stage}: {min(runs):.4f}s, peak {peak:.1f} MB")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 因子阶段从 CSV 读起，与 basic_factors.main 一致
+        input_file = Path(tmp) / "bars.csv"
+        bars.to_csv(input_file, index=False)
+        record("basic_factors", lambda path: basic_factors.calculate_all_factors(path, engine=engine), lambda: input_file)
+    factors = factor_engine.compute_all_factors(bars)
+    signals = None
+    for name, kwargs in BENCHMARK_STRATEGIES.items():
+        func = strategies.STRATEGIES[name]
+        record(f"strategies.{name}", lambda data, func=func, kwargs=kwargs: func(data, **kwargs), lambda: factors)
+        if name == RETURNS_STRATEGY:
+            signals = func(factors, **kwargs)
+    record("calculate_strategy_returns", backtest.calculate_strategy_returns, lambda: signals)
+    returns = backtest.calculate_strategy_returns(signals)
+    record("calculate_performance_metrics", backtest.calculate_performance_metrics, lambda: returns)
+    return timings
+
+def run_benchmarks(tiers:dict[str, tuple[int, int]]=TIERS,
+                seed:int=0,
+                repeat:int=3,
+                engine:str="panel")->BenchmarkReport:
+    report = BenchmarkReport(created=datetime.now().isoformat(timespec="seconds"),
+                             environment=environment(),
+                             config={"seed": seed, "repeat": repeat, "factor_engine": engine,
+                                     "tiers": {name: list(size) for name, size in tiers.items()}})
+    for tier, (n_tickers, n_days) in tiers.items():
+        report.results.extend(benchmark_tier(tier, n_tickers, n_days, seed, repeat, engine))
+    return report
+
+def compare(current:BenchmarkReport,
+            baseline:BenchmarkReport,
+            time_tolerance:float=0.25,
+            memory_tolerance:float=0.25,
+            min_seconds:float=0.01)->list[Regression]:
+    """Stages that got slower / hungrier than ``baseline`` by more than the tolerance.
+
+    Stages faster than ``min_seconds`` in the baseline are too noisy to
+    gate on time. Only (tier, stage) pairs present in both reports are compared.
+    """
+    previous = {(r.tier, r.stage): r for r in baseline.results}
+    regressions = []
+    for result in current.results:
+        base = previous.get((result.tier, result.stage))
+        if base is None:
+            continue
+        if base.seconds >= min_seconds and result.seconds > base.seconds * (1 + time_tolerance):
+            regressions.append(Regression(result.tier, result.stage, "seconds", base.seconds, result.seconds))
+        if result.peak_memory_mb > base.peak_memory_mb * (1 + memory_tolerance):
+            regressions.append(Regression(result.tier, result.stage, "peak_memory_mb", base.peak_memory_mb, result.peak_memory_mb))
+    return regressions
+
+def comparison_table(current:BenchmarkReport, baseline:BenchmarkReport)->pd.DataFrame:
+    """Side-by-side seconds and peak memory for every stage in both reports."""
+    cur = pd.DataFrame([asdict(r) for r in current.results]).set_index(["tier", "stage"])
+    base = pd.DataFrame([asdict(r) for r in baseline.results]).set_index(["tier", "stage"])
+    table = cur[["seconds", "peak_memory_mb"]].join(base[["seconds", "peak_memory_mb"]], rsuffix="_baseline", how="inner")
+    table["time_ratio"] = table["seconds"] / table["seconds_baseline"]
+    table["memory_ratio"] = table["peak_memory_mb"] / table["peak_memory_mb_baseline"]
+    return table
+
+def main()->None:
+    parser = argparse.ArgumentParser(description="Benchmark the factor / strategy / backtest stages on synthetic data.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run the benchmarks and save a JSON report")
+    run_parser.add_argument("--tiers", nargs="+", default=list(TIERS), choices=list(TIERS))
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--factor-engine", default="panel", choices=["panel", "pandas"])
+    run_parser.add_argument("--output", type=Path, default=BENCHMARK_DIR / "latest.json")
+    run_parser.add_argument("--baseline", type=Path, default=None, help="compare against this report after running")
+    compare_parser = subparsers.add_parser("compare", help="compare two saved reports")
+    compare_parser.add_argument("current", type=Path)
+    compare_parser.add_argument("baseline", type=Path)
+    for p in (run_parser, compare_parser):
+        p.add_argument("--time-tolerance", type=float, default=0.25, help="allowed relative slowdown")
+        p.add_argument("--memory-tolerance", type=float, default=0.25, help="allowed relative peak memory growth")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        current = run_benchmarks({name: TIERS[name] for name in args.tiers}, args.seed, args.repeat, args.factor_engine)
+        current.save(args.output)
+        logger.info(f"Saved benchmark report to {args.output}")
+        baseline_file = args.baseline
+    else:
+        current = BenchmarkReport.load(args.current)
+        baseline_file = args.baseline
+    if baseline_file is None:
+        return
+    baseline = BenchmarkReport.load(baseline_file)
+    logger.info(f"Comparison against {baseline_file}:\n{comparison_table(current, baseline).to_string(float_format='{:.4f}'.format)}")
+    regressions = compare(current, baseline, args.time_tolerance, args.memory_tolerance)
+    for r in regressions:
+        logger.error(f"Regression in [{r.tier}] {r.stage}: {r.metric} {r.baseline:.4f} -> {r.current:.4f} ({r.ratio:.2f}x)")
+    if regressions:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
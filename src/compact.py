@@ -0,0 +1,107 @@
+"""Memory-compact dtypes for factor / backtest frames and a float64 validation report."""
+from __future__ import annotations
+import argparse
+import logging
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+import factor_engine
+from consts import OUTPUT_DIR, PROCESSED_DATA_DIR
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+FACTOR_DTYPE = np.float32
+SIGNAL_DTYPE = np.int8
+# 原始行情列保持 float64：因子都从 adj_close / volume 出发，精度在这里丢了就补不回来
+RAW_COLUMNS: set[str] = {"open", "high", "low", "close", "adj_close", "volume", "dividends", "stock_splits"}
+# validation_report 默认跑的策略及参数
+VALIDATION_STRATEGIES: dict[str, dict[str, Any]] = {
+    "momentum_strategy": {"long_short": True},
+    "mean_reversion_strategy": {"top_n": 10},
+    "ma_crossover_strategy": {},
+    "volume_breakout_strategy": {},
+    "rsi_strategy": {"lower_threshold": 30, "upper_threshold": 70, "rsi_col": "rsi_10"},
+}
+
+
+def categorical_tickers(data:pd.DataFrame)->pd.DataFrame:
+    """``ticker`` as a categorical with sorted categories (one small code per row instead of a string)."""
+    if isinstance(data["ticker"].dtype, pd.CategoricalDtype):
+        return data
+    return data.assign(ticker=pd.Categorical(data["ticker"], categories=sorted(data["ticker"].unique())))
+
+def compact_factors(data:pd.DataFrame, columns:list[str]|None=None)->pd.DataFrame:
+    """Downcast float64 factor columns (everything but raw prices by default) to ``FACTOR_DTYPE``."""
+    if columns is None:
+        columns = [c for c in data.columns if c not in RAW_COLUMNS and data[c].dtype == np.float64]
+    return data.astype({c: FACTOR_DTYPE for c in columns})
+
+def compact_frame(data:pd.DataFrame)->pd.DataFrame:
+    """Categorical tickers, float32 factors and int8 signals."""
+    data = compact_factors(categorical_tickers(data))
+    if "signal" in data.columns:
+        data = data.astype({"signal": SIGNAL_DTYPE})
+    return data
+
+def memory_mb(data:pd.DataFrame)->float:
+    return data.memory_usage(deep=True).sum() / 1024 / 1024
+
+def validation_report(bars:pd.DataFrame,
+                    strategy_map:dict[str, dict[str, Any]]=VALIDATION_STRATEGIES)->pd.DataFrame:
+    """Metric deviation of compact mode versus float64, one row per strategy and metric.
+
+    Factors are computed from the same bars both ways; each strategy is then
+    backtested on both frames. ``signal_mismatch`` counts rows whose signal
+    flipped because a float32 factor crossed a threshold differently.
+    """
+    # download_data（concat_dataframes）、basic_factors、factor_eval 也会 import 本模块，回测相关的依赖只在这里用到
+    import backtest
+    import strategies
+
+    full = factor_engine.compute_all_factors(bars)
+    small = factor_engine.compute_all_factors(categorical_tickers(bars), dtype=FACTOR_DTYPE)
+    logger.info(f"Factor frame: {memory_mb(full):.1f} MB float64 vs {memory_mb(small):.1f} MB compact")
+
+    rows = []
+    for name, kwargs in strategy_map.items():
+        func = strategies.STRATEGIES[name]
+        ref_df, ref = backtest.run_strategy(full, name, func, kwargs)
+        cmp_df, cmp = backtest.run_strategy(small, name, func, {**kwargs, "compact": True})
+        key = ["ticker", "date"]
+        ref_df = ref_df.sort_values(key).reset_index(drop=True)
+        cmp_df = cmp_df.astype({"ticker": str}).sort_values(key).reset_index(drop=True)
+        mismatch = int((ref_df["signal"].to_numpy() != cmp_df["signal"].to_numpy()).sum()) \
+            if len(ref_df) == len(cmp_df) else -1
+        for metric, expected in ref.backtest_result.model_dump().items():
+            actual = getattr(cmp.backtest_result, metric)
+            diff = abs(actual - expected)
+            rows.append({
+                "strategy": name,
+                "metric": metric,
+                "float64": expected,
+                "compact": actual,
+                "abs_diff": diff,
+                "rel_diff": diff / abs(expected) if expected else diff,
+                "signal_mismatch": mismatch,
+            })
+    return pd.DataFrame(rows)
+
+def main()->None:
+    parser = argparse.ArgumentParser(description="Compare backtest metrics in compact-dtype mode against float64.")
+    parser.add_argument("--input", type=Path, default=PROCESSED_DATA_DIR / "combined_stocks_data.csv")
+    parser.add_argument("--output", type=Path, default=OUTPUT_DIR / "compact_validation.csv")
+    args = parser.parse_args()
+
+    bars = pd.read_csv(args.input, parse_dates=['date'])
+    report = validation_report(bars)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    report.to_csv(args.output, index=False)
+    worst = report.groupby("strategy")[["abs_diff", "rel_diff", "signal_mismatch"]].max()
+    logger.info(f"Compact vs float64 (max per strategy):\n{worst.to_string()}\nSaved full report to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,9 @@ TICKERS: list[str] = [
     "LLY", "UNH", "CVS", "WFC", "GS",
 ]
 
+# 因子窗口（收益 / 均线 / 波动率 / 成交量 / RSI 共用）
+FACTOR_WINDOWS: list[int] = [5, 10, 20, 60, 120, 250]
+
 # 初始资金
 INITIAL_CAPITAL: float = 100_000.0
 
@@ -27,6 +30,8 @@ TOP_N: int = 10
 LONG_N: int = 5
 SHORT_N: int = 5
 MIN_VALID_FACTORS: int = 2
+# 组合回测：单边交易成本（基点，按换手计）
+TRANSACTION_COST_BPS: float = 10.0
 
 
 # 动量因子 & 权重（默认配置）
@@ -40,7 +45,14 @@ MOMENTUM_WEIGHTS: dict[str, float] = {
 
 # 文件路径
 INPUT_FILE = Path("data/factors/stocks_with_factors.csv")
+FACTOR_STORE_DIR = Path("data/factors/store")
+FACTOR_STATE_DIR = Path("data/factors/state")
 OUTPUT_DIR = Path("results/backtest")
 
 RAW_DATA_DIR = Path("data/raw")
-PROCESSED_DATA_DIR = Path("data/processed")
\ No newline at end of file
+PROCESSED_DATA_DIR = Path("data/processed")
+BAR_CACHE_DIR = Path("data/raw/cache")
+BENCHMARK_DIR = Path("results/benchmarks")
+FACTOR_EVAL_DIR = Path("results/factor_eval")
+RESULT_CACHE_DIR = Path("data/cache")
+RESULT_CACHE_MAX_MB = 2048
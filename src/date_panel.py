@@ -0,0 +1,59 @@
+"""(date x ticker) matrix layout for long-format factor data."""
+from __future__ import annotations
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class DatePanel:
+    """Maps long-format ``(date, ticker)`` rows onto a dense ``(n_dates, n_tickers)`` matrix.
+
+    Dates and tickers are both sorted, so for data sorted by ticker the
+    column order within a date is the same as the row order of that date's
+    group. Cells without a row stay NaN (see ``present``).
+    """
+    row_pos: np.ndarray     # 每行对应的日期行号
+    col_pos: np.ndarray     # 每行对应的 ticker 列号
+    dates: pd.DatetimeIndex
+    tickers: np.ndarray
+
+    @classmethod
+    def from_frame(cls, data:pd.DataFrame)->DatePanel:
+        row_pos, dates = pd.factorize(data["date"], sort=True)
+        col_pos, tickers = pd.factorize(data["ticker"], sort=True)
+        return cls(row_pos=row_pos, col_pos=col_pos,
+                   dates=pd.DatetimeIndex(dates), tickers=np.asarray(tickers))
+
+    @property
+    def shape(self)->tuple[int, int]:
+        return len(self.dates), len(self.tickers)
+
+    @property
+    def present(self)->np.ndarray:
+        """Boolean matrix marking cells that have a row in the long data."""
+        mask = np.zeros(self.shape, dtype=bool)
+        mask[self.row_pos, self.col_pos] = True
+        return mask
+
+    def locate(self, data:pd.DataFrame)->tuple[np.ndarray, np.ndarray]:
+        """Matrix coordinates of the rows of another frame on the same dates / tickers.
+
+        Raises ``KeyError`` if ``data`` has a date or ticker outside the panel.
+        """
+        rows = self.dates.get_indexer(pd.DatetimeIndex(data["date"]))
+        cols = pd.Index(self.tickers).get_indexer(data["ticker"])
+        if (rows < 0).any() or (cols < 0).any():
+            raise KeyError("Frame contains dates or tickers that are not in the panel")
+        return rows, cols
+
+    def pivot(self, values:np.ndarray|pd.Series, fill_value:float=np.nan, dtype=np.float64)->np.ndarray:
+        """Scatter a long-format column into the matrix."""
+        matrix = np.full(self.shape, fill_value, dtype=dtype)
+        matrix[self.row_pos, self.col_pos] = np.asarray(values, dtype=dtype)
+        return matrix
+
+    def unpivot(self, matrix:np.ndarray)->np.ndarray:
+        """Gather matrix values back into long-format row order."""
+        return matrix[self.row_pos, self.col_pos]
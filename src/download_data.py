@@ -1,9 +1,15 @@
 """Script to download historical stock data for specified tickers"""
-import yfinance
+import argparse
+import json
 import logging
-from consts import TICKERS, START_DATE, END_DATE, RAW_DATA_DIR, PROCESSED_DATA_DIR
+from concurrent.futures import ThreadPoolExecutor
+from consts import TICKERS, START_DATE, END_DATE, RAW_DATA_DIR, PROCESSED_DATA_DIR, BAR_CACHE_DIR
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
+from compact import categorical_tickers
+from providers import BAR_COLUMNS, PriceProvider, YFinanceProvider, LocalFileProvider, RateLimiter, fetch_with_retry
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -11,34 +17,9 @@ logger = logging.getLogger(__name__)
 
 
 
-def download_stock_data(ticker:str, start_date:str, end_date:str)->pd.DataFrame:
-    """Download historical stock data for a given ticker and date range."""
-   
-    stock = yfinance.Ticker(ticker)
-    data = stock.history(start=start_date, end=end_date, auto_adjust=False)
-    if data.empty:
-        logger.warning(f"No data found for ticker {ticker}")
-        return None
-    required_columns = ['Open', 'High', 'Low', 'Close', 'Volume']
-    missing_cols = [col for col in required_columns if col not in data.columns]
-    if missing_cols:
-        logger.error(f"Missing columns {missing_cols} in data for {ticker}")
-        return None
-    null_pct=data[required_columns].isnull().sum()/len(data) * 100
-    if (null_pct>0).any():
-        logger.warning(f"Data for {ticker} contains null values:\n{null_pct}")
-    return data
-
-
-def save_to_csv(data:pd.DataFrame, ticker:str,output_dir:Path)->None:
-    """Save the stock data to a CSV file."""
-    output_dir.mkdir(parents=True,exist_ok=True)
-    filename = output_dir / f"{ticker}.csv"
-    data.to_csv(filename)
-    logger.info(f"Saved data for {ticker} to {filename}")
-
-def concat_dataframes(input_dir:Path, output_dir:Path)->pd.DataFrame:
-    """Concatenate a list of DataFrames into a single DataFrame."""
+def concat_dataframes(input_dir:Path, output_dir:Path, compact:bool=False)->pd.DataFrame:
+    """Concatenate a list of DataFrames into a single DataFrame.
+    compact=True 时返回的 ticker 列为 categorical（CSV 内容不变）。"""
     all_files = list(input_dir.glob("*.csv"))
 
     data_frames = []
@@ -68,23 +49,162 @@ def concat_dataframes(input_dir:Path, output_dir:Path)->pd.DataFrame:
     output_file = output_dir / "combined_stocks_data.csv"
     combined_df.to_csv(output_file, index=False)
     logger.info(f"Combined data saved to {output_file}")
+    if compact:
+        combined_df = categorical_tickers(combined_df)
     return combined_df
 
-def main()->None:
-    RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
-    PROCESSED_DATA_DIR.mkdir(parents=True, exist_ok=True)
+class BarCache:
+    """On-disk per-ticker cache of normalized daily bars.
 
-    for ticker in TICKERS:
-        try:
-            data = download_stock_data(ticker, START_DATE, END_DATE)
-            if data is None or data.empty:
+    Each ticker is one Parquet file whose metadata records the half-open
+    date range ``[fetched_start, fetched_end)`` already requested from the
+    provider, so empty stretches (before a listing, holidays at the edges)
+    are not fetched again.
+    """
+
+    def __init__(self, cache_dir:Path=BAR_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+
+    def _path(self, ticker:str)->Path:
+        return self.cache_dir / f"{ticker}.parquet"
+
+    def load(self, ticker:str)->tuple[pd.DataFrame|None, tuple[pd.Timestamp, pd.Timestamp]|None]:
+        """Cached bars and the fetched range, or ``(None, None)``."""
+        path = self._path(ticker)
+        if not path.exists():
+            return None, None
+        table = pq.read_table(path)
+        meta = json.loads(table.schema.metadata[b"fetched_range"])
+        return table.to_pandas(), (pd.Timestamp(meta["start"]), pd.Timestamp(meta["end"]))
+
+    def save(self, ticker:str, bars:pd.DataFrame, fetched_range:tuple[pd.Timestamp, pd.Timestamp])->None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(bars, preserve_index=False)
+        meta = {"start": fetched_range[0].isoformat(), "end": fetched_range[1].isoformat()}
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"fetched_range": json.dumps(meta).encode()})
+        # 先写临时文件再替换，避免中断时留下半个文件
+        tmp_path = self._path(ticker).with_suffix(".tmp")
+        pq.write_table(table, tmp_path)
+        tmp_path.replace(self._path(ticker))
+
+def missing_ranges(start:pd.Timestamp,
+                end:pd.Timestamp,
+                fetched:tuple[pd.Timestamp, pd.Timestamp]|None)->list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """Sub-ranges of ``[start, end)`` not covered by the contiguous ``fetched`` range."""
+    if fetched is None:
+        return [(start, end)]
+    ranges = []
+    if start < fetched[0]:
+        ranges.append((start, fetched[0]))
+    if end > fetched[1]:
+        ranges.append((fetched[1], end))
+    return ranges
+
+def load_ticker(ticker:str,
+                provider:PriceProvider,
+                cache:BarCache,
+                start_date:str,
+                end_date:str,
+                max_retries:int=3,
+                backoff:float=1.0,
+                rate_limiter:RateLimiter|None=None)->pd.DataFrame|None:
+    """Bars of one ticker in ``[start_date, end_date)``, fetching only what the cache does not have.
+
+    Only sub-ranges that returned bars or a confirmed empty answer (``None``
+    from the provider) are recorded as fetched. If a sub-range still fails
+    after the retries, the others are cached and the error is re-raised, so
+    the failed range is requested again next time.
+    """
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    cached, fetched = cache.load(ticker)
+    ranges = missing_ranges(start, end, fetched)
+    if ranges:
+        parts = [] if cached is None else [cached]
+        covered, error = fetched, None
+        for range_start, range_end in ranges:
+            try:
+                bars = fetch_with_retry(provider, ticker, range_start.strftime("%Y-%m-%d"), range_end.strftime("%Y-%m-%d"),
+                                        max_retries=max_retries, backoff=backoff, rate_limiter=rate_limiter)
+            except Exception as e:
+                error = error or e
                 continue
-            save_to_csv(data=data, ticker=ticker, output_dir=RAW_DATA_DIR)
+            if bars is not None and not bars.empty:
+                parts.append(bars)
+            # 缺失区间紧挨着已缓存区间（前面或后面），合并后仍是连续的一段
+            covered = (range_start, range_end) if covered is None else (min(range_start, covered[0]), max(range_end, covered[1]))
+        if covered is not None and covered != fetched:
+            if parts:
+                cached = pd.concat(parts, ignore_index=True).drop_duplicates("date", keep="last").sort_values("date")
+            else:
+                # 确认没有数据也记下已请求的区间，下次不再重复请求
+                cached = pd.DataFrame({c: pd.Series(dtype="datetime64[ns]" if c == "date" else "float64") for c in BAR_COLUMNS})
+            cache.save(ticker, cached.reset_index(drop=True), covered)
+        if error is not None:
+            raise error
+        logger.info(f"Fetched {ticker} for {len(ranges)} missing range(s)")
+    bars = cached[(cached["date"] >= start) & (cached["date"] < end)]
+    return bars.reset_index(drop=True) if not bars.empty else None
+
+def ingest(tickers:list[str],
+        provider:PriceProvider,
+        start_date:str=START_DATE,
+        end_date:str=END_DATE,
+        cache:BarCache|None=None,
+        output_dir:Path=PROCESSED_DATA_DIR,
+        max_workers:int=8,
+        max_retries:int=3,
+        backoff:float=1.0,
+        max_requests_per_second:float|None=None)->dict[str, int]:
+    """Fetch ``tickers`` concurrently and stream them straight into the combined CSV.
+
+    A bounded thread pool loads each ticker through the cache (only missing
+    date ranges hit the provider, with retry/backoff and a shared rate
+    limit). Results are written in ticker order as soon as they are ready,
+    so the combined file matches ``concat_dataframes`` without re-reading
+    per-ticker files. They go to a temporary file that replaces the combined
+    CSV only once every ticker is done. Returns the number of rows written
+    per ticker.
+    """
+    cache = cache or BarCache()
+    rate_limiter = RateLimiter(max_requests_per_second)
+    tickers = sorted(set(tickers))
+
+    def load(ticker:str)->pd.DataFrame|None:
+        try:
+            return load_ticker(ticker, provider, cache, start_date, end_date,
+                            max_retries=max_retries, backoff=backoff, rate_limiter=rate_limiter)
         except Exception as e:
             logger.error(f"Error downloading data for {ticker}: {e}")
-            continue
+            return None
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_file = output_dir / "combined_stocks_data.csv"
+    # 先写临时文件，全部完成后再替换，中断时不会留下半个合并文件
+    tmp_file = output_file.with_suffix(".tmp")
+    rows: dict[str, int] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool, open(tmp_file, "w", newline="") as f:
+        # map 按提交顺序返回，边下载边按 ticker 顺序写入
+        for ticker, bars in zip(tickers, pool.map(load, tickers)):
+            if bars is None:
+                continue
+            bars.to_csv(f, header=not rows, index=False)
+            rows[ticker] = len(bars)
+    tmp_file.replace(output_file)
+    logger.info(f"Combined data for {len(rows)}/{len(tickers)} tickers saved to {output_file}")
+    return rows
+
+def main()->None:
+    parser = argparse.ArgumentParser(description="Download daily bars and build the combined dataset.")
+    parser.add_argument("--provider", choices=["yfinance", "local"], default="yfinance")
+    parser.add_argument("--source-dir", type=Path, default=RAW_DATA_DIR, help="directory of <ticker>.csv files for --provider local")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--rate-limit", type=float, default=None, help="max provider requests per second")
+    args = parser.parse_args()
 
-    concat_dataframes(input_dir=RAW_DATA_DIR, output_dir=PROCESSED_DATA_DIR)
+    provider = YFinanceProvider() if args.provider == "yfinance" else LocalFileProvider(args.source_dir)
+    ingest(TICKERS, provider, START_DATE, END_DATE,
+        max_workers=args.workers, max_retries=args.max_retries, max_requests_per_second=args.rate_limit)
 
 if __name__ == "__main__":
-    main()
+    main()
\ No newline at end of file
@@ -0,0 +1,286 @@
+"""Vectorized factor engine working on dense (row x ticker) NumPy panels."""
+from __future__ import annotations
+import itertools
+import logging
+from dataclasses import dataclass
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from consts import FACTOR_WINDOWS
+from telemetry import Telemetry, track
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Panel:
+    """Long-format rows scattered into a dense ``(n_rows, n_tickers)`` layout.
+
+    Axis 0 is each ticker's own observation number (0, 1, 2, ...), not the
+    calendar date: a ticker with a missing day simply has one row less, which
+    is exactly how the ``groupby('ticker')`` rolling operations see the data.
+    Tickers with shorter histories are padded with NaN at the end.
+    """
+    row_pos: np.ndarray     # 每行在其 ticker 内的序号
+    col_pos: np.ndarray     # 每行对应的 ticker 列号
+    tickers: np.ndarray
+    lengths: np.ndarray     # 每个 ticker 的行数
+    n_rows: int
+
+    @classmethod
+    def from_frame(cls, data:pd.DataFrame)->Panel:
+        """Build the panel layout from the ``ticker`` column, keeping row order within each ticker."""
+        col_pos, tickers = pd.factorize(data["ticker"], sort=True)
+        row_pos = data.groupby(col_pos, sort=False).cumcount().to_numpy()
+        lengths = np.bincount(col_pos, minlength=len(tickers))
+        n_rows = int(lengths.max()) if len(lengths) else 0
+        return cls(row_pos=row_pos, col_pos=col_pos, tickers=np.asarray(tickers),
+                   lengths=lengths, n_rows=n_rows)
+
+    def pivot(self, values:np.ndarray|pd.Series)->np.ndarray:
+        """Scatter a long-format column into the panel."""
+        panel = np.full((self.n_rows, len(self.tickers)), np.nan)
+        panel[self.row_pos, self.col_pos] = np.asarray(values, dtype=np.float64)
+        return panel
+
+    def unpivot(self, panel:np.ndarray)->np.ndarray:
+        """Gather panel values back into long-format row order."""
+        # 按 ticker 排好序的数据在列优先展开下是顺序访问，比二维花式索引快得多
+        flat_index = self.col_pos * self.n_rows + self.row_pos
+        return np.take(panel.ravel(order="F"), flat_index)
+
+
+def shift(panel:np.ndarray, periods:int=1)->np.ndarray:
+    """Shift down along the time axis, filling with NaN."""
+    out = np.full_like(panel, np.nan)
+    if periods < panel.shape[0]:
+        out[periods:] = panel[:-periods]
+    return out
+
+def ffill(panel:np.ndarray)->np.ndarray:
+    """Forward-fill NaNs along the time axis."""
+    idx = np.where(np.isnan(panel), 0, np.arange(panel.shape[0])[:, None])
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return panel[idx, np.arange(panel.shape[1])]
+
+def pct_change(panel:np.ndarray, periods:int)->np.ndarray:
+    """``pct_change`` with pandas' default forward-fill of missing prices."""
+    filled = ffill(panel)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return filled / shift(filled, periods) - 1
+
+class RollingSums(NamedTuple):
+    """Cumulative sums of a centered panel, shared by rolling stats of every window."""
+    total: np.ndarray
+    count: np.ndarray
+    offset: np.ndarray
+    total_sq: np.ndarray|None = None
+
+def _window_sum(cumsum:np.ndarray, window:int)->np.ndarray:
+    out = cumsum.copy()
+    if window < cumsum.shape[0]:
+        out[window:] -= cumsum[:-window]
+    return out
+
+def rolling_sums(panel:np.ndarray, with_squares:bool=False)->RollingSums:
+    """Precompute the cumulative sums behind ``rolling_mean`` / ``rolling_std``."""
+    # 先减去每列均值再累加，降低长序列 cumsum 的舍入误差
+    valid = ~np.isnan(panel)
+    offset = np.where(valid, panel, 0.0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    centered = np.where(valid, panel - offset, 0.0)
+    total_sq = np.cumsum(centered * centered, axis=0) if with_squares else None
+    return RollingSums(total=np.cumsum(centered, axis=0),
+                       count=np.cumsum(valid.astype(np.float64), axis=0),
+                       offset=offset,
+                       total_sq=total_sq)
+
+def mean_from_sums(sums:RollingSums, window:int)->np.ndarray:
+    """Rolling mean with ``min_periods=1`` from precomputed sums."""
+    total, count = _window_sum(sums.total, window), _window_sum(sums.count, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(count > 0, total / count + sums.offset, np.nan)
+
+def std_from_sums(sums:RollingSums, window:int)->np.ndarray:
+    """Rolling sample standard deviation (ddof=1, ``min_periods=1``) from precomputed sums."""
+    total, total_sq = _window_sum(sums.total, window), _window_sum(sums.total_sq, window)
+    count = _window_sum(sums.count, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = (total_sq - total * total / count) / (count - 1)
+    var = np.where(count > 1, np.maximum(var, 0.0), np.nan)
+    return np.sqrt(var)
+
+def rolling_means(panel:np.ndarray, windows:list[int])->list[np.ndarray]:
+    """Rolling means with ``min_periods=1`` for several windows from one cumulative sum."""
+    sums = rolling_sums(panel)
+    return [mean_from_sums(sums, window) for window in windows]
+
+def rolling_mean(panel:np.ndarray, window:int)->np.ndarray:
+    """Rolling mean with ``min_periods=1``."""
+    return rolling_means(panel, [window])[0]
+
+def rolling_stds(panel:np.ndarray, windows:list[int])->list[np.ndarray]:
+    """Rolling sample standard deviations (ddof=1, ``min_periods=1``) for several windows."""
+    sums = rolling_sums(panel, with_squares=True)
+    return [std_from_sums(sums, window) for window in windows]
+
+def rolling_std(panel:np.ndarray, window:int)->np.ndarray:
+    """Rolling sample standard deviation (ddof=1) with ``min_periods=1``."""
+    return rolling_stds(panel, [window])[0]
+
+EwmState = tuple[np.ndarray, np.ndarray]
+
+def ewm_mean(panel:np.ndarray, spans:list[int])->np.ndarray:
+    """``ewm(span, adjust=False).mean()`` for several spans at once.
+
+    Returns an array of shape ``(len(spans), n_rows, n_tickers)``. The
+    recursion runs once over the time axis for all spans and tickers, and
+    follows pandas' NaN handling (``ignore_na=False``) step by step.
+    """
+    return ewm_mean_with_state(panel, spans)[0]
+
+def ewm_mean_with_state(panel:np.ndarray,
+                        spans:list[int],
+                        state:EwmState|None=None,
+                        lengths:np.ndarray|None=None)->tuple[np.ndarray, EwmState]:
+    """EWM mean that can resume from, and hand back, the recursion state.
+
+    ``state`` is ``(weighted, old_wt)`` with shape ``(len(spans), n_tickers)``
+    each, as returned by a previous call; ``None`` starts fresh. The returned
+    state is taken at row ``lengths - 1`` of each ticker, so trailing NaN
+    padding of shorter tickers does not leak into it.
+    """
+    n_rows, n_cols = panel.shape
+    # 与 pandas 一致：span -> com -> alpha
+    alpha = np.array([1.0 / (1.0 + (span - 1) / 2.0) for span in spans])[:, None]
+    factor = 1.0 - alpha
+    if state is None:
+        weighted = np.full((len(spans), n_cols), np.nan)
+        old_wt = np.ones((len(spans), n_cols))
+    else:
+        weighted, old_wt = state[0].copy(), state[1].copy()
+    if lengths is None:
+        lengths = np.full(n_cols, n_rows)
+    final_weighted, final_old_wt = weighted.copy(), old_wt.copy()
+    out = np.empty((len(spans), n_rows, n_cols))
+    for i in range(n_rows):
+        cur = panel[i][None, :]
+        is_obs = ~np.isnan(cur)
+        has_value = ~np.isnan(weighted)
+        old_wt = np.where(has_value, old_wt * factor, old_wt)
+        update = has_value & is_obs & (weighted != cur)
+        blended = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+        weighted = np.where(update, blended, weighted)
+        old_wt = np.where(has_value & is_obs, 1.0, old_wt)
+        weighted = np.where(~has_value & is_obs, cur, weighted)
+        out[:, i] = weighted
+        last = lengths - 1 == i
+        final_weighted[:, last] = weighted[:, last]
+        final_old_wt[:, last] = old_wt[:, last]
+    return out, (final_weighted, final_old_wt)
+
+def rsis(close:np.ndarray, windows:list[int])->list[np.ndarray]:
+    """RSI for several windows sharing one diff and one cumulative sum of gains / losses."""
+    gain, loss = gain_loss(close)
+    return [rsi_from_averages(avg_gain, avg_loss)
+            for avg_gain, avg_loss in zip(rolling_means(gain, windows), rolling_means(loss, windows))]
+
+def rsi_from_averages(avg_gain:np.ndarray, avg_loss:np.ndarray)->np.ndarray:
+    """RSI from rolling average gain and loss."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+
+def gain_loss(close:np.ndarray)->tuple[np.ndarray, np.ndarray]:
+    """Split one-step price changes into gains and losses (first row counts as 0)."""
+    delta = close - shift(close, 1)
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    return gain, loss
+
+def factor_columns(windows:list[int]=FACTOR_WINDOWS)->list[str]:
+    """Factor column names in the order ``basic_factors`` adds them."""
+    names = ["return_1day", *[f"return_{period}day" for period in windows]]
+    for window in windows:
+        names += [f"ma_{window}", f"ema_{window}"]
+    names += [f"volatility_{window}day" for window in windows]
+    for window in windows:
+        names += [f"volume_ma_{window}", f"volume_to_ma_{window}"]
+    names += [f"rsi_{window}" for window in windows]
+    return names
+
+def factor_families(windows:list[int]=FACTOR_WINDOWS, with_ema:bool=True)->list[tuple[str, int]]:
+    """``(family, n_columns)`` in the order ``iter_factor_panels`` yields them.
+
+    Families match the ``calculate_*`` functions of ``basic_factors``.
+    """
+    n = len(windows)
+    return [
+        ("returns", 1 + n),
+        ("moving_averages", 2 * n if with_ema else n),
+        ("volatility", n),
+        ("volume", 2 * n),
+        ("momentum", n),
+    ]
+
+def iter_factor_panels(close:np.ndarray,
+                    volume:np.ndarray,
+                    windows:list[int]=FACTOR_WINDOWS,
+                    returns_close:np.ndarray|None=None,
+                    with_ema:bool=True):
+    """Yield ``(column, panel)`` for every factor, one family at a time.
+
+    ``returns_close`` overrides the prices used for returns (e.g. prices that
+    were already forward-filled from earlier history); ``with_ema=False``
+    skips the EMA recursion for callers that run it themselves.
+    """
+    returns_close = close if returns_close is None else returns_close
+    returns_1d = pct_change(returns_close, 1)
+    yield "return_1day", returns_1d
+    for period in windows:
+        yield f"return_{period}day", pct_change(returns_close, period)
+
+    for window, ma in zip(windows, rolling_means(close, windows)):
+        yield f"ma_{window}", ma
+    if with_ema:
+        for window, ema in zip(windows, ewm_mean(close, windows)):
+            yield f"ema_{window}", ema
+
+    for window, vol in zip(windows, rolling_stds(returns_1d, windows)):
+        yield f"volatility_{window}day", vol
+
+    for window, volume_ma in zip(windows, rolling_means(volume, windows)):
+        yield f"volume_ma_{window}", volume_ma
+        with np.errstate(divide="ignore", invalid="ignore"):
+            yield f"volume_to_ma_{window}", volume / volume_ma
+
+    for window, rsi in zip(windows, rsis(close, windows)):
+        yield f"rsi_{window}", rsi
+
+def compute_all_factors(data:pd.DataFrame,
+                        windows:list[int]=FACTOR_WINDOWS,
+                        telemetry:Telemetry|None=None,
+                        dtype=np.float64)->pd.DataFrame:
+    """Compute the same factor columns as ``basic_factors`` in batched panel passes.
+
+    With ``telemetry`` each factor family is recorded as a ``factors.<family>`` stage.
+    Panels are always computed in float64; ``dtype`` (e.g. float32) only sets
+    the storage type of the output columns.
+    """
+    panel = Panel.from_frame(data)
+    close = panel.pivot(data["adj_close"])
+    volume = panel.pivot(data["volume"])
+    panels = iter_factor_panels(close, volume, windows)
+    columns = {}
+    for family, n_columns in factor_families(windows):
+        # 生成器是惰性的，在 stage 内取值才把计算时间算到对应的因子族
+        with track(telemetry, f"factors.{family}") as stage:
+            for name, values in itertools.islice(panels, n_columns):
+                columns[name] = panel.unpivot(values).astype(dtype, copy=False)
+            stage.rows, stage.columns = len(data), n_columns
+    columns = {name: columns[name] for name in factor_columns(windows)}
+    data = data.assign(**columns)
+    logger.info(f"Computed {len(columns)} factor columns for {len(panel.tickers)} tickers x {panel.n_rows} rows")
+    return data
@@ -0,0 +1,371 @@
+"""Batched factor screening: IC / rank IC, IC decay, rank autocorrelation, turnover and quintile spreads."""
+from __future__ import annotations
+import argparse
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import ranking
+from compact import RAW_COLUMNS
+from consts import FACTOR_EVAL_DIR
+from date_panel import DatePanel
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+HORIZONS: tuple[int, ...] = (1, 5, 10, 20)
+DECAY_LAGS: tuple[int, ...] = (1, 2, 3, 5, 10, 20)
+N_QUANTILES: int = 5
+# 当天同时有因子值和远期收益的股票数少于这个数时，IC 记为 NaN
+MIN_CROSS_SECTION: int = 5
+# 一批因子展开成 (因子 x 日期 x ticker) 的格子数上限
+MAX_BATCH_CELLS: int = 2**22
+
+
+@dataclass
+class FactorEvaluation:
+    """Daily statistics of ``K`` factors; ``ic`` / ``rank_ic`` / ``spread`` have shape ``(K, n_horizons, n_dates)``."""
+    factors: list[str]
+    horizons: tuple[int, ...]
+    decay_lags: tuple[int, ...]
+    dates: pd.DatetimeIndex
+    ic: np.ndarray
+    rank_ic: np.ndarray
+    spread: np.ndarray                      # 顶部分位 - 底部分位的远期收益
+    quantile_returns: np.ndarray            # (K, n_horizons, n_quantiles)，各分位远期收益的时间均值
+    decay: np.ndarray                       # (K, n_lags)，因子对 lag 天后单日收益的平均 rank IC
+    autocorrelation: np.ndarray             # (K,)，相邻两天横截面名次的相关性
+    top_turnover: np.ndarray                # (K,)，顶部分位每天新进入的比例
+    bottom_turnover: np.ndarray
+
+    def summary(self)->pd.DataFrame:
+        """One row per factor and horizon, best mean rank IC (in absolute value) first.
+
+        Consecutive ``h``-day forward returns overlap by ``h - 1`` days, so the
+        t statistics use Newey-West standard errors with ``h - 1`` lags.
+        """
+        rows = []
+        for i, factor in enumerate(self.factors):
+            for j, horizon in enumerate(self.horizons):
+                ic, ic_mean, ic_std = _mean_std(self.ic[i, j])
+                rank_ic, rank_ic_mean, rank_ic_std = _mean_std(self.rank_ic[i, j])
+                spread_mean = _mean_std(self.spread[i, j])[1]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    rows.append({
+                        "factor": factor,
+                        "horizon": horizon,
+                        "n_dates": ic.size,
+                        "ic_mean": ic_mean,
+                        "ic_std": ic_std,
+                        "ic_ir": ic_mean / ic_std,
+                        "ic_t_stat": newey_west_t_stat(self.ic[i, j], horizon - 1),
+                        "ic_hit_rate": float((ic > 0).mean()) if ic.size else np.nan,
+                        "rank_ic_mean": rank_ic_mean,
+                        "rank_ic_std": rank_ic_std,
+                        "rank_ic_ir": rank_ic_mean / rank_ic_std,
+                        "quantile_spread_mean": spread_mean,
+                        "quantile_spread_t_stat": newey_west_t_stat(self.spread[i, j], horizon - 1),
+                        "autocorrelation": self.autocorrelation[i],
+                        "top_turnover": self.top_turnover[i],
+                        "bottom_turnover": self.bottom_turnover[i],
+                    })
+        table = pd.DataFrame(rows)
+        order = table["rank_ic_mean"].abs().sort_values(ascending=False, na_position="last").index
+        return table.loc[order].reset_index(drop=True)
+
+    def decay_table(self)->pd.DataFrame:
+        """Mean rank IC of each factor against the single-day return ``lag`` days ahead."""
+        table = pd.DataFrame(self.decay, columns=[f"lag_{lag}" for lag in self.decay_lags])
+        table.insert(0, "factor", self.factors)
+        return table
+
+    def quantile_table(self)->pd.DataFrame:
+        """Mean forward return of every quantile, one row per factor and horizon."""
+        rows = []
+        for i, factor in enumerate(self.factors):
+            for j, horizon in enumerate(self.horizons):
+                rows.append({"factor": factor, "horizon": horizon,
+                             **{f"q{q + 1}": self.quantile_returns[i, j, q] for q in range(self.quantile_returns.shape[2])}})
+        return pd.DataFrame(rows)
+
+
+def _mean_std(values:np.ndarray)->tuple[np.ndarray, float, float]:
+    values = values[~np.isnan(values)]
+    if values.size < 2:
+        return values, float(values.mean()) if values.size else np.nan, np.nan
+    return values, float(values.mean()), float(values.std(ddof=1))
+
+def newey_west_t_stat(values:np.ndarray, lags:int)->float:
+    """t statistic of the mean of a daily series (NaN dates skipped) with a Bartlett-weighted HAC variance."""
+    values = values[~np.isnan(values)]
+    n = values.size
+    if n < 2:
+        return np.nan
+    errors = values - values.mean()
+    variance = errors @ errors / n
+    for lag in range(1, min(lags, n - 1) + 1):
+        variance += 2 * (1 - lag / (lags + 1)) * (errors[lag:] @ errors[:-lag]) / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return float(values.mean() / np.sqrt(variance / n))
+
+def factor_columns(data:pd.DataFrame)->list[str]:
+    """Numeric columns of a factor frame that are neither raw bars nor backtest outputs."""
+    skip = RAW_COLUMNS | {"date", "ticker", "adj_close_filled", "signal", "position"}
+    return [c for c in data.columns if c not in skip and pd.api.types.is_numeric_dtype(data[c])]
+
+def forward_returns(close:np.ndarray, horizon:int)->np.ndarray:
+    """``close[d + horizon] / close[d] - 1`` along the date axis (NaN past the end or where a close is missing)."""
+    result = np.full(close.shape, np.nan)
+    if horizon < close.shape[0]:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result[:-horizon] = close[horizon:] / close[:-horizon] - 1
+    return result
+
+def row_correlation(x:np.ndarray, y:np.ndarray, min_count:int=MIN_CROSS_SECTION)->np.ndarray:
+    """Pearson correlation along the last axis over the cells where both ``x`` and ``y`` are valid."""
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    count = valid.sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dx = np.where(valid, x, 0.0)
+        dx -= (dx.sum(axis=-1) / count)[..., None]
+        dx[~valid] = 0.0
+        dy = np.where(valid, y, 0.0)
+        dy -= (dy.sum(axis=-1) / count)[..., None]
+        dy[~valid] = 0.0
+        corr = (dx * dy).sum(axis=-1) / np.sqrt((dx * dx).sum(axis=-1) * (dy * dy).sum(axis=-1))
+    return np.where(count >= min_count, corr, np.nan)
+
+def _centered(values:np.ndarray, valid:np.ndarray)->np.ndarray:
+    """Values minus their row mean over the valid cells, 0 elsewhere (keeps the moment sums well conditioned)."""
+    filled = np.where(valid, values, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = filled.sum(axis=-1, keepdims=True) / valid.sum(axis=-1, keepdims=True)
+    return np.where(valid, values - mean, 0.0)
+
+def _factor_moments(centered:np.ndarray, valid:np.ndarray)->np.ndarray:
+    """``[x, x^2, 1]`` of a ``(K, n_dates, n_tickers)`` cube, laid out ``(n_dates, 3K, n_tickers)`` for matmul."""
+    return np.concatenate([centered, centered * centered, valid.astype(np.float64)]).transpose(1, 0, 2)
+
+def _target_moments(centered:np.ndarray, valid:np.ndarray)->np.ndarray:
+    """``[y, 1, y^2]`` of a ``(n_dates, n_tickers)`` matrix, laid out ``(n_dates, n_tickers, 3)``."""
+    return np.stack([centered, valid.astype(np.float64), centered * centered], axis=-1)
+
+def masked_correlation(factor_moments:np.ndarray,
+                    target_moments:np.ndarray,
+                    min_count:int=MIN_CROSS_SECTION)->tuple[np.ndarray, np.ndarray]:
+    """Per-date Pearson correlation of K factors with one target over the cells valid on both sides.
+
+    All six sums (n, Σx, Σy, Σx², Σy², Σxy over the common cells) come out
+    of one batched matrix product per date. Returns ``(corr, count)``, both ``(K, n_dates)``.
+    """
+    k = factor_moments.shape[1] // 3
+    sums = np.matmul(factor_moments, target_moments).transpose(1, 0, 2)
+    sxy, sx, sxx = sums[:k, :, 0], sums[:k, :, 1], sums[k:2 * k, :, 1]
+    sy, count, syy = sums[2 * k:, :, 0], sums[2 * k:, :, 1], sums[2 * k:, :, 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = (count * sxy - sx * sy) / np.sqrt((count * sxx - sx * sx) * (count * syy - sy * sy))
+    return np.where(count >= min_count, corr, np.nan), count
+
+
+@dataclass
+class _Target:
+    """A forward-return matrix prepared once and paired with every factor batch."""
+    valid: np.ndarray
+    count: np.ndarray
+    sorted: tuple[np.ndarray, np.ndarray|None, np.ndarray|None]
+    ranks: np.ndarray
+    moments: np.ndarray
+    rank_moments: np.ndarray
+
+    @classmethod
+    def prepare(cls, values:np.ndarray)->_Target:
+        valid = ~np.isnan(values)
+        order = ranking.sort_rows(values)
+        ranks = ranking.subset_rank(*order, valid)
+        return cls(valid=valid, count=valid.sum(axis=-1), sorted=order, ranks=ranks,
+                   moments=_target_moments(_centered(values, valid), valid),
+                   rank_moments=_target_moments(_centered(ranks, valid), valid))
+
+def _common_rank_correlation(x:np.ndarray, y:np.ndarray, common:np.ndarray, min_count:int)->np.ndarray:
+    """Pearson correlation of ranks 1..n taken among the ``common`` cells of each row (mean is (n + 1) / 2)."""
+    count = common.sum(axis=-1)
+    mean = ((count + 1) / 2)[:, None]
+    dx = np.where(common, x - mean, 0.0)
+    dy = np.where(common, y - mean, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = np.einsum("ij,ij->i", dx, dy) / np.sqrt(np.einsum("ij,ij->i", dx, dx) * np.einsum("ij,ij->i", dy, dy))
+    return np.where(count >= min_count, corr, np.nan)
+
+def _rank_ic(rank_moments:np.ndarray,
+            factor_sorted:tuple[np.ndarray, ...],
+            factor_ranks:np.ndarray,
+            factor_valid:np.ndarray,
+            factor_count:np.ndarray,
+            target:_Target,
+            min_count:int=MIN_CROSS_SECTION)->np.ndarray:
+    """Spearman correlation of a factor batch with ``target`` on the common cells of every date.
+
+    Where neither side loses cells to the other's missing values the own
+    ranks are already the common-cell ranks. Otherwise only the side that
+    loses cells is re-ranked among the common cells (a count, no new sort).
+    """
+    corr, count = masked_correlation(rank_moments, target.rank_moments, min_count)
+    enough = count >= min_count
+    redo_factor = enough & (factor_count > count)
+    redo_target = enough & (target.count > count)
+    ki, di = np.nonzero(redo_factor | redo_target)
+    if ki.size:
+        common = factor_valid[ki, di] & target.valid[di]
+        x = factor_ranks[ki, di]
+        fix = redo_factor[ki, di]
+        if fix.any():
+            x[fix] = ranking.subset_rank(*(None if a is None else a[ki[fix], di[fix]] for a in factor_sorted), common[fix])
+        y = target.ranks[di]
+        fix = redo_target[ki, di]
+        if fix.any():
+            y[fix] = ranking.subset_rank(*(None if a is None else a[di[fix]] for a in target.sorted), common[fix])
+        corr[ki, di] = _common_rank_correlation(x, y, common, min_count)
+    return corr
+
+def quantile_buckets(ranks:np.ndarray, n_quantiles:int=N_QUANTILES)->np.ndarray:
+    """Quantile 0..n-1 of every cell from its cross-sectional rank (-1 where the rank is NaN)."""
+    count = (~np.isnan(ranks)).sum(axis=-1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        buckets = np.floor((ranks - 1) * n_quantiles / count)
+    return np.where(np.isnan(buckets), -1, np.clip(buckets, 0, n_quantiles - 1)).astype(np.int64)
+
+def _bucket_index(buckets:np.ndarray, n_quantiles:int)->np.ndarray:
+    """Flat bincount slot of every cell: ``row * (n + 1) + bucket``, the extra slot per row collects NaN cells."""
+    n_rows = int(np.prod(buckets.shape[:-1]))
+    slots = np.where(buckets >= 0, buckets, n_quantiles)
+    return (slots + (np.arange(n_rows) * (n_quantiles + 1)).reshape(*buckets.shape[:-1], 1)).ravel()
+
+def _bucket_means(index:np.ndarray, shape:tuple[int, ...], target:np.ndarray, n_quantiles:int)->np.ndarray:
+    """Mean of ``target`` per quantile and row -> ``(K, n_dates, n_quantiles)``, two bincounts in total."""
+    valid = ~np.isnan(target)
+    size = int(np.prod(shape[:-1])) * (n_quantiles + 1)
+    sums = np.bincount(index, weights=np.broadcast_to(np.where(valid, target, 0.0), shape).ravel(), minlength=size)
+    counts = np.bincount(index, weights=np.broadcast_to(valid, shape).ravel(), minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    return means.reshape(*shape[:-1], n_quantiles + 1)[..., :n_quantiles]
+
+def _turnover(member:np.ndarray)->np.ndarray:
+    """Mean share of names in a bucket today that were not in it the previous date."""
+    today, yesterday = member[..., 1:, :], member[..., :-1, :]
+    count = today.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        daily = 1.0 - (today & yesterday).sum(axis=-1) / count
+    daily = np.where((count > 0) & yesterday.any(axis=-1), daily, np.nan)
+    return np.array([_mean_std(row)[1] for row in daily.reshape(-1, daily.shape[-1])]).reshape(daily.shape[:-1])
+
+def evaluate_factors(data:pd.DataFrame,
+                    factors:list[str]|None=None,
+                    horizons:tuple[int, ...]=HORIZONS,
+                    decay_lags:tuple[int, ...]=DECAY_LAGS,
+                    n_quantiles:int=N_QUANTILES,
+                    price_column:str="adj_close",
+                    max_batch_cells:int=MAX_BATCH_CELLS)->FactorEvaluation:
+    """Screen ``factors`` (default: every factor column) against forward returns of ``price_column``.
+
+    Factors are pivoted onto the (date x ticker) panel and processed in
+    batches of ``(n_factors, n_dates, n_tickers)`` cubes. Each cube is
+    sorted once per date; forward returns are prepared once and paired with
+    every batch through batched matrix products, never a per-factor
+    per-date groupby. Forward returns are over ``h`` panel dates.
+    """
+    factors = factor_columns(data) if factors is None else list(factors)
+    panel = DatePanel.from_frame(data)
+    close = panel.pivot(data[price_column])
+    n_dates, n_tickers = panel.shape
+    one_day = forward_returns(close, 1)
+    horizon_targets = {h: one_day if h == 1 else forward_returns(close, h) for h in horizons}
+    # lag 天后的单日收益（IC 衰减）
+    lag_targets = {lag: np.concatenate([one_day[lag - 1:], np.full((lag - 1, n_tickers), np.nan)]) for lag in decay_lags}
+    prepared_horizons = {h: _Target.prepare(target) for h, target in horizon_targets.items()}
+    # lag=1 和 1 天远期收益是同一个矩阵
+    prepared_lags = {lag: prepared_horizons[1] if lag == 1 and 1 in prepared_horizons else _Target.prepare(target)
+                     for lag, target in lag_targets.items()}
+
+    n_factors = len(factors)
+    ic = np.full((n_factors, len(horizons), n_dates), np.nan)
+    rank_ic = np.full_like(ic, np.nan)
+    spread = np.full_like(ic, np.nan)
+    quantile_returns = np.full((n_factors, len(horizons), n_quantiles), np.nan)
+    decay = np.full((n_factors, len(decay_lags)), np.nan)
+    autocorrelation = np.full(n_factors, np.nan)
+    top_turnover = np.full(n_factors, np.nan)
+    bottom_turnover = np.full(n_factors, np.nan)
+
+    batch = max(1, max_batch_cells // max(n_dates * n_tickers, 1))
+    for lo in range(0, n_factors, batch):
+        names = factors[lo:lo + batch]
+        rows = slice(lo, lo + len(names))
+        cube = np.stack([panel.pivot(data[name]) for name in names])
+        cube[~np.isfinite(cube)] = np.nan
+        valid = ~np.isnan(cube)
+        count = valid.sum(axis=-1)
+        cube_sorted = ranking.sort_rows(cube)
+        ranks = ranking.subset_rank(*cube_sorted, valid)
+        moments = _factor_moments(_centered(cube, valid), valid)
+        rank_moments = _factor_moments(_centered(ranks, valid), valid)
+        buckets = quantile_buckets(ranks, n_quantiles)
+        index = _bucket_index(buckets, n_quantiles)
+        for j, horizon in enumerate(horizons):
+            target = prepared_horizons[horizon]
+            ic[rows, j] = masked_correlation(moments, target.moments)[0]
+            rank_ic[rows, j] = _rank_ic(rank_moments, cube_sorted, ranks, valid, count, target)
+            means = _bucket_means(index, cube.shape, horizon_targets[horizon], n_quantiles)
+            spread[rows, j] = means[..., -1] - means[..., 0]
+            quantile_returns[rows, j] = [[_mean_std(means[k, :, q])[1] for q in range(n_quantiles)]
+                                         for k in range(len(names))]
+        for j, lag in enumerate(decay_lags):
+            lag_ic = _rank_ic(rank_moments, cube_sorted, ranks, valid, count, prepared_lags[lag])
+            decay[rows, j] = [_mean_std(row)[1] for row in lag_ic]
+        # 相邻两天的横截面名次相关性（各自当天排名，取两天都有值的股票）
+        autocorrelation[rows] = [_mean_std(row)[1] for row in row_correlation(ranks[:, 1:], ranks[:, :-1])]
+        top_turnover[rows] = _turnover(buckets == n_quantiles - 1)
+        bottom_turnover[rows] = _turnover(buckets == 0)
+        logger.debug(f"Evaluated factors {names}")
+
+    return FactorEvaluation(factors=factors, horizons=tuple(horizons), decay_lags=tuple(decay_lags),
+                            dates=panel.dates, ic=ic, rank_ic=rank_ic, spread=spread,
+                            quantile_returns=quantile_returns, decay=decay, autocorrelation=autocorrelation,
+                            top_turnover=top_turnover, bottom_turnover=bottom_turnover)
+
+def save_evaluation(evaluation:FactorEvaluation, output_dir:Path=FACTOR_EVAL_DIR)->None:
+    """Write ``summary.csv``, ``decay.csv``, ``quantiles.csv`` and the daily rank IC (``daily_rank_ic.csv``)."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    evaluation.summary().to_csv(output_dir / "summary.csv", index=False)
+    evaluation.decay_table().to_csv(output_dir / "decay.csv", index=False)
+    evaluation.quantile_table().to_csv(output_dir / "quantiles.csv", index=False)
+    daily = pd.DataFrame(
+        evaluation.rank_ic.reshape(-1, len(evaluation.dates)).T,
+        index=evaluation.dates,
+        columns=[f"{factor}@{h}" for factor in evaluation.factors for h in evaluation.horizons],
+    )
+    daily.rename_axis("date").to_csv(output_dir / "daily_rank_ic.csv")
+
+def main()->None:
+    import backtest  # 读因子库的逻辑在回测模块里
+
+    parser = argparse.ArgumentParser(description="Screen every factor column: IC, rank IC, decay, turnover, quintile spreads.")
+    parser.add_argument("--factors", nargs="*", default=None, help="factor columns (default: all)")
+    parser.add_argument("--horizons", type=int, nargs="+", default=list(HORIZONS), help="forward return horizons in days")
+    parser.add_argument("--quantiles", type=int, default=N_QUANTILES)
+    parser.add_argument("--output-dir", type=Path, default=FACTOR_EVAL_DIR)
+    args = parser.parse_args()
+
+    columns = None if args.factors is None else ["adj_close", *args.factors]
+    data = backtest.load_factor_data(columns)
+    evaluation = evaluate_factors(data, args.factors, tuple(args.horizons), n_quantiles=args.quantiles)
+    save_evaluation(evaluation, args.output_dir)
+    summary = evaluation.summary()
+    logger.info(f"Evaluated {len(evaluation.factors)} factors x {len(evaluation.horizons)} horizons, "
+                f"saved to {args.output_dir}\n{summary.head(15).to_string(index=False)}")
+
+if __name__ == "__main__":
+    main()
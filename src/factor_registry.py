@@ -0,0 +1,142 @@
+"""Declarative factor registry with a dependency DAG and demand-driven computation."""
+from __future__ import annotations
+import logging
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+import factor_engine
+from consts import FACTOR_WINDOWS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 原始行情列，直接从数据里铺成面板，是 DAG 的源头
+SOURCE_COLUMNS: tuple[str, ...] = ("adj_close", "volume")
+
+
+@dataclass(frozen=True)
+class FactorSpec:
+    """One node of the factor DAG.
+
+    ``compute`` receives the panels of ``inputs`` positionally and returns a
+    panel (or, for intermediates, any shared object such as rolling sums).
+    Names starting with ``_`` are intermediates and never written out.
+    """
+    name: str
+    inputs: tuple[str, ...]
+    compute: Callable
+
+
+REGISTRY: dict[str, FactorSpec] = {}
+
+def register(name:str, inputs:list[str]|tuple[str, ...], compute:Callable)->FactorSpec:
+    """Add a factor (or intermediate) to the registry."""
+    if name in REGISTRY:
+        raise ValueError(f"Factor {name!r} is already registered")
+    spec = FactorSpec(name=name, inputs=tuple(inputs), compute=compute)
+    REGISTRY[name] = spec
+    return spec
+
+def _divide(numerator:np.ndarray, denominator:np.ndarray)->np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return numerator / denominator
+
+def _register_basic_factors(windows:list[int])->None:
+    """Register the factor families of ``basic_factors`` and their shared intermediates."""
+    # 共享中间量：前向填充价格、gain/loss、各输入的累加和、所有窗口的 EMA（一次递推）
+    register("_close_filled", ["adj_close"], factor_engine.ffill)
+    register("_gain_loss", ["adj_close"], factor_engine.gain_loss)
+    register("_close_sums", ["adj_close"], factor_engine.rolling_sums)
+    register("_close_emas", ["adj_close"], lambda close: factor_engine.ewm_mean(close, windows))
+    register("_volume_sums", ["volume"], factor_engine.rolling_sums)
+    register("_gain_sums", ["_gain_loss"], lambda gl: factor_engine.rolling_sums(gl[0]))
+    register("_loss_sums", ["_gain_loss"], lambda gl: factor_engine.rolling_sums(gl[1]))
+    register("_return_1day_sums", ["return_1day"], lambda r: factor_engine.rolling_sums(r, with_squares=True))
+
+    # pct_change 内部的 ffill 是幂等的，传入已填充的价格即可复用
+    register("return_1day", ["_close_filled"], lambda close: factor_engine.pct_change(close, 1))
+    for w in windows:
+        register(f"return_{w}day", ["_close_filled"], lambda close, w=w: factor_engine.pct_change(close, w))
+    for w in windows:
+        register(f"ma_{w}", ["_close_sums"], lambda sums, w=w: factor_engine.mean_from_sums(sums, w))
+        register(f"ema_{w}", ["_close_emas"], lambda emas, i=windows.index(w): emas[i])
+    for w in windows:
+        register(f"volatility_{w}day", ["_return_1day_sums"], lambda sums, w=w: factor_engine.std_from_sums(sums, w))
+    for w in windows:
+        register(f"volume_ma_{w}", ["_volume_sums"], lambda sums, w=w: factor_engine.mean_from_sums(sums, w))
+        register(f"volume_to_ma_{w}", ["volume", f"volume_ma_{w}"], _divide)
+    for w in windows:
+        register(f"_avg_gain_{w}", ["_gain_sums"], lambda sums, w=w: factor_engine.mean_from_sums(sums, w))
+        register(f"_avg_loss_{w}", ["_loss_sums"], lambda sums, w=w: factor_engine.mean_from_sums(sums, w))
+        register(f"rsi_{w}", [f"_avg_gain_{w}", f"_avg_loss_{w}"], factor_engine.rsi_from_averages)
+
+_register_basic_factors(FACTOR_WINDOWS)
+
+
+def resolve(columns:list[str], available:set[str]|frozenset[str]=frozenset())->list[str]:
+    """Return the registered nodes needed for ``columns``, in dependency order.
+
+    Source columns and anything in ``available`` (columns the data already
+    has) are leaves of the graph and are not recomputed.
+    """
+    order: list[str] = []
+    visiting: set[str] = set()
+
+    def visit(name:str)->None:
+        if name in SOURCE_COLUMNS or name in available or name in order:
+            return
+        if name not in REGISTRY:
+            raise KeyError(f"Unknown factor {name!r}")
+        if name in visiting:
+            raise ValueError(f"Cycle in factor graph at {name!r}")
+        visiting.add(name)
+        for dep in REGISTRY[name].inputs:
+            visit(dep)
+        visiting.discard(name)
+        order.append(name)
+
+    for column in columns:
+        visit(column)
+    return order
+
+def compute_factors(data:pd.DataFrame, columns:list[str])->pd.DataFrame:
+    """Compute only ``columns`` (and what they depend on) and add them to ``data``.
+
+    Each node is computed once; intermediates are released as soon as their
+    last consumer has run, so peak memory follows the live part of the graph.
+    Columns already present in ``data`` are reused rather than recomputed.
+    """
+    factor_names = [c for c in dict.fromkeys(columns) if c not in data.columns]
+    order = resolve(factor_names, available=set(data.columns))
+    remaining_uses: dict[str, int] = {}
+    for name in order:
+        for dep in REGISTRY[name].inputs:
+            remaining_uses[dep] = remaining_uses.get(dep, 0) + 1
+
+    panel = factor_engine.Panel.from_frame(data)
+    values: dict[str, object] = {}
+    outputs: dict[str, np.ndarray] = {}
+    for name in order:
+        spec = REGISTRY[name]
+        args = []
+        for dep in spec.inputs:
+            if dep not in values:
+                values[dep] = panel.pivot(data[dep])
+            args.append(values[dep])
+        values[name] = spec.compute(*args)
+        if name in factor_names:
+            outputs[name] = panel.unpivot(values[name])
+        # 用完的中间量立即释放
+        for dep in spec.inputs:
+            remaining_uses[dep] -= 1
+            if remaining_uses[dep] == 0:
+                del values[dep]
+        if remaining_uses.get(name, 0) == 0:
+            values.pop(name, None)
+
+    logger.info(f"Computed {len(outputs)} requested factors ({len(order)} graph nodes) "
+                f"for {len(panel.tickers)} tickers x {panel.n_rows} rows")
+    return data.assign(**{name: outputs[name] for name in factor_names})
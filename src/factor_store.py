@@ -0,0 +1,189 @@
+"""Columnar factor store backed by a partitioned Parquet dataset."""
+from __future__ import annotations
+import json
+import logging
+import shutil
+import uuid
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PARTITION_SCHEMES = ("ticker", "year")
+# 存放分区方式的元数据文件；"_" 开头的文件 pyarrow 扫描数据集时会跳过
+SCHEME_FILE = "_partitioning.json"
+# 每个 row group 的行数，越小日期过滤越精细，但元数据越多
+ROW_GROUP_SIZE = 64_000
+
+
+class FactorStore:
+    """Partitioned Parquet store for the long-format (date, ticker) factor table.
+
+    Data is partitioned on disk either by ``ticker`` (hive layout ``ticker=AAPL/``)
+    or by ``year`` (``year=2020/``) and sorted by date inside each file, so
+    readers only touch the partitions and row groups that match their filters
+    and only decode the columns they ask for.
+
+    The scheme is recorded in the store; ``partition_by=None`` uses the
+    recorded one (``ticker`` for a new store). ``write`` replaces the whole
+    store and may switch to another scheme; appending with a different
+    scheme than the recorded one is rejected.
+    """
+
+    def __init__(self, root:Path, partition_by:str|None=None):
+        if partition_by is not None and partition_by not in PARTITION_SCHEMES:
+            raise ValueError(f"partition_by must be one of {PARTITION_SCHEMES}, got {partition_by!r}")
+        self.root = Path(root)
+        self.partition_by = partition_by or self.recorded_scheme() or "ticker"
+
+    def recorded_scheme(self)->str|None:
+        """Partition scheme the store was written with, ``None`` for an empty store."""
+        path = self.root / SCHEME_FILE
+        if path.exists():
+            return json.loads(path.read_text())["partition_by"]
+        if not self.root.exists():
+            return None
+        # 没有记录的旧库：看顶层目录名是 ticker=... 还是 year=...
+        return next((d.name.split("=")[0] for d in self.root.iterdir() if d.is_dir() and "=" in d.name), None)
+
+    def exists(self)->bool:
+        """Whether the store contains any data files."""
+        return self.root.exists() and any(self.root.rglob("*.parquet"))
+
+    def clear(self)->None:
+        """Delete everything in the store."""
+        if self.root.exists():
+            shutil.rmtree(self.root)
+
+    def count_rows(self)->int:
+        return self._dataset().count_rows()
+
+    def dates(self)->pd.DatetimeIndex:
+        """Sorted distinct dates, scanned batch by batch from the ``date`` column only."""
+        dates: set = set()
+        for batch in self._dataset().to_batches(columns=["date"]):
+            dates.update(batch.column(0).unique().to_pylist())
+        return pd.DatetimeIndex(sorted(dates))
+
+    def write(self, data:pd.DataFrame)->None:
+        """Replace the store content with ``data``.
+
+        The new content is written to a sibling directory and swapped in
+        afterwards, so partitions missing from ``data`` (e.g. tickers that
+        left the universe) are gone and a failed write keeps the old store.
+        The new content records this store's ``partition_by``, which may
+        differ from the scheme it replaces.
+        """
+        staging = FactorStore(self.root.with_name(f".{self.root.name}.tmp-{uuid.uuid4().hex}"), self.partition_by)
+        old = self.root.with_name(f".{self.root.name}.old-{uuid.uuid4().hex}")
+        try:
+            staging._write(data, existing_data_behavior="error")
+            if self.root.exists():
+                self.root.rename(old)
+            staging.root.rename(self.root)
+        finally:
+            shutil.rmtree(staging.root, ignore_errors=True)
+            shutil.rmtree(old, ignore_errors=True)
+        logger.info(f"Wrote {len(data)} rows x {data.shape[1]} columns to factor store {self.root}")
+
+    def append(self, data:pd.DataFrame)->None:
+        """Append rows to the store without rewriting existing partitions."""
+        self._check_scheme()
+        self._write(data, existing_data_behavior="overwrite_or_ignore")
+        logger.info(f"Appended {len(data)} rows to factor store {self.root}")
+
+    def _check_scheme(self)->None:
+        recorded = self.recorded_scheme()
+        if recorded is not None and recorded != self.partition_by:
+            raise ValueError(f"Factor store {self.root} is partitioned by {recorded!r}, cannot append to it partitioned "
+                             f"by {self.partition_by!r}; write() the whole store to change the scheme")
+
+    def _write(self, data:pd.DataFrame, existing_data_behavior:str)->None:
+        data = data.sort_values(["ticker", "date"])
+        if self.partition_by == "year":
+            data = data.assign(year=data["date"].dt.year)
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        self.root.mkdir(parents=True, exist_ok=True)
+        pq.write_to_dataset(
+            table,
+            root_path=self.root,
+            partition_cols=[self.partition_by],
+            # 文件名带唯一前缀，append 时不会覆盖已有文件
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior=existing_data_behavior,
+            row_group_size=ROW_GROUP_SIZE,
+        )
+        (self.root / SCHEME_FILE).write_text(json.dumps({"partition_by": self.partition_by}))
+
+    def columns(self)->list[str]:
+        """List the columns available in the store."""
+        names = self._dataset().schema.names
+        return [name for name in names if name != "year"]
+
+    def read(self,
+            columns:list[str]|None=None,
+            start_date:str|date|None=None,
+            end_date:str|date|None=None,
+            tickers:list[str]|None=None,
+            memory_map:bool=False)->pd.DataFrame:
+        """Load a projection of the store.
+
+        Only ``columns`` (plus ``date`` and ``ticker``) are decoded; date and
+        ticker filters are pushed down to partition pruning and row-group
+        statistics. Dates are inclusive on both ends.
+        """
+        if columns is not None:
+            columns = list(dict.fromkeys(["date", "ticker", *columns]))
+        filters = []
+        if start_date is not None:
+            filters.append(ds.field("date") >= pd.Timestamp(start_date))
+        if end_date is not None:
+            filters.append(ds.field("date") <= pd.Timestamp(end_date))
+        if tickers is not None:
+            filters.append(ds.field("ticker").isin(list(tickers)))
+        if self.partition_by == "year":
+            if start_date is not None:
+                filters.append(ds.field("year") >= pd.Timestamp(start_date).year)
+            if end_date is not None:
+                filters.append(ds.field("year") <= pd.Timestamp(end_date).year)
+        expression = None
+        for f in filters:
+            expression = f if expression is None else expression & f
+
+        table = pq.read_table(
+            self.root,
+            columns=columns,
+            filters=expression,
+            memory_map=memory_map,
+            partitioning=self._partitioning(),
+        )
+        data = table.to_pandas()
+        if "year" in data.columns and (columns is None or "year" not in columns):
+            data = data.drop(columns="year")
+        if columns is None:
+            # 分区列会被挪到最后，按写入时的列顺序还原
+            columns = [c for c in self._written_columns() if c in data.columns]
+        # 分区列读回来是 category，统一成字符串，和 CSV 读出来的一致
+        data["ticker"] = data["ticker"].astype(str)
+        data = data.sort_values(["ticker", "date"]).reset_index(drop=True)
+        if columns is not None:
+            data = data[columns]
+        return data
+
+    def _written_columns(self)->list[str]:
+        metadata = self._dataset().schema.pandas_metadata or {}
+        return [c["name"] for c in metadata.get("columns", []) if c["name"] is not None]
+
+    def _partitioning(self)->ds.Partitioning:
+        # 显式给出分区列类型，避免 "123" 这类 ticker 被推断成整数
+        field_type = pa.string() if self.partition_by == "ticker" else pa.int32()
+        return ds.partitioning(pa.schema([(self.partition_by, field_type)]), flavor="hive")
+
+    def _dataset(self)->ds.Dataset:
+        return ds.dataset(self.root, format="parquet", partitioning=self._partitioning())
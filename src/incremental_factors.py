@@ -0,0 +1,163 @@
+"""Incremental (append-only) factor updates with persisted per-ticker rolling state."""
+from __future__ import annotations
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import factor_engine
+from basic_factors import calculate_all_factors
+from consts import FACTOR_WINDOWS, FACTOR_STORE_DIR, FACTOR_STATE_DIR, PROCESSED_DATA_DIR
+from factor_store import FactorStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 最长窗口 250：return_250day 需要往前 250 行价格，其余滚动因子需要 249 行
+TAIL_ROWS: int = max(FACTOR_WINDOWS)
+TAIL_COLUMNS: list[str] = ["ticker", "date", "adj_close", "adj_close_filled", "volume"]
+
+
+@dataclass
+class FactorState:
+    """Per-ticker state needed to extend the factor table without the full history.
+
+    ``tail`` holds the last ``TAIL_ROWS`` raw bars of every ticker (plus the
+    forward-filled close used by returns); ``ewm`` holds the EMA recursion
+    state ``(weighted, old_wt)`` for every ticker and span.
+    """
+    tail: pd.DataFrame
+    ewm: pd.DataFrame
+
+    def save(self, state_dir:Path)->None:
+        state_dir.mkdir(parents=True, exist_ok=True)
+        self.tail.to_parquet(state_dir / "tail.parquet", index=False)
+        self.ewm.to_parquet(state_dir / "ewm.parquet", index=False)
+
+    @classmethod
+    def load(cls, state_dir:Path)->FactorState:
+        return cls(tail=pd.read_parquet(state_dir / "tail.parquet"),
+                   ewm=pd.read_parquet(state_dir / "ewm.parquet"))
+
+    @staticmethod
+    def exists(state_dir:Path)->bool:
+        return (state_dir / "tail.parquet").exists() and (state_dir / "ewm.parquet").exists()
+
+    def last_dates(self)->pd.Series:
+        """Last processed date per ticker."""
+        return self.tail.groupby("ticker")["date"].max()
+
+
+def _ewm_state_arrays(ewm:pd.DataFrame, tickers:np.ndarray, windows:list[int])->factor_engine.EwmState:
+    weighted = np.full((len(windows), len(tickers)), np.nan)
+    old_wt = np.ones((len(windows), len(tickers)))
+    if ewm.empty:
+        return weighted, old_wt
+    col = pd.Index(tickers).get_indexer(ewm["ticker"])
+    row = pd.Index(windows).get_indexer(ewm["span"])
+    keep = (col >= 0) & (row >= 0)
+    weighted[row[keep], col[keep]] = ewm["weighted"].to_numpy()[keep]
+    old_wt[row[keep], col[keep]] = ewm["old_wt"].to_numpy()[keep]
+    return weighted, old_wt
+
+def _ewm_state_frame(state:factor_engine.EwmState, tickers:np.ndarray, windows:list[int])->pd.DataFrame:
+    weighted, old_wt = state
+    return pd.DataFrame({
+        "ticker": np.tile(tickers, len(windows)),
+        "span": np.repeat(windows, len(tickers)),
+        "weighted": weighted.ravel(),
+        "old_wt": old_wt.ravel(),
+    })
+
+def _tail(data:pd.DataFrame)->pd.DataFrame:
+    return data.groupby("ticker", sort=False).tail(TAIL_ROWS)[TAIL_COLUMNS].reset_index(drop=True)
+
+def build_state(data:pd.DataFrame, windows:list[int]=FACTOR_WINDOWS)->FactorState:
+    """Build the rolling state from a full raw history (sorted by ticker, date)."""
+    panel = factor_engine.Panel.from_frame(data)
+    close = panel.pivot(data["adj_close"])
+    _, ewm_state = factor_engine.ewm_mean_with_state(close, windows, lengths=panel.lengths)
+    data = data.assign(adj_close_filled=panel.unpivot(factor_engine.ffill(close)))
+    return FactorState(tail=_tail(data), ewm=_ewm_state_frame(ewm_state, panel.tickers, windows))
+
+def update_factors(new_data:pd.DataFrame,
+                state:FactorState,
+                windows:list[int]=FACTOR_WINDOWS)->tuple[pd.DataFrame, FactorState]:
+    """Compute factor rows for ``new_data`` only, continuing from ``state``.
+
+    Rows at or before the last processed date of their ticker are ignored.
+    Returns the new factor rows (same columns as a full recompute) and the
+    updated state.
+    """
+    last_dates = new_data["ticker"].map(state.last_dates())
+    new_data = new_data[last_dates.isna() | (new_data["date"] > last_dates)]
+    new_data = new_data.sort_values(["ticker", "date"]).reset_index(drop=True)
+    if new_data.empty:
+        return new_data, state
+
+    # 历史尾部 + 新数据拼在一起算滚动因子，再只取新行
+    tail = state.tail[state.tail["ticker"].isin(new_data["ticker"].unique())]
+    combined = pd.concat([tail.assign(_is_new=False), new_data.assign(_is_new=True)], ignore_index=True)
+    combined = combined.sort_values(["ticker", "date"], kind="stable").reset_index(drop=True)
+    is_new = combined["_is_new"].to_numpy(dtype=bool)
+
+    panel = factor_engine.Panel.from_frame(combined)
+    close = panel.pivot(combined["adj_close"])
+    volume = panel.pivot(combined["volume"])
+    # 尾部行用已经前向填充过的收盘价，新行用原始价格，returns 和全量计算一致
+    returns_close = panel.pivot(combined["adj_close_filled"].where(~is_new, combined["adj_close"]))
+    columns = {
+        name: panel.unpivot(values)[is_new]
+        for name, values in factor_engine.iter_factor_panels(close, volume, windows, returns_close=returns_close, with_ema=False)
+    }
+
+    # EMA 只在新行上递推，从保存的状态接着算
+    new_panel = factor_engine.Panel.from_frame(new_data)
+    ewm_init = _ewm_state_arrays(state.ewm, new_panel.tickers, windows)
+    emas, ewm_final = factor_engine.ewm_mean_with_state(
+        new_panel.pivot(new_data["adj_close"]), windows, state=ewm_init, lengths=new_panel.lengths)
+    for window, ema in zip(windows, emas):
+        columns[f"ema_{window}"] = new_panel.unpivot(ema)
+
+    columns = {name: columns[name] for name in factor_engine.factor_columns(windows)}
+    new_factors = new_data.assign(**columns)
+
+    combined["adj_close_filled"] = panel.unpivot(factor_engine.ffill(returns_close))
+    updated_tickers = set(new_panel.tickers)
+    tail = pd.concat([state.tail[~state.tail["ticker"].isin(updated_tickers)], _tail(combined)], ignore_index=True)
+    ewm = pd.concat([state.ewm[~state.ewm["ticker"].isin(updated_tickers)],
+                     _ewm_state_frame(ewm_final, new_panel.tickers, windows)], ignore_index=True)
+    logger.info(f"Computed {len(new_factors)} new factor rows for {len(updated_tickers)} tickers")
+    return new_factors, FactorState(tail=tail, ewm=ewm)
+
+def run_incremental(input_file:Path,
+                    store_dir:Path=FACTOR_STORE_DIR,
+                    state_dir:Path=FACTOR_STATE_DIR,
+                    new_data:pd.DataFrame|None=None)->pd.DataFrame:
+    """Append factor rows for bars not yet in the factor store.
+
+    Without saved state this falls back to a full ``calculate_all_factors``
+    run and saves the state for the next call. ``new_data`` can be passed
+    directly (e.g. the rows just fetched by ``download_data``); otherwise the
+    new rows are picked out of ``input_file``.
+    """
+    if not FactorState.exists(state_dir):
+        logger.info(f"No factor state in {state_dir}, running a full factor computation")
+        data = calculate_all_factors(input_file, store_dir=store_dir)
+        build_state(data).save(state_dir)
+        return data
+    if new_data is None:
+        new_data = pd.read_csv(input_file, parse_dates=['date'])
+    new_factors, state = update_factors(new_data, FactorState.load(state_dir))
+    if not new_factors.empty:
+        FactorStore(store_dir).append(new_factors)
+        state.save(state_dir)
+    return new_factors
+
+def main()->None:
+    run_incremental(PROCESSED_DATA_DIR / "combined_stocks_data.csv")
+
+if __name__ == "__main__":
+    main()
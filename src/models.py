@@ -1,12 +1,13 @@
 """Models for trading strategy configurations and backtest results."""
 from __future__ import annotations  
+from typing import Any
 from pydantic import BaseModel, Field
 
 
 class StrategyConfig(BaseModel):
     """Configuration model for a trading strategy."""
     strategy_name: str = Field(..., description="Name of the trading strategy")
-    parameters: dict[str, float] = Field(..., description="Parameters for the trading strategy")
+    parameters: dict[str, Any] = Field(..., description="Parameters for the trading strategy")
 
 class BacktestMetrics(BaseModel):
     """Model to store backtest results."""
@@ -18,7 +19,49 @@ class BacktestMetrics(BaseModel):
     win_rate: float = Field(..., description="Win rate of the strategy")
     n_days: int = Field(..., description="Number of trading days in the backtest")
 
+class YearMetrics(BacktestMetrics):
+    """``BacktestMetrics`` of the trading days within one calendar year."""
+    year: int = Field(..., description="Calendar year")
+
+class ConfidenceInterval(BaseModel):
+    """Point estimate with a bootstrap percentile interval."""
+    estimate: float = Field(..., description="Value on the original daily returns")
+    lower: float = Field(..., description="Lower bound of the interval")
+    upper: float = Field(..., description="Upper bound of the interval")
+    confidence: float = Field(..., description="Confidence level, e.g. 0.95")
+
+class RobustnessMetrics(BaseModel):
+    """Rolling, per-year and bootstrap statistics of a strategy's daily returns."""
+    rolling_window: int = Field(..., description="Window of the rolling statistics in trading days")
+    rolling_sharpe_min: float = Field(..., description="Lowest rolling Sharpe ratio")
+    rolling_sharpe_median: float = Field(..., description="Median rolling Sharpe ratio")
+    rolling_sharpe_max: float = Field(..., description="Highest rolling Sharpe ratio")
+    rolling_volatility_max: float = Field(..., description="Highest rolling annualized volatility")
+    max_drawdown_days: int = Field(..., description="Longest time under water in trading days")
+    sharpe_ratio_ci: ConfidenceInterval = Field(..., description="Block-bootstrap interval of the Sharpe ratio")
+    annualized_return_ci: ConfidenceInterval = Field(..., description="Block-bootstrap interval of the annualized return")
+    n_resamples: int = Field(..., description="Number of bootstrap resamples")
+    block_length: int = Field(..., description="Bootstrap block length in trading days")
+    yearly: list[YearMetrics] = Field(default_factory=list, description="Metrics per calendar year")
+
+class StageTelemetry(BaseModel):
+    """Resource usage of one pipeline stage."""
+    name: str = Field(..., description="Stage name, e.g. 'load', 'factors.returns', 'signals'")
+    wall_seconds: float = Field(..., description="Elapsed wall-clock time")
+    cpu_seconds: float = Field(..., description="CPU time of this process")
+    peak_memory_mb: float|None = Field(None, description="Peak memory above the stage's start: sampled RSS, "
+                                                          "or traced allocations when tracing")
+    rows: int|None = Field(None, description="Rows of the stage's output frame")
+    columns: int|None = Field(None, description="Columns of the stage's output frame")
+
+class RunTelemetry(BaseModel):
+    """Per-stage telemetry of a strategy run."""
+    stages: list[StageTelemetry] = Field(default_factory=list, description="Stages in the order they finished")
+    profile_file: str|None = Field(None, description="cProfile dump of the run, if profiling was enabled")
+
 class StrategyRunResult(BaseModel):
     """Model to encapsulate the results of a strategy run."""
     strategy_config: StrategyConfig = Field(..., description="Configuration of the trading strategy")
     backtest_result: BacktestMetrics = Field(..., description="Results of the backtest")
+    telemetry: RunTelemetry|None = Field(None, description="Per-stage timings and memory, if recorded")
+    robustness: RobustnessMetrics|None = Field(None, description="Rolling / per-year / bootstrap statistics, if computed")
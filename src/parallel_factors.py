@@ -0,0 +1,147 @@
+"""Factor computation sharded by ticker across a process pool, inputs and outputs in shared memory."""
+from __future__ import annotations
+import dataclasses
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, util
+
+import numpy as np
+import pandas as pd
+
+import factor_engine
+import models
+from consts import FACTOR_WINDOWS
+from shared_frame import SharedFrame, SharedFrameSpec
+from telemetry import Telemetry, track
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# worker 进程里 attach 一次输入 / 输出共享内存
+_WORKER_INPUT: SharedFrame|None = None
+_WORKER_OUTPUT: shared_memory.SharedMemory|None = None
+
+
+def shard_tickers(lengths:np.ndarray, n_shards:int, min_tickers:int=2)->list[tuple[int, int]]:
+    """Split ticker codes ``0..len(lengths)`` into contiguous ``[start, stop)`` ranges of about equal row counts.
+
+    Every shard gets at least ``min_tickers`` tickers: NumPy sums a
+    one-column panel pairwise but a wider one row by row, so a single-ticker
+    shard could differ from the full table in the last bits. ``n_shards`` is
+    capped at ``len(lengths) // min_tickers`` and a shard that still comes out
+    short (a few very long tickers) is merged into one neighbour.
+    """
+    if len(lengths) == 0:
+        return []
+    n_shards = max(1, min(n_shards, len(lengths) // min_tickers))
+    cumulative = np.cumsum(lengths)
+    targets = cumulative[-1] * np.arange(1, n_shards) / n_shards
+    # 每个边界取累计行数第一次达到目标的 ticker 之后
+    bounds = np.unique([0, *(np.searchsorted(cumulative, targets) + 1), len(lengths)])
+    bounds = bounds[bounds <= len(lengths)]
+    shards: list[tuple[int, int]] = []
+    for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        # 只看当前分片：短的并进前一个，前一个只会变长，不会连锁合并
+        if shards and stop - start < min_tickers:
+            shards[-1] = (shards[-1][0], stop)
+        else:
+            shards.append((start, stop))
+    if len(shards) > 1 and shards[0][1] - shards[0][0] < min_tickers:
+        shards[:2] = [(shards[0][0], shards[1][1])]
+    return shards
+
+def _init_worker(spec:SharedFrameSpec, output_name:str)->None:
+    global _WORKER_INPUT, _WORKER_OUTPUT
+    _WORKER_INPUT = SharedFrame.attach(spec)
+    _WORKER_OUTPUT = shared_memory.SharedMemory(name=output_name)
+    # worker 退出时走 multiprocessing 的 finalizer（atexit 不会执行），关掉 attach 的共享内存
+    util.Finalize(None, _close_worker, exitpriority=10)
+
+def _close_worker()->None:
+    global _WORKER_INPUT, _WORKER_OUTPUT
+    for handle in (_WORKER_INPUT, _WORKER_OUTPUT):
+        if handle is not None:
+            handle.close()
+    _WORKER_INPUT = _WORKER_OUTPUT = None
+
+def _compute_shard(shard:tuple[int, int, int],
+                windows:list[int],
+                dtype:str,
+                n_rows:int)->models.StageTelemetry:
+    index, start, stop = shard
+    wall, cpu = time.perf_counter(), time.process_time()
+    names = factor_engine.factor_columns(windows)
+    out = np.ndarray((len(names), _WORKER_INPUT.spec.n_rows), dtype=np.dtype(dtype), buffer=_WORKER_OUTPUT.buf)
+    codes = _WORKER_INPUT.array("ticker")
+    # 本分片的行保持原来的先后顺序，和整表计算时每个 ticker 看到的序列一样
+    rows = np.flatnonzero((codes >= start) & (codes < stop))
+    panel = factor_engine.Panel.from_frame(pd.DataFrame({"ticker": codes[rows]}))
+    # 面板补齐到整表最长 ticker 的行数：pct_change 会把价格前向填充到补齐的行里，
+    # 行数不同会让 rolling_sums 的中心化常数变化，结果就不再逐位一致
+    panel = dataclasses.replace(panel, n_rows=n_rows)
+    close = panel.pivot(_WORKER_INPUT.array("adj_close")[rows])
+    volume = panel.pivot(_WORKER_INPUT.array("volume")[rows])
+    position = {name: i for i, name in enumerate(names)}
+    for name, values in factor_engine.iter_factor_panels(close, volume, windows):
+        out[position[name], rows] = panel.unpivot(values)
+    return models.StageTelemetry(name=f"factors.shard_{index}", wall_seconds=time.perf_counter() - wall,
+                                 cpu_seconds=time.process_time() - cpu, rows=len(rows), columns=len(names))
+
+def compute_all_factors(data:pd.DataFrame,
+                        windows:list[int]=FACTOR_WINDOWS,
+                        telemetry:Telemetry|None=None,
+                        dtype=np.float64,
+                        n_workers:int|None=None,
+                        n_shards:int|None=None)->pd.DataFrame:
+    """``factor_engine.compute_all_factors`` with the tickers split over ``n_workers`` processes.
+
+    Every factor only looks at its own ticker's history, so each shard runs
+    the panel engine on a contiguous range of tickers (``n_shards``, default
+    one per worker, balanced by row count) and writes its columns straight
+    into a shared output block at the shard's row positions. The result is
+    identical to the single-process engine and does not depend on which
+    shard finishes first. The shared output block holds one extra copy of
+    the factor columns until they are moved into the returned frame.
+    Per-shard timings are logged and, with ``telemetry``, recorded as
+    ``factors.shard_<i>`` stages.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    names = factor_engine.factor_columns(windows)
+    with SharedFrame.create(data, ["adj_close", "volume"]) as frame:
+        lengths = np.bincount(frame.array("ticker"), minlength=len(frame.spec.tickers))
+        shards = shard_tickers(lengths, n_shards or n_workers)
+        if n_workers <= 1 or len(shards) <= 1:
+            return factor_engine.compute_all_factors(data, windows, telemetry=telemetry, dtype=dtype)
+        dtype = np.dtype(dtype)
+        output = shared_memory.SharedMemory(create=True, size=max(len(names) * len(data) * dtype.itemsize, 1))
+        try:
+            with track(telemetry, "factors") as stage:
+                with ProcessPoolExecutor(max_workers=min(n_workers, len(shards)),
+                                        initializer=_init_worker,
+                                        initargs=(frame.spec, output.name)) as pool:
+                    tasks = [(i, start, stop) for i, (start, stop) in enumerate(shards)]
+                    # map 按分片顺序返回耗时；结果按行号写回，和完成顺序无关
+                    timings = list(pool.map(functools.partial(_compute_shard, windows=windows, dtype=dtype.str,
+                                                                    n_rows=int(lengths.max())), tasks))
+                out = np.ndarray((len(names), len(data)), dtype=dtype, buffer=output.buf)
+                data = data.assign(**{name: out[i].copy() for i, name in enumerate(names)})
+                stage.rows, stage.columns = len(data), len(names)
+        finally:
+            output.close()
+            output.unlink()
+    if telemetry is not None:
+        telemetry.stages.extend(timings)
+    tickers = frame.spec.tickers
+    report = pd.DataFrame({
+        "shard": [t.name for t in timings],
+        "tickers": [f"{tickers[start]}..{tickers[stop - 1]}" for start, stop in shards],
+        "rows": [t.rows for t in timings],
+        "wall_seconds": [t.wall_seconds for t in timings],
+        "cpu_seconds": [t.cpu_seconds for t in timings],
+    })
+    logger.info(f"Computed {len(names)} factor columns for {len(tickers)} tickers in {len(shards)} shards "
+                f"on {min(n_workers, len(shards))} workers:\n{report.to_string(index=False)}")
+    return data
@@ -0,0 +1,259 @@
+"""Portfolio accounting on the (date x ticker) panel: target weights, rebalancing, turnover costs and cash."""
+from __future__ import annotations
+import argparse
+import json
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import models
+import strategies
+from batch_backtest import TRADING_DAYS, metrics_from_daily_returns
+from consts import INITIAL_CAPITAL, TRANSACTION_COST_BPS
+from date_panel import DatePanel
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+WEIGHTINGS: tuple[str, ...] = ("equal", "score", "volatility")
+# 调仓周期 -> pandas period 频率；也可以传整数 n 表示每 n 个交易日调一次
+SCHEDULES: dict[str, str|None] = {"daily": None, "weekly": "W", "monthly": "M", "quarterly": "Q"}
+DEFAULT_VOLATILITY_COLUMN: str = "volatility_20day"
+# 一次展开的 (日期 x ticker) 格子数上限，控制中间数组的内存
+MAX_CHUNK_CELLS: int = 2**23
+
+
+@dataclass
+class PortfolioResult:
+    """One simulated portfolio; per-date arrays have shape ``(n_dates,)``.
+
+    Dates before the first rebalance are all cash and have NaN
+    ``daily_returns``; ``target_weights`` has one row per rebalance date.
+    """
+    dates: pd.DatetimeIndex
+    rebalance_dates: pd.DatetimeIndex
+    target_weights: np.ndarray      # (n_rebalances, n_tickers)
+    equity_curve: np.ndarray
+    daily_returns: np.ndarray
+    turnover: np.ndarray            # 调仓日的 Σ|目标权重 - 漂移后权重|，其余为 0
+    costs: np.ndarray               # 交易成本占组合净值的比例
+    cash_weight: np.ndarray
+    gross_exposure: np.ndarray
+    metrics: models.BacktestMetrics
+
+    def to_frame(self)->pd.DataFrame:
+        return pd.DataFrame({
+            "date": self.dates,
+            "daily_return": self.daily_returns,
+            "equity_curve": self.equity_curve,
+            "turnover": self.turnover,
+            "costs": self.costs,
+            "cash_weight": self.cash_weight,
+            "gross_exposure": self.gross_exposure,
+        })
+
+
+def rebalance_mask(dates:pd.DatetimeIndex, schedule:str|int="daily")->np.ndarray:
+    """Rebalance dates: every date, every ``n``-th date, or the last trading date of each week / month / quarter."""
+    n_dates = len(dates)
+    if isinstance(schedule, (int, np.integer)) and not isinstance(schedule, bool):
+        if schedule < 1:
+            raise ValueError(f"Rebalance interval must be positive, got {schedule}")
+        return np.arange(n_dates) % schedule == 0
+    if schedule not in SCHEDULES:
+        raise ValueError(f"Unknown rebalance schedule {schedule!r}, expected one of {sorted(SCHEDULES)} or an int")
+    if SCHEDULES[schedule] is None:
+        return np.ones(n_dates, dtype=bool)
+    periods = pd.DatetimeIndex(dates).to_period(SCHEDULES[schedule]).asi8
+    mask = np.ones(n_dates, dtype=bool)
+    mask[:-1] = periods[1:] != periods[:-1]
+    return mask
+
+def target_weights(signals:np.ndarray,
+                weighting:str="equal",
+                scores:np.ndarray|None=None,
+                volatility:np.ndarray|None=None,
+                gross:float=1.0)->np.ndarray:
+    """Weights per row of a signal matrix, scaled so that ``sum(|w|) == gross`` (all cash if no signal).
+
+    - ``equal``: every long / short name gets the same absolute weight
+    - ``score``: proportional to ``|score|`` of the selected names
+    - ``volatility``: proportional to ``1 / volatility`` (inverse-vol)
+
+    NaN signals, scores or volatilities give a zero weight.
+    """
+    if weighting not in WEIGHTINGS:
+        raise ValueError(f"Unknown weighting {weighting!r}, expected one of {WEIGHTINGS}")
+    raw = np.nan_to_num(signals, nan=0.0)
+    if weighting == "score":
+        if scores is None:
+            raise ValueError("weighting='score' needs scores")
+        raw *= np.abs(np.nan_to_num(scores, nan=0.0))
+    elif weighting == "volatility":
+        if volatility is None:
+            raise ValueError("weighting='volatility' needs volatility")
+        with np.errstate(divide="ignore"):
+            inverse = 1.0 / volatility
+        raw *= np.where(np.isfinite(inverse) & (inverse > 0), inverse, 0.0)
+    total = np.abs(raw).sum(axis=1, keepdims=True)
+    return np.divide(raw * gross, total, out=np.zeros_like(raw), where=total > 0)
+
+def simulate(signals:np.ndarray,
+            returns:np.ndarray,
+            dates:pd.DatetimeIndex,
+            weighting:str="equal",
+            rebalance:str|int="daily",
+            cost_bps:float=TRANSACTION_COST_BPS,
+            scores:np.ndarray|None=None,
+            volatility:np.ndarray|None=None,
+            gross:float=1.0,
+            cash_rate:float=0.0,
+            initial_capital:float=float(INITIAL_CAPITAL),
+            max_chunk_cells:int=MAX_CHUNK_CELLS)->PortfolioResult:
+    """Simulate one portfolio from ``(n_dates, n_tickers)`` signal / return matrices.
+
+    At the close of each rebalance date the portfolio is traded to the target
+    weights of that date's signals and held from the next date on, drifting
+    with the returns until the next rebalance (like ``calculate_strategy_returns``,
+    today's position comes from yesterday's signal). The rest is cash,
+    which earns ``cash_rate`` per year; short proceeds are kept in cash.
+    Trading costs ``cost_bps`` per unit of turnover and are taken out of
+    the portfolio value on the rebalance date. Missing returns count as 0.
+
+    Within a holding period a position is worth ``w * G(t) / G(start)`` with
+    ``G`` the per-ticker cumulative growth, so the whole path is a few array
+    operations over date chunks, never a loop per date.
+    """
+    n_dates, n_tickers = returns.shape
+    mask = rebalance_mask(dates, rebalance)
+    rebalance_rows = np.flatnonzero(mask)
+    weights = target_weights(signals[rebalance_rows], weighting,
+                             None if scores is None else scores[rebalance_rows],
+                             None if volatility is None else volatility[rebalance_rows], gross)
+    cash = 1.0 - weights.sum(axis=1)
+    cash_daily = (1.0 + cash_rate) ** (1.0 / TRADING_DAYS) - 1.0
+
+    growth = np.nan_to_num(returns, nan=0.0)
+    growth += 1.0
+    np.cumprod(growth, axis=0, out=growth)
+    # 每个日期用的是它之前最近一次调仓的权重（-1：第一次调仓之前，全是现金）
+    segment = np.searchsorted(rebalance_rows, np.arange(n_dates), side="left") - 1
+    # period_growth：本持有期开始以来组合净值的倍数
+    period_growth = np.ones(n_dates)
+    cash_weight = np.ones(n_dates)
+    gross_exposure = np.zeros(n_dates)
+    turnover = np.zeros(n_dates)
+    next_target = np.full(n_dates, -1)
+    next_target[rebalance_rows] = np.arange(len(rebalance_rows))
+    if len(rebalance_rows):
+        turnover[rebalance_rows[0]] = np.abs(weights[0]).sum()
+
+    chunk = max(1, max_chunk_cells // max(n_tickers, 1))
+    first = rebalance_rows[0] + 1 if len(rebalance_rows) else n_dates
+    for lo in range(first, n_dates, chunk):
+        rows = np.arange(lo, min(lo + chunk, n_dates))
+        seg = segment[rows]
+        start = rebalance_rows[seg]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            holdings = growth[rows] / growth[start]
+        np.nan_to_num(holdings, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+        holdings *= weights[seg]
+        cash_value = cash[seg] * (1.0 + cash_daily) ** (rows - start)
+        value = holdings.sum(axis=1) + cash_value
+        period_growth[rows] = value
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cash_weight[rows] = cash_value / value
+            gross_exposure[rows] = np.abs(holdings).sum(axis=1) / value
+            # 调仓日：漂移后的权重 -> 新目标权重的换手
+            at_rebalance = next_target[rows] >= 0
+            if at_rebalance.any():
+                drifted = holdings[at_rebalance] / value[at_rebalance, None]
+                turnover[rows[at_rebalance]] = np.abs(weights[next_target[rows[at_rebalance]]] - drifted).sum(axis=1)
+
+    costs = turnover * cost_bps / 10_000
+    # 调仓日的净值 = 上次调仓后的净值 x 本期增长 x (1 - 成本)，沿调仓日累乘
+    multiplier = period_growth[rebalance_rows] * (1.0 - costs[rebalance_rows])
+    after_rebalance = np.cumprod(multiplier)
+    value = np.ones(n_dates)
+    active = segment >= 0
+    value[active] = after_rebalance[segment[active]] * period_growth[active]
+    value[rebalance_rows] = after_rebalance
+    daily_returns = np.full(n_dates, np.nan)
+    if len(rebalance_rows):
+        first_row = rebalance_rows[0]
+        daily_returns[first_row] = value[first_row] - 1.0
+        daily_returns[first_row + 1:] = value[first_row + 1:] / value[first_row:-1] - 1.0
+        # 调仓后持有的组合
+        cash_weight[rebalance_rows] = cash
+        gross_exposure[rebalance_rows] = np.abs(weights).sum(axis=1)
+    metrics = models.BacktestMetrics(**metrics_from_daily_returns(daily_returns)[0])
+    dates = pd.DatetimeIndex(dates)
+    return PortfolioResult(dates=dates, rebalance_dates=dates[rebalance_rows], target_weights=weights,
+                           equity_curve=initial_capital * value, daily_returns=daily_returns,
+                           turnover=turnover, costs=costs, cash_weight=cash_weight,
+                           gross_exposure=gross_exposure, metrics=metrics)
+
+def required_columns(weighting:str="equal",
+                    score_column:str|None=None,
+                    volatility_column:str=DEFAULT_VOLATILITY_COLUMN)->list[str]:
+    """Factor columns ``run_portfolio`` reads besides the strategy's own and ``return_1day``."""
+    if weighting == "score":
+        if score_column is None:
+            raise ValueError("weighting='score' needs a score_column")
+        return [score_column]
+    if weighting == "volatility":
+        return [volatility_column]
+    return []
+
+def run_portfolio(data:pd.DataFrame,
+                signal:pd.Series,
+                weighting:str="equal",
+                rebalance:str|int="daily",
+                cost_bps:float=TRANSACTION_COST_BPS,
+                score_column:str|None=None,
+                volatility_column:str=DEFAULT_VOLATILITY_COLUMN,
+                gross:float=1.0,
+                cash_rate:float=0.0,
+                initial_capital:float=float(INITIAL_CAPITAL),
+                panel:DatePanel|None=None)->PortfolioResult:
+    """``simulate`` for a long-format factor frame and a signal aligned with its rows (``strategies.strategy_signal``)."""
+    panel = panel or DatePanel.from_frame(data)
+    scores = panel.pivot(data[score_column]) if weighting == "score" else None
+    volatility = panel.pivot(data[volatility_column]) if weighting == "volatility" else None
+    return simulate(panel.pivot(signal), panel.pivot(data["return_1day"]), panel.dates,
+                    weighting=weighting, rebalance=rebalance, cost_bps=cost_bps, scores=scores,
+                    volatility=volatility, gross=gross, cash_rate=cash_rate, initial_capital=initial_capital)
+
+def main()->None:
+    import backtest  # 只有命令行入口需要读因子库
+
+    parser = argparse.ArgumentParser(description="Backtest a strategy as one portfolio with weights, rebalancing and costs.")
+    parser.add_argument("strategy", choices=sorted(strategies.STRATEGIES))
+    parser.add_argument("--params", default="{}", help="strategy kwargs as JSON")
+    parser.add_argument("--weighting", choices=WEIGHTINGS, default="equal")
+    parser.add_argument("--rebalance", default="daily", help="daily / weekly / monthly / quarterly or every N trading days")
+    parser.add_argument("--cost-bps", type=float, default=TRANSACTION_COST_BPS, help="cost per unit of turnover in bps")
+    parser.add_argument("--score-column", default=None, help="factor column for weighting=score")
+    parser.add_argument("--volatility-column", default=DEFAULT_VOLATILITY_COLUMN)
+    parser.add_argument("--cash-rate", type=float, default=0.0, help="annual return on cash")
+    parser.add_argument("--output", default=None, help="CSV for the daily portfolio path")
+    args = parser.parse_args()
+
+    rebalance = int(args.rebalance) if args.rebalance.isdigit() else args.rebalance
+    signal_kwargs = json.loads(args.params)
+    columns = [*strategies.required_columns(strategies.STRATEGIES[args.strategy], signal_kwargs),
+               *backtest.BACKTEST_COLUMNS, *required_columns(args.weighting, args.score_column, args.volatility_column)]
+    data = backtest.load_factor_data(list(dict.fromkeys(columns)))
+    signal = strategies.strategy_signal(data, args.strategy, signal_kwargs)
+    result = run_portfolio(data, signal, args.weighting, rebalance, args.cost_bps, args.score_column,
+                           args.volatility_column, cash_rate=args.cash_rate)
+    if args.output:
+        result.to_frame().to_csv(args.output, index=False)
+    logger.info(f"Portfolio backtest for {args.strategy} ({args.weighting}, {args.rebalance}, "
+                f"{len(result.rebalance_dates)} rebalances, mean turnover {result.turnover[rebalance_mask(result.dates, rebalance)].mean():.3f}):\n"
+                f"{result.metrics.model_dump_json(indent=4)}")
+
+if __name__ == "__main__":
+    main()
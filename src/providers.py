@@ -0,0 +1,152 @@
+"""Pluggable daily price providers."""
+from __future__ import annotations
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS: list[str] = ['Open', 'High', 'Low', 'Close', 'Volume']
+# 合并后面板的列顺序，与 concat_dataframes 的输出一致
+BAR_COLUMNS: list[str] = ["date", "open", "high", "low", "close", "adj_close", "volume", "dividends", "stock_splits", "ticker"]
+COLUMN_RENAMES: dict[str, str] = {
+    "Date": "date",
+    "Open": "open",
+    "High": "high",
+    "Low": "low",
+    "Close": "close",
+    "Adj Close": "adj_close",
+    "Volume": "volume",
+    "Dividends": "dividends",
+    "Stock Splits": "stock_splits",
+}
+
+
+def normalize_bars(data:pd.DataFrame, ticker:str)->pd.DataFrame:
+    """Turn provider output (yfinance layout, ``Date`` index) into long-format bars.
+
+    Dates become tz-naive calendar days, columns follow ``BAR_COLUMNS``.
+    """
+    if "date" not in data.columns and "Date" not in data.columns:
+        data = data.reset_index()
+    data = data.rename(columns=COLUMN_RENAMES)
+    if isinstance(data["date"].dtype, pd.DatetimeTZDtype):
+        # 保留交易所本地日期
+        dates = data["date"].dt.tz_localize(None)
+    else:
+        # CSV 里的时间带不同的 UTC 偏移（夏令时），统一转 UTC 后取日期
+        dates = pd.to_datetime(data["date"], utc=True).dt.tz_localize(None)
+    data = data.assign(date=dates.dt.normalize(), ticker=ticker)
+    return data.reindex(columns=BAR_COLUMNS).sort_values("date").reset_index(drop=True)
+
+
+class PriceProvider(ABC):
+    """Source of daily bars for one ticker at a time."""
+
+    name: str = "provider"
+
+    @abstractmethod
+    def fetch(self, ticker:str, start_date:str, end_date:str)->pd.DataFrame|None:
+        """Bars in ``[start_date, end_date)`` normalized by ``normalize_bars``, or None if there are none."""
+
+
+class YFinanceProvider(PriceProvider):
+    """Daily bars from Yahoo Finance (``auto_adjust=False`` so ``Adj Close`` is kept).
+
+    Network and rate-limit errors raise (``raise_errors=True``) so that
+    ``fetch_with_retry`` retries them; only Yahoo's "no price data" answer
+    counts as an empty range.
+    """
+
+    name = "yfinance"
+
+    def fetch(self, ticker:str, start_date:str, end_date:str)->pd.DataFrame|None:
+        import yfinance  # 只有在线下载时才需要
+        from yfinance.exceptions import YFPricesMissingError
+
+        try:
+            data = yfinance.Ticker(ticker).history(start=start_date, end=end_date, auto_adjust=False, raise_errors=True)
+        except YFPricesMissingError:
+            data = pd.DataFrame()
+        if data.empty:
+            logger.warning(f"No data found for ticker {ticker}")
+            return None
+        missing_cols = [col for col in REQUIRED_COLUMNS if col not in data.columns]
+        if missing_cols:
+            logger.error(f"Missing columns {missing_cols} in data for {ticker}")
+            return None
+        null_pct = data[REQUIRED_COLUMNS].isnull().sum() / len(data) * 100
+        if (null_pct > 0).any():
+            logger.warning(f"Data for {ticker} contains null values:\n{null_pct}")
+        return normalize_bars(data, ticker)
+
+
+class LocalFileProvider(PriceProvider):
+    """Bars from ``<directory>/<ticker>.csv`` (or ``.parquet``), for offline runs and fixtures.
+
+    Files may be in the yfinance layout (``Date`` index, ``Open`` ... columns,
+    as ``history().to_csv()`` writes them) or already normalized long-format bars.
+    """
+
+    name = "local"
+
+    def __init__(self, directory:Path):
+        self.directory = Path(directory)
+
+    def fetch(self, ticker:str, start_date:str, end_date:str)->pd.DataFrame|None:
+        parquet_file, csv_file = self.directory / f"{ticker}.parquet", self.directory / f"{ticker}.csv"
+        if parquet_file.exists():
+            data = pd.read_parquet(parquet_file)
+        elif csv_file.exists():
+            data = pd.read_csv(csv_file)
+        else:
+            logger.warning(f"No local file for ticker {ticker} in {self.directory}")
+            return None
+        data = normalize_bars(data, ticker)
+        data = data[(data["date"] >= pd.Timestamp(start_date)) & (data["date"] < pd.Timestamp(end_date))]
+        return data.reset_index(drop=True) if not data.empty else None
+
+
+class RateLimiter:
+    """Spaces calls at least ``1 / max_per_second`` apart across threads."""
+
+    def __init__(self, max_per_second:float|None):
+        self.interval = 0.0 if not max_per_second else 1.0 / max_per_second
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self)->None:
+        if self.interval == 0.0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+
+def fetch_with_retry(provider:PriceProvider,
+                    ticker:str,
+                    start_date:str,
+                    end_date:str,
+                    max_retries:int=3,
+                    backoff:float=1.0,
+                    rate_limiter:RateLimiter|None=None)->pd.DataFrame|None:
+    """Call ``provider.fetch`` with exponential backoff on exceptions; re-raises after the last try."""
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        try:
+            return provider.fetch(ticker, start_date, end_date)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff * 2 ** attempt
+            logger.warning(f"Fetching {ticker} from {provider.name} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+    return None
@@ -0,0 +1,128 @@
+"""Vectorized cross-sectional ranking kernels on (date x ticker) score matrices."""
+from __future__ import annotations
+import numpy as np
+
+
+def cross_sectional_zscore(matrix:np.ndarray)->np.ndarray:
+    """NaN-aware z-score of every row (ddof=1), like ``groupby('date').transform``.
+
+    Rows with fewer than two valid values give NaN, as does a zero spread.
+    """
+    valid = ~np.isnan(matrix)
+    count = valid.sum(axis=1, keepdims=True)
+    filled = np.where(valid, matrix, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = filled.sum(axis=1, keepdims=True) / count
+        squared = np.where(valid, (matrix - mean) ** 2, 0.0)
+        std = np.sqrt(squared.sum(axis=1, keepdims=True) / (count - 1))
+        std = np.where(count > 1, std, np.nan)
+        return (matrix - mean) / std
+
+def sort_rows(matrix:np.ndarray)->tuple[np.ndarray, np.ndarray|None, np.ndarray|None]:
+    """Sort order along the last axis, plus the first / last sorted position of every position's tie group.
+
+    NaN sorts last and never ties; without any tie the group bounds are
+    ``None``. This is the expensive half of ranking; ``subset_rank`` reuses
+    it for any subset of the cells.
+    """
+    order = np.argsort(matrix, axis=-1, kind="stable").astype(np.int32)
+    ordered = np.take_along_axis(matrix, order, axis=-1)
+    starts = np.ones(ordered.shape, dtype=bool)
+    starts[..., 1:] = ordered[..., 1:] != ordered[..., :-1]
+    if starts.all():
+        return order, None, None
+    n = matrix.shape[-1]
+    positions = np.arange(n, dtype=np.int32)
+    # 相同取值的一段：起点往后传、终点往前传
+    ends = np.ones(ordered.shape, dtype=bool)
+    ends[..., :-1] = starts[..., 1:]
+    first = np.maximum.accumulate(np.where(starts, positions, 0), axis=-1)
+    last = np.flip(np.minimum.accumulate(np.flip(np.where(ends, positions, n - 1), axis=-1), axis=-1), axis=-1)
+    return order, first, last
+
+def subset_rank(order:np.ndarray, first:np.ndarray|None, last:np.ndarray|None, member:np.ndarray)->np.ndarray:
+    """Average rank along the last axis among the ``member`` cells only (others NaN), from ``sort_rows``.
+
+    ``member`` may carry extra leading axes that broadcast against the sort,
+    e.g. one forward-return matrix ranked against the valid cells of many
+    factors. Costs a cumulative count per row instead of another sort.
+    """
+    shape = np.broadcast_shapes(order.shape, member.shape)
+    order = np.broadcast_to(order, shape)
+    in_order = np.take_along_axis(np.broadcast_to(member, shape), order, axis=-1)
+    counted = np.cumsum(in_order, axis=-1, dtype=np.int32)
+    if first is None:
+        average = np.where(in_order, counted, np.nan)
+    else:
+        before = np.take_along_axis(counted - in_order, np.broadcast_to(first, shape), axis=-1)
+        through = np.take_along_axis(counted, np.broadcast_to(last, shape), axis=-1)
+        average = np.where(in_order, before + (through - before + 1) / 2, np.nan)
+    ranks = np.empty(shape)
+    np.put_along_axis(ranks, order, average, axis=-1)
+    return ranks
+
+def _take_n(keys:np.ndarray, n:int, prefer_last:bool=False)->np.ndarray:
+    """Mask of the ``n`` smallest keys per row (partition, O(n_tickers) per row).
+
+    Ties at the cut-off go to the leftmost columns, like a stable sort
+    followed by ``[:n]``; ``prefer_last`` takes the rightmost instead, like
+    the tail of a stable sort in the opposite direction.
+    """
+    mask = np.zeros(keys.shape, dtype=bool)
+    if n <= 0 or keys.shape[1] == 0:
+        return mask
+    if n >= keys.shape[1]:
+        mask[:] = True
+        return mask
+    # argpartition 在并列值之间的取舍没有定义，所以只用它找第 n 小的值，并列的按列序挑
+    cutoff = np.partition(keys, n - 1, axis=1)[:, n - 1:n]
+    mask = keys < cutoff
+    ties = keys == cutoff
+    shortfall = n - mask.sum(axis=1, keepdims=True)
+    if prefer_last:
+        tie_order = np.flip(np.cumsum(np.flip(ties, axis=1), axis=1), axis=1)
+    else:
+        tie_order = np.cumsum(ties, axis=1)
+    return mask | (ties & (tie_order <= shortfall))
+
+def select_n(scores:np.ndarray,
+            n:int,
+            largest:bool=True,
+            eligible:np.ndarray|None=None,
+            present:np.ndarray|None=None,
+            prefer_last:bool=False)->np.ndarray:
+    """Mask of the ``n`` best valid scores per row.
+
+    Equal scores are picked in column (ticker) order, as after a stable
+    ``sort_values``; ``prefer_last`` picks them from the right, as the tail
+    of a stable sort in the opposite direction does.
+    ``eligible`` restricts the candidates. If ``present`` is given, rows with
+    fewer than ``n`` valid scores are topped up with present-but-NaN cells in
+    column order, the way ``sort_values`` puts NaN last and ``iloc[:n]``
+    then picks them.
+    """
+    valid = ~np.isnan(scores)
+    if eligible is not None:
+        valid &= eligible
+    keys = np.where(valid, -scores if largest else scores, np.inf)
+    mask = _take_n(keys, n, prefer_last) & valid
+    if present is not None:
+        shortfall = n - mask.sum(axis=1, keepdims=True)
+        nan_cells = present & np.isnan(scores)
+        if eligible is not None:
+            nan_cells &= eligible
+        mask |= nan_cells & (np.cumsum(nan_cells, axis=1) <= shortfall)
+    return mask
+
+def long_only_signals(scores:np.ndarray, top_n:int)->np.ndarray:
+    """1.0 for the ``top_n`` highest scores of each row, else 0.0."""
+    return select_n(scores, top_n).astype(np.float64)
+
+def long_short_signals(scores:np.ndarray, long_n:int, short_n:int)->np.ndarray:
+    """1.0 for the ``long_n`` highest scores, -1.0 for the ``short_n`` lowest of the rest, else 0.0.
+
+    Matches a stable descending sort per row: longs are its head, shorts its tail.
+    """
+    longs = select_n(scores, long_n)
+    shorts = select_n(scores, short_n, largest=False, eligible=~longs, prefer_last=True)
+    return longs.astype(np.float64) - shorts.astype(np.float64)
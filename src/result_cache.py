@@ -0,0 +1,149 @@
+"""Content-addressed on-disk cache for factor columns and strategy run results."""
+from __future__ import annotations
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+import models
+from consts import RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_CODE_VERSIONS: dict[str, str] = {}
+
+
+def _digest(*parts:bytes|str)->str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode() if isinstance(part, str) else part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+def fingerprint_frame(data:pd.DataFrame, columns:list[str]|None=None)->str:
+    """Hash of the values, dtypes and order of ``columns`` (default: all) of ``data``."""
+    columns = list(data.columns) if columns is None else list(columns)
+    parts: list[bytes|str] = [str(len(data))]
+    for column in columns:
+        values = data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(str)     # categorical 和 object 的同一份数据指纹相同
+        parts += [column, pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes()]
+    return _digest(*parts)
+
+def code_version(*objects:ModuleType|Callable)->str:
+    """Hash of the source code of modules / functions, so editing them invalidates cached results."""
+    parts = []
+    for obj in objects:
+        name = f"{obj.__module__}.{obj.__qualname__}" if not isinstance(obj, ModuleType) else obj.__name__
+        if name not in _CODE_VERSIONS:
+            _CODE_VERSIONS[name] = _digest(inspect.getsource(obj))
+        parts.append(_CODE_VERSIONS[name])
+    return _digest(*parts)
+
+def cache_key(*parts:Any)->str:
+    """Key from fingerprints and JSON-serializable parameters (dict keys are sorted)."""
+    return _digest(*(json.dumps(p, sort_keys=True, default=str) for p in parts))
+
+
+class ResultCache:
+    """Files named by content key under ``root``, evicted least-recently-used past ``max_mb``.
+
+    Reads touch the file's mtime, so mtime order is recency order; writes go
+    through a temporary file so concurrent readers never see half a file.
+    The total size is scanned once and then counted up per write; the
+    directory is only scanned again when the count crosses ``max_mb``.
+    """
+
+    def __init__(self, root:Path=RESULT_CACHE_DIR, max_mb:float=RESULT_CACHE_MAX_MB):
+        self.root = Path(root)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._size: int|None = None     # 已知的缓存总字节数，第一次写入时才扫描
+        self._lock = threading.Lock()
+
+    def _path(self, key:str, suffix:str)->Path:
+        # 按 key 前两位分目录，避免单个目录文件过多
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def _read(self, path:Path, reader:Callable[[Path], Any])->Any:
+        try:
+            value = reader(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def _write(self, path:Path, writer:Callable[[Path], None])->None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.stem}.{uuid.uuid4().hex}.tmp")
+        writer(tmp_path)
+        size = os.path.getsize(tmp_path)
+        tmp_path.replace(path)
+        with self._lock:
+            # 覆盖已有 key 时会多算一次，最多让下一次扫描提前一点
+            self._size = self.size_bytes() if self._size is None else self._size + size
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def get_array(self, key:str)->np.ndarray|None:
+        return self._read(self._path(key, ".npy"), lambda p: np.load(p, allow_pickle=False))
+
+    def put_array(self, key:str, values:np.ndarray)->None:
+        def write(path:Path)->None:
+            with open(path, "wb") as f:
+                np.save(f, np.asarray(values), allow_pickle=False)
+        self._write(self._path(key, ".npy"), write)
+
+    def get_result(self, key:str)->models.StrategyRunResult|None:
+        return self._read(self._path(key, ".json"),
+                          lambda p: models.StrategyRunResult.model_validate_json(p.read_text()))
+
+    def put_result(self, key:str, result:models.StrategyRunResult)->None:
+        self._write(self._path(key, ".json"), lambda p: p.write_text(result.model_dump_json()))
+
+    def _entries(self)->list[tuple[float, int, Path]]:
+        entries = []
+        for path in self.root.glob("*/*"):
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size_bytes(self)->int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self)->None:
+        """Delete least recently used entries until the cache fits in ``max_bytes``."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        with self._lock:
+            self._size = total
+
+    def clear(self)->None:
+        for path in self.root.glob("*/*"):
+            path.unlink(missing_ok=True)
+        with self._lock:
+            self._size = 0
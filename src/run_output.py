@@ -0,0 +1,150 @@
+"""Compact binary run output (position change events + returns), written in the background."""
+from __future__ import annotations
+import argparse
+import logging
+import shutil
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import models
+from consts import INITIAL_CAPITAL
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+COMPRESSION: str = "zstd"
+# 旧 CSV 里由回测产生的列，其余都是输入的因子列
+RUN_COLUMNS: list[str] = ["signal", "position", "strategy_return", "cumulative_strategy_return", "equity_curve"]
+
+
+def position_events(data:pd.DataFrame)->pd.DataFrame:
+    """Rows where a ticker's ``signal`` or ``position`` differs from its previous row (first row included).
+
+    ``data`` must be sorted by ticker and date, as ``calculate_strategy_returns`` returns it.
+    """
+    signal = data["signal"].fillna(0).astype(np.int8)
+    position = data["position"].fillna(0).astype(np.int8)
+    ticker = data["ticker"]
+    changed = (ticker != ticker.shift()) | (signal != signal.shift()) | (position != position.shift())
+    return pd.DataFrame({
+        "date": data["date"].to_numpy()[changed.to_numpy()],
+        "ticker": ticker.to_numpy()[changed.to_numpy()],
+        "signal": signal.to_numpy()[changed.to_numpy()],
+        "position": position.to_numpy()[changed.to_numpy()],
+    })
+
+def _write_parquet(frame:pd.DataFrame, path:Path)->None:
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    pq.write_table(table, path, compression=COMPRESSION, use_dictionary=["ticker"])
+
+def write_run(data:pd.DataFrame, run_dir:Path, result:models.StrategyRunResult|None=None)->None:
+    """Persist the products of one backtest run into ``run_dir``.
+
+    - ``events.parquet``: int8 signal / position change events per ticker
+    - ``returns.parquet``: per-row strategy returns (this also fixes the row index)
+    - ``daily.parquet``: portfolio daily return and equity curve
+    - ``result.json``: the ``StrategyRunResult``
+
+    Per-ticker equity is not stored; ``load_run`` rebuilds it from the returns.
+    """
+    tmp_dir = run_dir.with_name(run_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    _write_parquet(position_events(data), tmp_dir / "events.parquet")
+    _write_parquet(data[["date", "ticker", "strategy_return"]], tmp_dir / "returns.parquet")
+    daily = data.groupby("date")["strategy_return"].mean().sort_index()
+    daily = pd.DataFrame({"date": daily.index, "strategy_return": daily.to_numpy(),
+                          "equity_curve": (1 + daily.fillna(0)).cumprod().to_numpy()})
+    _write_parquet(daily, tmp_dir / "daily.parquet")
+    if result is not None:
+        (tmp_dir / "result.json").write_text(result.model_dump_json(indent=4))
+    # 整个目录替换，读的一方不会看到写了一半的结果
+    shutil.rmtree(run_dir, ignore_errors=True)
+    tmp_dir.replace(run_dir)
+
+def load_run(run_dir:Path,
+            factors:pd.DataFrame|None=None,
+            initial_capital:float=float(INITIAL_CAPITAL))->pd.DataFrame:
+    """Rebuild the wide per-row view that ``generate_backtest_signals`` used to write as CSV.
+
+    Signal / position are forward-filled from the change events and equity is
+    re-accumulated per ticker exactly like ``calculate_strategy_returns``.
+    With ``factors`` the input columns are joined back on ``(date, ticker)``.
+    """
+    returns = pq.read_table(run_dir / "returns.parquet").to_pandas()
+    returns["ticker"] = returns["ticker"].astype(str)
+    events = pq.read_table(run_dir / "events.parquet").to_pandas()
+    events["ticker"] = events["ticker"].astype(str)
+
+    data = returns.merge(events, on=["date", "ticker"], how="left", sort=False)
+    data[["signal", "position"]] = data.groupby("ticker", sort=False)[["signal", "position"]].ffill()
+    data["signal"] = data["signal"].astype(np.float64)
+    data["position"] = data["position"].astype(np.float64)
+    data["cumulative_strategy_return"] = (1 + data["strategy_return"].fillna(0)).groupby(data["ticker"], sort=False).cumprod()
+    data["equity_curve"] = initial_capital * data["cumulative_strategy_return"]
+    data = data[["date", "ticker", *RUN_COLUMNS]]
+    if factors is not None:
+        extra = [c for c in factors.columns if c not in data.columns]
+        factors = factors[["date", "ticker", *extra]].astype({"ticker": str})
+        data = data.merge(factors, on=["date", "ticker"], how="left", sort=False)
+        data = data[["date", "ticker", *extra, *RUN_COLUMNS]]
+    return data
+
+def load_result(run_dir:Path)->models.StrategyRunResult:
+    return models.StrategyRunResult.model_validate_json((run_dir / "result.json").read_text())
+
+
+class RunWriter:
+    """Single background thread that writes run outputs in submission order.
+
+    ``submit`` returns immediately so the next strategy can start; ``close``
+    (or leaving the ``with`` block) waits for everything and re-raises the
+    first write error.
+    """
+
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="run-writer")
+        self._futures: list[Future] = []
+
+    def submit(self, func:Callable, *args, **kwargs)->Future:
+        future = self._pool.submit(func, *args, **kwargs)
+        self._futures.append(future)
+        return future
+
+    def close(self)->None:
+        self._pool.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
+        self._futures.clear()
+
+    def __enter__(self)->RunWriter:
+        return self
+
+    def __exit__(self, *exc)->None:
+        self.close()
+
+
+def main()->None:
+    parser = argparse.ArgumentParser(description="Rebuild the wide CSV view of a compact run output.")
+    parser.add_argument("run_dir", type=Path)
+    parser.add_argument("output", type=Path, help="CSV file to write")
+    parser.add_argument("--with-factors", action="store_true", help="join the factor columns back from the factor store")
+    args = parser.parse_args()
+
+    factors = None
+    if args.with_factors:
+        import backtest  # 只有需要因子列时才加载
+        factors = backtest.load_factor_data()
+    data = load_run(args.run_dir, factors)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    data.to_csv(args.output, index=False)
+    logger.info(f"Wrote {data.shape[0]} rows x {data.shape[1]} columns to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""Long-running backtest service: the factor data and panels stay in memory, every request only runs a strategy."""
+from __future__ import annotations
+import argparse
+import inspect
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+from pydantic import ValidationError
+
+import analytics
+import backtest
+import models
+import portfolio
+import result_cache
+import strategies
+import sweep
+from consts import FACTOR_STORE_DIR, INPUT_FILE
+from date_panel import DatePanel
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# 多久检查一次因子数据有没有变化（秒）
+POLL_SECONDS = 5.0
+# 同一份数据上重复的请求直接返回内存里的结果
+MEMO_SIZE = 256
+
+
+class RequestError(ValueError):
+    """The request itself is invalid (unknown strategy, bad parameters, missing column); answered with 400."""
+
+
+def _check_arguments(func:Callable, what:str, *args:Any, **kwargs:Any)->None:
+    """Raise ``RequestError`` if ``func`` cannot be called with these arguments (unknown or missing parameters)."""
+    try:
+        inspect.signature(func).bind(*args, **kwargs)
+    except TypeError as e:
+        raise RequestError(f"Invalid {what}: {e}") from None
+
+def _check_portfolio_options(kwargs:dict[str, Any])->None:
+    """Parameters and the weighting / rebalance values of ``portfolio.run_portfolio``, checked before running."""
+    _check_arguments(portfolio.run_portfolio, "portfolio options", None, None, panel=None, **kwargs)
+    if kwargs.get("weighting", "equal") not in portfolio.WEIGHTINGS:
+        raise RequestError(f"Unknown weighting {kwargs['weighting']!r}, expected one of {portfolio.WEIGHTINGS}")
+    try:
+        portfolio.rebalance_mask(pd.DatetimeIndex([]), kwargs.get("rebalance", "daily"))
+        portfolio.required_columns(**{k: v for k, v in kwargs.items() if k in ("weighting", "score_column", "volatility_column")})
+    except ValueError as e:
+        raise RequestError(f"Invalid portfolio options: {e}") from None
+
+def _options(request:dict[str, Any], name:str)->dict[str, Any]|None:
+    value = request.get(name)
+    if value is None or value is False:
+        return None
+    if not isinstance(value, dict):
+        raise RequestError(f"{name!r} must be an object of keyword arguments")
+    return value
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """One load of the factor data with the panel and return matrix every request reuses.
+
+    Never modified after loading; a reload builds a new snapshot and swaps
+    it in, requests already running finish on the old one.
+    """
+    data: pd.DataFrame
+    returns_panel: tuple[DatePanel, np.ndarray]
+    signature: str
+    version: int
+    loaded_at: float
+
+
+def data_signature(store_dir:Path=FACTOR_STORE_DIR, csv_file:Path=INPUT_FILE)->str:
+    """Cheap change marker of the factor data: path, size and modification time of every store file (or the CSV)."""
+    files = sorted(Path(store_dir).rglob("*.parquet")) if Path(store_dir).exists() else []
+    if not files and Path(csv_file).exists():
+        files = [Path(csv_file)]
+    stats = []
+    for path in files:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:       # 写入过程中被替换的文件，下次轮询再看
+            continue
+        stats.append((str(path), stat.st_size, stat.st_mtime_ns))
+    return result_cache.cache_key(stats)
+
+
+class BacktestService:
+    """Factor data loaded once and kept resident, backtests run against it on demand.
+
+    ``run`` is safe to call from many threads at once: it reads the current
+    snapshot once and never modifies it. ``watch`` polls the data files and
+    reloads in the background when they change.
+    """
+
+    def __init__(self,
+                store_dir:Path=FACTOR_STORE_DIR,
+                csv_file:Path=INPUT_FILE,
+                poll_seconds:float=POLL_SECONDS,
+                memo_size:int=MEMO_SIZE):
+        self.store_dir = Path(store_dir)
+        self.csv_file = Path(csv_file)
+        self.poll_seconds = poll_seconds
+        self.memo_size = memo_size
+        self._snapshot: Snapshot|None = None
+        self._reload_lock = threading.Lock()
+        self._memo: OrderedDict[str, models.StrategyRunResult] = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    @property
+    def snapshot(self)->Snapshot:
+        if self._snapshot is None:
+            self.reload()
+        return self._snapshot
+
+    def reload(self, force:bool=True)->bool:
+        """Load the factor data again (only if the files changed unless ``force``); returns whether it did."""
+        with self._reload_lock:
+            signature = data_signature(self.store_dir, self.csv_file)
+            if not force and self._snapshot is not None and signature == self._snapshot.signature:
+                return False
+            start = time.perf_counter()
+            data = backtest.load_factor_data(store_dir=self.store_dir, csv_file=self.csv_file)
+            version = 1 if self._snapshot is None else self._snapshot.version + 1
+            # 签名取自加载之前：加载期间又有写入的话，下次轮询会再加载一次
+            self._snapshot = Snapshot(data=data, returns_panel=sweep.build_returns_panel(data),
+                                      signature=signature, version=version, loaded_at=time.time())
+            with self._memo_lock:
+                self._memo.clear()
+            logger.info(f"Loaded factor data version {version} ({len(data)} rows x {data.shape[1]} columns) "
+                        f"in {time.perf_counter() - start:.2f}s")
+            return True
+
+    def watch(self, stop:threading.Event)->None:
+        """Reload whenever the data files change, until ``stop`` is set; a failed load keeps the old data."""
+        while not stop.wait(self.poll_seconds):
+            try:
+                self.reload(force=False)
+            except Exception:
+                logger.exception("Reloading the factor data failed, still serving the previous version")
+
+    def run(self, request:dict[str, Any])->models.StrategyRunResult:
+        """Backtest ``{"strategy_name": ..., "parameters": {...}}`` (a ``StrategyConfig``).
+
+        Optional ``"robustness"`` (``true`` or keyword arguments of
+        ``analytics.robustness_metrics``, ``{}`` for the defaults) and
+        ``"portfolio"`` (keyword arguments of ``portfolio.run_portfolio``)
+        work as in ``sweep.run_sweep``.
+        Raises ``RequestError`` for an unknown strategy, parameters the
+        strategy (or the robustness / portfolio options) does not take, and
+        a column the data lacks; anything else is a bug in the service.
+        """
+        config = models.StrategyConfig.model_validate({"parameters": {}, **{k: v for k, v in request.items()
+                                                                           if k in models.StrategyConfig.model_fields}})
+        if config.strategy_name not in strategies.SIGNAL_STRATEGIES:
+            raise RequestError(f"Unknown strategy {config.strategy_name!r}, expected one of {sorted(strategies.SIGNAL_STRATEGIES)}")
+        # 先按函数签名检查参数，执行时的 KeyError / TypeError 才不会被当成请求错误
+        _check_arguments(strategies.SIGNAL_STRATEGIES[config.strategy_name].signal, "parameters", None,
+                         **{k: v for k, v in config.parameters.items() if k not in strategies.FRAME_KWARGS})
+        # true 和任何 dict（包括 {}）都表示开启，只有缺省 / null / false 表示关闭
+        robustness = {} if request.get("robustness") is True else _options(request, "robustness")
+        portfolio_kwargs = _options(request, "portfolio")
+        if robustness is not None:
+            _check_arguments(analytics.robustness_metrics, "robustness options", None, None, **robustness)
+        if portfolio_kwargs is not None:
+            _check_portfolio_options(portfolio_kwargs)
+        # 整个请求只读这一次快照，中途换数据也不受影响
+        snapshot = self.snapshot
+        key = result_cache.cache_key(snapshot.version, config.model_dump(), robustness, portfolio_kwargs)
+        with self._memo_lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        columns = sweep.required_columns([(config.strategy_name, config.parameters)], portfolio_kwargs)
+        missing = sorted(set(columns) - set(snapshot.data.columns))
+        if missing:
+            raise RequestError(f"Factor data has no column(s) {missing}")
+        result = sweep.evaluate(snapshot.data, snapshot.returns_panel, config.strategy_name, config.parameters,
+                                robustness, portfolio_kwargs)
+        with self._memo_lock:
+            self._memo[key] = result
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return result
+
+    def status(self)->dict[str, Any]:
+        snapshot = self.snapshot
+        panel = snapshot.returns_panel[0]
+        return {
+            "version": snapshot.version,
+            "loaded_at": pd.Timestamp(snapshot.loaded_at, unit="s").isoformat(),
+            "rows": len(snapshot.data),
+            "columns": list(snapshot.data.columns),
+            "n_dates": len(panel.dates),
+            "n_tickers": len(panel.tickers),
+            "start_date": str(panel.dates[0].date()) if len(panel.dates) else None,
+            "end_date": str(panel.dates[-1].date()) if len(panel.dates) else None,
+            "strategies": sorted(strategies.SIGNAL_STRATEGIES),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """JSON over HTTP: ``GET /health``, ``GET /strategies``, ``POST /backtest``, ``POST /reload``."""
+    server: ThreadingHTTPServer|ThreadingUnixHTTPServer
+
+    def do_GET(self)->None:
+        if self.path == "/health":
+            self._reply(200, self.server.service.status())
+        elif self.path == "/strategies":
+            self._reply(200, sorted(strategies.SIGNAL_STRATEGIES))
+        else:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self)->None:
+        service: BacktestService = self.server.service
+        try:
+            if self.path == "/backtest":
+                start = time.perf_counter()
+                result = service.run(self._read_json())
+                self._reply(200, result.model_dump_json(), raw=True)
+                logger.info(f"{result.strategy_config.strategy_name} {json.dumps(result.strategy_config.parameters)} "
+                            f"in {time.perf_counter() - start:.3f}s")
+            elif self.path == "/reload":
+                service.reload()
+                self._reply(200, service.status())
+            else:
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+        except (RequestError, ValidationError, json.JSONDecodeError) as e:
+            # 请求本身的问题（未知策略 / 参数 / 缺列 / JSON）返回 400，服务继续跑
+            self._reply(400, {"error": f"{type(e).__name__}: {e}"})
+        except Exception as e:
+            logger.exception(f"Request {self.path} failed")
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _read_json(self)->dict[str, Any]:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        request = json.loads(body or b"{}")
+        if not isinstance(request, dict):
+            raise RequestError("Request body must be a JSON object")
+        return request
+
+    def _reply(self, status:int, body:Any, raw:bool=False)->None:
+        payload = (body if raw else json.dumps(body, default=str)).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self)->str:
+        # Unix socket 的客户端地址是空字符串
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format:str, *args:Any)->None:
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """``ThreadingHTTPServer`` on a Unix domain socket."""
+    daemon_threads = True
+
+
+def make_server(service:BacktestService,
+                host:str=DEFAULT_HOST,
+                port:int=DEFAULT_PORT,
+                unix_socket:Path|None=None)->ThreadingHTTPServer|ThreadingUnixHTTPServer:
+    """HTTP server handling every request in its own thread, on ``host:port`` or on ``unix_socket``."""
+    if unix_socket is not None:
+        if Path(unix_socket).exists():
+            os.unlink(unix_socket)
+        server = ThreadingUnixHTTPServer(str(unix_socket), _Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    server.service = service
+    return server
+
+def serve(service:BacktestService,
+        host:str=DEFAULT_HOST,
+        port:int=DEFAULT_PORT,
+        unix_socket:Path|None=None)->None:
+    """Load the data, then serve until interrupted, reloading in the background when the data changes."""
+    service.reload()
+    server = make_server(service, host, port, unix_socket)
+    stop = threading.Event()
+    watcher = threading.Thread(target=service.watch, args=(stop,), name="factor-data-watcher", daemon=True)
+    watcher.start()
+    logger.info(f"Serving backtests on {unix_socket or f'http://{host}:{server.server_address[1]}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        if unix_socket is not None and Path(unix_socket).exists():
+            os.unlink(unix_socket)
+
+def main()->None:
+    parser = argparse.ArgumentParser(description="Serve backtests over HTTP with the factor data kept in memory.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix-socket", type=Path, default=None, help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--store-dir", type=Path, default=FACTOR_STORE_DIR)
+    parser.add_argument("--csv-file", type=Path, default=INPUT_FILE, help="used when the factor store does not exist")
+    parser.add_argument("--poll-seconds", type=float, default=POLL_SECONDS, help="how often to check the data for changes")
+    args = parser.parse_args()
+    service = BacktestService(args.store_dir, args.csv_file, poll_seconds=args.poll_seconds)
+    serve(service, args.host, args.port, args.unix_socket)
+
+if __name__ == "__main__":
+    main()
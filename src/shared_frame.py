@@ -0,0 +1,96 @@
+"""Share the columns of a long-format DataFrame between processes via shared memory."""
+from __future__ import annotations
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class SharedFrameSpec:
+    """Everything a worker needs to attach to a ``SharedFrame`` (small and picklable)."""
+    shm_name: str
+    n_rows: int
+    columns: tuple[str, ...]
+    dtypes: tuple[str, ...]
+    offsets: tuple[int, ...]
+    tickers: tuple[str, ...]
+
+
+class SharedFrame:
+    """Numeric columns plus ``date`` / ``ticker`` of a frame, laid out in one shared memory block.
+
+    ``date`` is stored as int64 nanoseconds and ``ticker`` as int32 codes into
+    ``spec.tickers``; every other column keeps its dtype. The creating process
+    owns the block and must call ``close()`` (or use it as a context manager).
+    """
+
+    def __init__(self, shm:shared_memory.SharedMemory, spec:SharedFrameSpec, owner:bool):
+        self.shm = shm
+        self.spec = spec
+        self.owner = owner
+
+    @classmethod
+    def create(cls, data:pd.DataFrame, columns:list[str]|None=None)->SharedFrame:
+        """Copy ``date``, ``ticker`` and ``columns`` of ``data`` into a new shared block."""
+        columns = [c for c in (columns or data.columns) if c not in ("date", "ticker")]
+        codes, tickers = pd.factorize(data["ticker"], sort=True)
+        arrays = {
+            "date": data["date"].to_numpy(dtype="datetime64[ns]").view(np.int64),
+            "ticker": codes.astype(np.int32),
+        }
+        for column in columns:
+            arrays[column] = data[column].to_numpy()
+        offsets, offset = [], 0
+        for values in arrays.values():
+            # 每列按 8 字节对齐
+            offset = (offset + 7) // 8 * 8
+            offsets.append(offset)
+            offset += values.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        spec = SharedFrameSpec(
+            shm_name=shm.name,
+            n_rows=len(data),
+            columns=tuple(arrays),
+            dtypes=tuple(values.dtype.str for values in arrays.values()),
+            offsets=tuple(offsets),
+            tickers=tuple(str(t) for t in tickers),
+        )
+        frame = cls(shm, spec, owner=True)
+        for name, values in arrays.items():
+            frame.array(name)[:] = values
+        return frame
+
+    @classmethod
+    def attach(cls, spec:SharedFrameSpec)->SharedFrame:
+        """Attach to a block created in another process."""
+        shm = shared_memory.SharedMemory(name=spec.shm_name)
+        return cls(shm, spec, owner=False)
+
+    def array(self, column:str)->np.ndarray:
+        """Zero-copy view of one column."""
+        i = self.spec.columns.index(column)
+        return np.ndarray((self.spec.n_rows,), dtype=np.dtype(self.spec.dtypes[i]),
+                          buffer=self.shm.buf, offset=self.spec.offsets[i])
+
+    def to_frame(self)->pd.DataFrame:
+        """Rebuild the long-format DataFrame (numeric columns are views where pandas allows)."""
+        data = {
+            "date": self.array("date").view("datetime64[ns]"),
+            "ticker": np.asarray(self.spec.tickers, dtype=object)[self.array("ticker")],
+        }
+        for column in self.spec.columns[2:]:
+            data[column] = self.array(column)
+        return pd.DataFrame(data, copy=False)
+
+    def close(self)->None:
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self)->SharedFrame:
+        return self
+
+    def __exit__(self, *exc)->None:
+        self.close()
@@ -1,122 +1,146 @@
 """stratgies"""
+from __future__ import annotations
 import pandas as pd
 import numpy as np
 import logging
+from dataclasses import dataclass
+from typing import Callable
+import ranking
+from date_panel import DatePanel
 from consts import MOMENTUM_FACTORS, MIN_VALID_FACTORS, LONG_N, SHORT_N, TOP_N, MOMENTUM_WEIGHTS
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-def momentum_strategy(data:pd.DataFrame,
+@dataclass(frozen=True)
+class SignalStrategy:
+    """A strategy as a pure signal function plus the columns it reads.
+
+    ``signal(data, **kwargs)`` only reads ``columns(kwargs)`` (besides
+    ``date`` / ``ticker``), never modifies ``data`` and returns the same-day
+    signal as a Series aligned with ``data.index``; NaN marks rows the
+    strategy does not trade at all (they are left out of the output frame
+    and skipped by the lag). ``order_by`` reproduces the row order of the
+    original per-date implementation in the frame adapter: ``None`` keeps
+    the input order, a column name orders the rows by date and by that
+    column within each date.
+    """
+    name: str
+    signal: Callable[..., pd.Series]
+    columns: Callable[[dict], list[str]]
+    order_by: str|None = None
+
+
+def lag_signal(data:pd.DataFrame, lag:int=1, compact:bool=False)->pd.DataFrame:
+    """Shift ``signal`` by ``lag`` rows within each ticker (missing -> 0).
+    lag=0 保留当天的原始信号，由调用方自己处理跨批次的移位（见 streaming）。
+    compact=True 时 signal 存成 int8（取值只有 -1/0/1）。"""
+    if lag:
+        data["signal"] = data.groupby("ticker", observed=True)["signal"].shift(lag).fillna(0)
+    if compact:
+        data["signal"] = data["signal"].fillna(0).astype(np.int8)
+    return data
+
+def lagged_signal(data:pd.DataFrame, signal:pd.Series, lag:int=1)->pd.Series:
+    """``signal`` shifted by ``lag`` traded rows within each ticker (missing -> 0), NaN rows stay NaN."""
+    if not lag:
+        return signal
+    traded = signal.notna()
+    lagged = signal[traded].groupby(data.loc[traded, "ticker"], observed=True).shift(lag).fillna(0)
+    return lagged.reindex(signal.index)
+
+def signal_frame(data:pd.DataFrame,
+                signal:pd.Series,
+                lag:int=1,
+                compact:bool=False,
+                order_by:str|None=None)->pd.DataFrame:
+    """Adapter to the frame call style: the traded rows of ``data`` plus a ``signal`` column.
+
+    Untouched rows are never copied more than once: a shallow copy when all
+    rows are traded in their original order, a single ``take`` otherwise.
+    With ``order_by`` the rows come out by date, then ascending ``order_by``
+    (NaN last), like a per-date ``sort_values`` inside ``groupby('date').apply``.
+    """
+    traded = signal.notna().to_numpy()
+    if traded.all() and order_by is None:
+        frame = data.copy(deep=False)
+        frame["signal"] = signal.to_numpy()
+    else:
+        positions = np.flatnonzero(traded)
+        if order_by is not None:
+            # 和逐日 groupby + sort_values 的输出一样：先按日期，日期内按 order_by 升序（NaN 在后，稳定排序）
+            keys = data[order_by].to_numpy(dtype=np.float64)[positions]
+            positions = positions[np.lexsort((keys, data["date"].to_numpy()[positions]))]
+        frame = data.take(positions)
+        frame["signal"] = signal.to_numpy()[positions]
+    return lag_signal(frame, lag, compact)
+
+def momentum_signal(data:pd.DataFrame,
                     long_short:bool,
                     top_n:int=TOP_N,
                     weights:dict[str,float]=MOMENTUM_WEIGHTS,
                     min_valid_factors:int=MIN_VALID_FACTORS,
                     long_n:int=LONG_N,
                     short_n:int=SHORT_N,
-                    factors:list[str]=MOMENTUM_FACTORS,)->pd.DataFrame:
+                    factors:list[str]=MOMENTUM_FACTORS)->pd.Series:
     """1️⃣ 横截面多周期动量策略（Trend / Momentum, Multi-horizon）
     long_short=False:只做多，选topn， long_short=True:做多做空
     思想：
         - 对于每个交易日，在所有股票之间比较“动量强弱”，选出动量最强的top5股票做多， bottom5做空（美股）。
         - 动量可以用多周期的收益率来衡量，比如 20 天、60 天、120 天、250 天收益率的平均值。
         - 为了避免未来函数，信号整体向后shift 一天，表示“昨天收盘后决定今天的持仓”。
-    
+
     对每个交易日：按 return_60day 从大到小排序所有股票，选前 N（比如 10 或 20）只股票，signal = 1，
-    其他股票 signal = 0，第二天按这个持仓计算组合收益"""
-    data = data.copy()
-    # 计算每个因子的横截面 z-score
+    其他股票 signal = 0，第二天按这个持仓计算组合收益
+    有效因子数不足 min_valid_factors 的行不参与（signal 为 NaN）。"""
+    # 计算每个因子的横截面 z-score（在 date x ticker 矩阵上按行一次算完），直接累加成得分
+    panel = DatePanel.from_frame(data)
+    valid_factor_count = np.zeros(panel.shape, dtype=np.int64)
+    momentum_score = np.zeros(panel.shape)
     for factor in factors:
-        data[factor + '_zscore'] = data.groupby('date')[factor].transform(
-            lambda x: (x - x.mean()) / x.std()+ 1e-9
-        )
-    # 每行有效因子数量
-    data['valid_factor_count'] = data[[f + '_zscore' for f in factors]].notnull().sum(axis=1)
-    # 只保留有效因子数量 >= min_valid_factors 的行
-    data = data[data['valid_factor_count'] >= min_valid_factors]
-    # 计算加权动量得分
-    data["momentum_score"] = 0.0
-    for col in factors:
-        zcol = col + '_zscore'
-        data["momentum_score"] += weights[col] * data[zcol].fillna(0)
-    
-    # 有效因子太少的行，score 设为 NaN（当天不参与排序）
-    data.loc[data["valid_factor_count"] < min_valid_factors, "momentum_score"] = np.nan
+        zscore = ranking.cross_sectional_zscore(panel.pivot(data[factor])) + 1e-9
+        valid = ~np.isnan(zscore)
+        valid_factor_count += valid
+        momentum_score += weights[factor] * np.where(valid, zscore, 0.0)
+    # 有效因子太少的格子不参与当天排序
+    eligible = panel.present & (valid_factor_count >= min_valid_factors)
+    momentum_score[~eligible] = np.nan
 
     # 根据 long_short 参数决定做多做空还是只做多
     if long_n is None:
         long_n = top_n
     if short_n is None:
         short_n = top_n
-    # 按天横截面排序，生成多空信号
-    def assign_momentum_signal(group:pd.DataFrame)->pd.DataFrame:
-        valid = group.dropna(subset=['momentum_score']).copy()
-        if valid.empty:
-            group['signal'] = 0.0
-            return group
-        
-        valid = valid.sort_values(by='momentum_score', ascending=False)
-        group['signal'] = 0.0
-
-        if long_short:
-            # 多头: 选 top N 做多
-            n_long = min(long_n, len(valid))
-            long_idxs = valid.index[:n_long]
-
-            # 空头: 选 bottom N 做空
-            remaining = valid.index[n_long:]
-            n_short = min(short_n, len(remaining))
-            short_idxs = remaining[-n_short:] if n_short > 0 else []
-
-            group.loc[long_idxs, 'signal'] = 1.0
-            group.loc[short_idxs, 'signal'] = -1.0
-        else:
-            # 只做多: 选 top N 做多
-            n_long = min(top_n, len(valid))
-            long_idxs = valid.index[:n_long]
-            group.loc[long_idxs, 'signal'] = 1.0
-        return group
-    data = data.groupby('date', group_keys=False
-                        ).apply(assign_momentum_signal)
-    
-    # 信号向后移一日，避免未来函数
-    data["signal"] = data.groupby("ticker")["signal"].shift(1).fillna(0)
-    return data
+    # 按天横截面排序，生成多空信号：top N 做多，剩下的里 bottom N 做空
+    if long_short:
+        signals = ranking.long_short_signals(momentum_score, long_n, short_n)
+    else:
+        signals = ranking.long_only_signals(momentum_score, top_n)
+    signal = np.where(panel.unpivot(eligible), panel.unpivot(signals).astype(np.float64), np.nan)
+    return pd.Series(signal, index=data.index, name="signal")
 
-def mean_reversion_strategy(data:pd.DataFrame, top_n:int=10)->pd.DataFrame:
+def mean_reversion_signal(data:pd.DataFrame, top_n:int=10)->pd.Series:
     """2️⃣ 横截面反转策略（短期均值回归）
     思想：短期跌多了会反弹，短期涨多了会回吐（mean reversion）。
     用到的因子列：return_5day, return_10day
     简单规则示例：
     每天按 return_5day 从小到大排序（跌得最多在前）
     选"跌得最多"的 N 只股票做多（期待反弹）"""
-    data = data.copy()
-    
-    def assign_mean_reversion_signal(group):
-        group = group.sort_values(by='return_5day', ascending=True)
-        group['signal'] = 0.0
-        n = min(top_n, len(group))
-        group.iloc[:n, group.columns.get_loc('signal')] = 1
-        return group
-
-    data = data.groupby('date',group_keys=False
-                        ).apply(assign_mean_reversion_signal)
-    data["signal"] = data.groupby("ticker")["signal"].shift(1).fillna(0)
-    return data
+    # 每天选 return_5day 最小的 top_n 只；有效值不够时和 sort_values 一样用 NaN 行补足
+    panel = DatePanel.from_frame(data)
+    selected = ranking.select_n(panel.pivot(data["return_5day"]), top_n, largest=False, present=panel.present)
+    return pd.Series(panel.unpivot(selected).astype(np.float64), index=data.index, name="signal")
 
-def ma_crossover_strategy(data:pd.DataFrame)->pd.DataFrame:
+def ma_crossover_signal(data:pd.DataFrame)->pd.Series:
     """3️⃣ 双均线趋势策略（MA Crossover）
     思想：短期均线在长期均线之上 → 上升趋势；反之下跌趋势。
     用到因子：ma_5, ma_10, ma_20, ma_60, ...
     简单规则示例：
     ma_5 > ma_20 → 做多；否则空仓。"""
-    data = data.copy()
-    data["signal"] =  np.where(data["ma_5"] > data["ma_20"], 1, 0)
-    data["signal"] = data.groupby("ticker")["signal"].shift(1).fillna(0)
-    return data
+    return pd.Series(np.where(data["ma_5"] > data["ma_20"], 1, 0), index=data.index, name="signal")
 
-def volume_breakout_strategy(data:pd.DataFrame)->pd.DataFrame:
+def volume_breakout_signal(data:pd.DataFrame)->pd.Series:
     """4️⃣ 成交量 + 突破策略（Volume Breakout）
     思想：
     价格突破 + 放量 → 有效突破，更大概率继续走。
@@ -128,20 +152,17 @@ def volume_breakout_strategy(data:pd.DataFrame)->pd.DataFrame:
     adj_close > ma_20（价格在 20 日均线上方，趋势向上）
     volume_to_ma_20 > 1.5（今天放量至少 1.5 倍）
     则 signal = 1，否则 0"""
-    data = data.copy()
-    data["signal"] = np.where(
+    signal = np.where(
         (data["adj_close"] > data["ma_20"]) & (data["volume_to_ma_20"] > 1.5),
         1,
         0
     )
-    data["signal"] = data.groupby("ticker")["signal"].shift(1).fillna(0)
-    return data
+    return pd.Series(signal, index=data.index, name="signal")
 
-
-def rsi_strategy(data:pd.DataFrame, 
-                lower_threshold:float, 
-                upper_threshold:float,
-                rsi_col:str)->pd.DataFrame:
+def rsi_signal(data:pd.DataFrame,
+            lower_threshold:float,
+            upper_threshold:float,
+            rsi_col:str)->pd.Series:
     """
     5️⃣ RSI 超买超卖反转策略（RSI Reversion）
     思想：RSI 很低 = 超卖；RSI 很高 = 超买，可能出现反转。
@@ -150,10 +171,90 @@ def rsi_strategy(data:pd.DataFrame,
     RSI 低 → 1（做多）
     RSI 高 → -1（做空）
     中间 → 0"""
-    data = data.copy()
-    data["signal"] = np.where(
+    signal = np.where(
         data[rsi_col] < lower_threshold,1,
         np.where(data[rsi_col]>upper_threshold,-1,0)
     )
-    data["signal"] = data.groupby("ticker")["signal"].shift(1).fillna(0)
-    return data
+    return pd.Series(signal, index=data.index, name="signal")
+
+
+# 策略名 -> 信号函数 + 读取的因子列（date / ticker 之外），用于只从因子库加载需要的列
+SIGNAL_STRATEGIES: dict[str, SignalStrategy] = {
+    "momentum_strategy": SignalStrategy("momentum_strategy", momentum_signal,
+                                        lambda kwargs: list(kwargs.get("factors", MOMENTUM_FACTORS))),
+    "mean_reversion_strategy": SignalStrategy("mean_reversion_strategy", mean_reversion_signal,
+                                              lambda kwargs: ["return_5day"], order_by="return_5day"),
+    "ma_crossover_strategy": SignalStrategy("ma_crossover_strategy", ma_crossover_signal,
+                                            lambda kwargs: ["ma_5", "ma_20"]),
+    "volume_breakout_strategy": SignalStrategy("volume_breakout_strategy", volume_breakout_signal,
+                                               lambda kwargs: ["adj_close", "ma_20", "volume_to_ma_20"]),
+    "rsi_strategy": SignalStrategy("rsi_strategy", rsi_signal, lambda kwargs: [kwargs["rsi_col"]]),
+}
+# 只属于 frame 适配层的参数，不传给信号函数
+FRAME_KWARGS: tuple[str, ...] = ("lag", "compact")
+
+def required_columns(signal_func:Callable, signal_kwargs:dict)->list[str]:
+    """Factor columns a strategy reads for the given keyword arguments."""
+    return SIGNAL_STRATEGIES[signal_func.__name__].columns(signal_kwargs)
+
+def strategy_signal(data:pd.DataFrame, name:str, signal_kwargs:dict, lag:int=1)->pd.Series:
+    """Lagged signal of strategy ``name`` aligned with ``data.index`` (NaN = row not traded).
+
+    This is what the frame-style functions put in their ``signal`` column,
+    without building the frame.
+    """
+    kwargs = {k: v for k, v in signal_kwargs.items() if k not in FRAME_KWARGS}
+    signal = SIGNAL_STRATEGIES[name].signal(data, **kwargs)
+    return lagged_signal(data, signal, signal_kwargs.get("lag", lag))
+
+def _run_frame(name:str, data:pd.DataFrame, lag:int, compact:bool, **kwargs)->pd.DataFrame:
+    strategy = SIGNAL_STRATEGIES[name]
+    return signal_frame(data, strategy.signal(data, **kwargs), lag, compact, strategy.order_by)
+
+
+# 以下保持原来的调用方式：传入因子表，返回带 signal 列的表（不修改传入的 data）
+def momentum_strategy(data:pd.DataFrame,
+                    long_short:bool,
+                    top_n:int=TOP_N,
+                    weights:dict[str,float]=MOMENTUM_WEIGHTS,
+                    min_valid_factors:int=MIN_VALID_FACTORS,
+                    long_n:int=LONG_N,
+                    short_n:int=SHORT_N,
+                    factors:list[str]=MOMENTUM_FACTORS,
+                    lag:int=1,
+                    compact:bool=False,)->pd.DataFrame:
+    """Frame-style ``momentum_signal``; rows below ``min_valid_factors`` are dropped."""
+    return _run_frame("momentum_strategy", data, lag, compact, long_short=long_short, top_n=top_n, weights=weights,
+                      min_valid_factors=min_valid_factors, long_n=long_n, short_n=short_n, factors=factors)
+
+def mean_reversion_strategy(data:pd.DataFrame, top_n:int=10, lag:int=1, compact:bool=False)->pd.DataFrame:
+    """Frame-style ``mean_reversion_signal``."""
+    return _run_frame("mean_reversion_strategy", data, lag, compact, top_n=top_n)
+
+def ma_crossover_strategy(data:pd.DataFrame, lag:int=1, compact:bool=False)->pd.DataFrame:
+    """Frame-style ``ma_crossover_signal``."""
+    return _run_frame("ma_crossover_strategy", data, lag, compact)
+
+def volume_breakout_strategy(data:pd.DataFrame, lag:int=1, compact:bool=False)->pd.DataFrame:
+    """Frame-style ``volume_breakout_signal``."""
+    return _run_frame("volume_breakout_strategy", data, lag, compact)
+
+def rsi_strategy(data:pd.DataFrame,
+                lower_threshold:float,
+                upper_threshold:float,
+                rsi_col:str,
+                lag:int=1,
+                compact:bool=False)->pd.DataFrame:
+    """Frame-style ``rsi_signal``."""
+    return _run_frame("rsi_strategy", data, lag, compact,
+                      lower_threshold=lower_threshold, upper_threshold=upper_threshold, rsi_col=rsi_col)
+
+
+# 策略名 -> 策略函数，参数扫描 / 服务等按名字查找策略
+STRATEGIES: dict[str, Callable[..., pd.DataFrame]] = {
+    "momentum_strategy": momentum_strategy,
+    "mean_reversion_strategy": mean_reversion_strategy,
+    "ma_crossover_strategy": ma_crossover_strategy,
+    "volume_breakout_strategy": volume_breakout_strategy,
+    "rsi_strategy": rsi_strategy,
+}
@@ -0,0 +1,185 @@
+"""Out-of-core pipeline: stream tickers through factor computation and dates through backtests."""
+from __future__ import annotations
+import argparse
+import json
+import logging
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import batch_backtest
+import factor_engine
+import models
+import strategies
+from backtest import BACKTEST_COLUMNS
+from consts import FACTOR_STORE_DIR, INITIAL_CAPITAL, OUTPUT_DIR, PROCESSED_DATA_DIR
+from factor_store import FactorStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_BUDGET_MB: float = 512.0
+# 一行数据在计算过程中大约会同时存在的副本数（原始列、面板、中间量、输出）
+WORKING_COPIES: int = 4
+STREAM_OUTPUT_SCHEMA = pa.schema([
+    ("date", pa.timestamp("ns")),
+    ("ticker", pa.string()),
+    ("signal", pa.float64()),
+    ("position", pa.float64()),
+    ("strategy_return", pa.float64()),
+    ("cumulative_strategy_return", pa.float64()),
+    ("equity_curve", pa.float64()),
+])
+
+
+def rows_for_budget(n_columns:int, memory_budget_mb:float)->int:
+    """How many long-format rows of ``n_columns`` float64 columns fit in the budget."""
+    bytes_per_row = max(n_columns, 1) * 8 * WORKING_COPIES
+    return max(1, int(memory_budget_mb * 1024 * 1024 // bytes_per_row))
+
+def iter_ticker_batches(input_file:Path, max_rows:int, chunksize:int=100_000)->Iterator[pd.DataFrame]:
+    """Yield groups of complete tickers from a CSV sorted by ticker, about ``max_rows`` rows each.
+
+    A single ticker longer than ``max_rows`` is still yielded whole.
+    """
+    pending: list[pd.DataFrame] = []
+    pending_rows = 0
+    for chunk in pd.read_csv(input_file, parse_dates=['date'], chunksize=chunksize):
+        pending.append(chunk)
+        pending_rows += len(chunk)
+        if pending_rows < max_rows:
+            continue
+        buffer = pd.concat(pending, ignore_index=True)
+        # 最后一个 ticker 可能还没读完，留到下一批
+        last_ticker = buffer["ticker"].iloc[-1]
+        complete = buffer["ticker"] != last_ticker
+        if complete.any():
+            yield buffer[complete].reset_index(drop=True)
+            pending = [buffer[~complete]]
+            pending_rows = int((~complete).sum())
+        else:
+            pending = [buffer]
+    if pending_rows:
+        yield pd.concat(pending, ignore_index=True)
+
+def stream_factors(input_file:Path=PROCESSED_DATA_DIR / "combined_stocks_data.csv",
+                store_dir:Path=FACTOR_STORE_DIR,
+                memory_budget_mb:float=DEFAULT_MEMORY_BUDGET_MB)->int:
+    """Compute all factors ticker batch by ticker batch, appending each batch to the factor store.
+
+    Time-series factors only look at one ticker's history, so batching by
+    ticker gives the same result as ``calculate_all_factors`` (up to rounding).
+    Returns the number of rows written.
+    """
+    n_columns = 10 + len(factor_engine.factor_columns())
+    max_rows = rows_for_budget(n_columns, memory_budget_mb)
+    store = FactorStore(store_dir)
+    store.clear()
+    total = 0
+    for i, batch in enumerate(iter_ticker_batches(input_file, max_rows)):
+        factors = factor_engine.compute_all_factors(batch)
+        store.append(factors)
+        total += len(factors)
+        logger.info(f"Factor batch {i}: {batch['ticker'].nunique()} tickers, {len(batch)} rows")
+    return total
+
+def _shift_with_carry(data:pd.DataFrame, column:str, carry:pd.Series)->tuple[pd.Series, pd.Series]:
+    """``groupby('ticker').shift(1).fillna(0)`` that continues from the previous batch.
+
+    ``carry`` holds each ticker's last value from earlier batches; the first
+    row of a ticker in this batch takes it instead of 0. Returns the shifted
+    column and the updated carry.
+    """
+    shifted = data.groupby("ticker")[column].shift(1)
+    first = shifted.index[~data["ticker"].duplicated()]
+    shifted.loc[first] = data.loc[first, "ticker"].map(carry).to_numpy()
+    last = data.drop_duplicates("ticker", keep="last").set_index("ticker")[column]
+    carry = pd.concat([carry[~carry.index.isin(last.index)], last])
+    return shifted.fillna(0), carry
+
+def stream_backtest(strategy:str,
+                    signal_kwargs:dict,
+                    store_dir:Path=FACTOR_STORE_DIR,
+                    output_file:Path|None=None,
+                    memory_budget_mb:float=DEFAULT_MEMORY_BUDGET_MB,
+                    initial_capital:float=float(INITIAL_CAPITAL))->models.StrategyRunResult:
+    """Backtest one strategy reading the factor store in bounded batches of whole dates.
+
+    Cross-sectional steps (z-scores, rankings) need every ticker of a date,
+    so batches are cut on date boundaries. The one-day signal lag, the
+    position lag and each ticker's equity curve are carried across batches,
+    so the result matches the in-memory backtest. Per-row output (signal,
+    position, returns, equity) is appended to ``output_file`` as it is
+    produced; only the per-date mean returns are kept for the metrics.
+    """
+    signal_func = strategies.STRATEGIES[strategy]
+    columns = list(dict.fromkeys([*strategies.required_columns(signal_func, signal_kwargs), *BACKTEST_COLUMNS]))
+    store = FactorStore(store_dir)
+    dates = store.dates()
+    rows_per_date = max(1, store.count_rows() // max(len(dates), 1))
+    dates_per_batch = max(1, rows_for_budget(len(columns) + 8, memory_budget_mb) // rows_per_date)
+    logger.info(f"Streaming {strategy} over {len(dates)} dates in batches of {dates_per_batch} dates")
+
+    signal_carry = pd.Series(dtype=np.float64)
+    position_carry = pd.Series(dtype=np.float64)
+    equity_carry = pd.Series(dtype=np.float64)
+    daily_returns = []
+    writer: pq.ParquetWriter|None = None
+    try:
+        for start in range(0, len(dates), dates_per_batch):
+            batch_dates = dates[start:start + dates_per_batch]
+            data = store.read(columns=columns, start_date=batch_dates[0], end_date=batch_dates[-1])
+            df = signal_func(data, lag=0, **signal_kwargs)
+            df = df.sort_values(["ticker", "date"], kind="stable").reset_index(drop=True)
+            df["signal"], signal_carry = _shift_with_carry(df, "signal", signal_carry)
+            df["position"], position_carry = _shift_with_carry(df, "signal", position_carry)
+            df["strategy_return"] = df["position"] * df["return_1day"]
+            growth = (1 + df["strategy_return"].fillna(0)).groupby(df["ticker"]).cumprod()
+            df["cumulative_strategy_return"] = growth * df["ticker"].map(equity_carry).fillna(1.0).to_numpy()
+            df["equity_curve"] = initial_capital * df["cumulative_strategy_return"]
+            last = df.drop_duplicates("ticker", keep="last").set_index("ticker")["cumulative_strategy_return"]
+            equity_carry = pd.concat([equity_carry[~equity_carry.index.isin(last.index)], last])
+            daily_returns.append(df.groupby("date")["strategy_return"].mean())
+
+            if output_file is not None:
+                # 固定 schema，某一批没有输出行时类型也不会变
+                out = df[STREAM_OUTPUT_SCHEMA.names]
+                table = pa.Table.from_pandas(out, schema=STREAM_OUTPUT_SCHEMA, preserve_index=False)
+                if writer is None:
+                    output_file.parent.mkdir(parents=True, exist_ok=True)
+                    writer = pq.ParquetWriter(output_file, STREAM_OUTPUT_SCHEMA)
+                writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    daily = pd.concat(daily_returns).sort_index().to_numpy() if daily_returns else np.array([])
+    metrics = batch_backtest.metrics_from_daily_returns(daily[None, :])[0]
+    config = models.StrategyConfig(strategy_name=strategy, parameters=signal_kwargs)
+    result = models.StrategyRunResult(strategy_config=config, backtest_result=models.BacktestMetrics(**metrics))
+    logger.info(f"Streaming backtest results for {strategy}:\n{result.model_dump_json(indent=4)}")
+    return result
+
+def main()->None:
+    parser = argparse.ArgumentParser(description="Run the factor / backtest pipeline in bounded-memory batches.")
+    parser.add_argument("--memory-mb", type=float, default=DEFAULT_MEMORY_BUDGET_MB, help="memory budget per batch")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    factors_parser = subparsers.add_parser("factors", help="compute factors ticker batch by ticker batch")
+    factors_parser.add_argument("--input", type=Path, default=PROCESSED_DATA_DIR / "combined_stocks_data.csv")
+    backtest_parser = subparsers.add_parser("backtest", help="backtest one strategy date batch by date batch")
+    backtest_parser.add_argument("strategy", choices=sorted(strategies.STRATEGIES))
+    backtest_parser.add_argument("--params", default="{}", help="strategy kwargs as JSON")
+    args = parser.parse_args()
+
+    if args.command == "factors":
+        stream_factors(args.input, memory_budget_mb=args.memory_mb)
+    else:
+        output_file = OUTPUT_DIR / f"{args.strategy}_stream.parquet"
+        stream_backtest(args.strategy, json.loads(args.params), output_file=output_file, memory_budget_mb=args.memory_mb)
+
+if __name__ == "__main__":
+    main()
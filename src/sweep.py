@@ -0,0 +1,207 @@
+"""Parallel parameter sweeps over strategies, sharing the factor data through shared memory."""
+from __future__ import annotations
+import argparse
+import functools
+import itertools
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import util
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+import analytics
+import backtest
+import batch_backtest
+import models
+import portfolio
+import strategies
+from consts import OUTPUT_DIR
+from date_panel import DatePanel
+from shared_frame import SharedFrame, SharedFrameSpec
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ParamGrid = dict[str, list[Any]]
+
+# worker 进程里 attach 一次共享内存，之后的任务都复用这份数据
+_WORKER_FRAME: SharedFrame|None = None
+_WORKER_DATA: pd.DataFrame|None = None
+_WORKER_PANEL: tuple[DatePanel, np.ndarray]|None = None
+
+
+def expand_grid(grid:ParamGrid)->list[dict[str, Any]]:
+    """All combinations of a ``{param: [values, ...]}`` grid, in a stable order."""
+    if not grid:
+        return [{}]
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+def sweep_configs(grids:dict[str, ParamGrid])->list[tuple[str, dict[str, Any]]]:
+    """Flatten ``{strategy_name: grid}`` into ``(strategy_name, kwargs)`` pairs."""
+    configs = []
+    for strategy_name, grid in grids.items():
+        if strategy_name not in strategies.STRATEGIES:
+            raise KeyError(f"Unknown strategy {strategy_name!r}, expected one of {sorted(strategies.STRATEGIES)}")
+        configs.extend((strategy_name, kwargs) for kwargs in expand_grid(grid))
+    return configs
+
+def required_columns(configs:list[tuple[str, dict[str, Any]]],
+                    portfolio_kwargs:dict[str, Any]|None=None)->list[str]:
+    """Union of the factor columns read by every configuration plus the backtest (or portfolio) inputs."""
+    columns = set(backtest.BACKTEST_COLUMNS)
+    if portfolio_kwargs is not None:
+        columns.update(portfolio.required_columns(
+            **{k: v for k, v in portfolio_kwargs.items() if k in ("weighting", "score_column", "volatility_column")}))
+    for strategy_name, kwargs in configs:
+        columns.update(strategies.required_columns(strategies.STRATEGIES[strategy_name], kwargs))
+    return sorted(columns)
+
+def build_returns_panel(data:pd.DataFrame)->tuple[DatePanel, np.ndarray]:
+    """Panel of ``data`` and its ``return_1day`` matrix, built once and shared by every evaluation."""
+    panel = DatePanel.from_frame(data)
+    return panel, panel.pivot(data["return_1day"])
+
+def evaluate(data:pd.DataFrame,
+            returns_panel:tuple[DatePanel, np.ndarray],
+            strategy_name:str,
+            kwargs:dict[str, Any],
+            robustness:dict[str, Any]|None=None,
+            portfolio_kwargs:dict[str, Any]|None=None)->models.StrategyRunResult:
+    """Backtest one configuration on already loaded data, see ``run_sweep`` for the options."""
+    # 收益矩阵在每个进程里只建一次，回测走矩阵化路径
+    panel, returns = returns_panel
+    signal = strategies.strategy_signal(data, strategy_name, kwargs)
+    if portfolio_kwargs is None:
+        result = batch_backtest.run_batch(panel.pivot(signal)[None], returns)
+        metrics, daily_returns = result.metrics[0], result.daily_returns
+    else:
+        result = portfolio.run_portfolio(data, signal, panel=panel, **portfolio_kwargs)
+        metrics, daily_returns = result.metrics, result.daily_returns[None]
+    config = models.StrategyConfig(strategy_name=strategy_name, parameters=kwargs)
+    run_result = models.StrategyRunResult(strategy_config=config, backtest_result=metrics)
+    if robustness is not None:
+        run_result.robustness = analytics.robustness_metrics(daily_returns, panel.dates, **robustness)[0]
+    return run_result
+
+def _init_worker(spec:SharedFrameSpec)->None:
+    global _WORKER_FRAME, _WORKER_DATA, _WORKER_PANEL
+    _WORKER_FRAME = SharedFrame.attach(spec)
+    _WORKER_DATA = _WORKER_FRAME.to_frame()
+    _WORKER_PANEL = build_returns_panel(_WORKER_DATA)
+    # worker 退出时走 multiprocessing 的 finalizer（atexit 不会执行），关掉 attach 的共享内存
+    util.Finalize(None, _close_worker, exitpriority=10)
+
+def _close_worker()->None:
+    global _WORKER_FRAME, _WORKER_DATA, _WORKER_PANEL
+    frame = _WORKER_FRAME
+    # 先放掉引用共享内存的 DataFrame，否则 close 会因为还有导出的 buffer 失败
+    _WORKER_FRAME = _WORKER_DATA = _WORKER_PANEL = None
+    if frame is not None:
+        frame.close()
+
+def _run_task(task:tuple[str, dict[str, Any]],
+            robustness:dict[str, Any]|None=None,
+            portfolio_kwargs:dict[str, Any]|None=None)->models.StrategyRunResult:
+    strategy_name, kwargs = task
+    return evaluate(_WORKER_DATA, _WORKER_PANEL, strategy_name, kwargs, robustness, portfolio_kwargs)
+
+def run_sweep(data:pd.DataFrame,
+            grids:dict[str, ParamGrid],
+            n_workers:int|None=None,
+            rank_by:str="sharpe_ratio",
+            robustness:dict[str, Any]|None=None,
+            portfolio_kwargs:dict[str, Any]|None=None)->list[models.StrategyRunResult]:
+    """Evaluate every parameter combination and return the results ranked by ``rank_by`` (descending).
+
+    With ``n_workers > 1`` the needed factor columns are copied once into
+    shared memory; each worker process attaches to it at start-up instead
+    of receiving a pickled copy of the frame per task.
+    ``robustness`` (keyword arguments of ``analytics.robustness_metrics``, ``{}``
+    for the defaults) adds rolling / per-year / bootstrap statistics to every result.
+    ``portfolio_kwargs`` (keyword arguments of ``portfolio.run_portfolio``) backtests
+    every configuration as one weighted portfolio instead of per-ticker accounts.
+    """
+    configs = sweep_configs(grids)
+    columns = required_columns(configs, portfolio_kwargs)
+    n_workers = n_workers or os.cpu_count() or 1
+    logger.info(f"Running {len(configs)} configurations on {min(n_workers, len(configs))} worker(s)")
+    data = data[["date", "ticker", *columns]]
+
+    if n_workers <= 1 or len(configs) <= 1:
+        returns_panel = build_returns_panel(data)
+        results = [evaluate(data, returns_panel, name, kwargs, robustness, portfolio_kwargs) for name, kwargs in configs]
+    else:
+        with SharedFrame.create(data, columns) as frame:
+            with ProcessPoolExecutor(max_workers=min(n_workers, len(configs)),
+                                    initializer=_init_worker,
+                                    initargs=(frame.spec,)) as pool:
+                # map 保持提交顺序，结果是确定的
+                results = list(pool.map(functools.partial(_run_task, robustness=robustness,
+                                                         portfolio_kwargs=portfolio_kwargs), configs))
+    return rank_results(results, rank_by)
+
+def rank_results(results:list[models.StrategyRunResult], rank_by:str="sharpe_ratio")->list[models.StrategyRunResult]:
+    """Sort results by a ``BacktestMetrics`` field, best first, NaNs last."""
+    def key(result:models.StrategyRunResult)->float:
+        value = getattr(result.backtest_result, rank_by)
+        return float("-inf") if value != value else value
+    return sorted(results, key=key, reverse=True)
+
+def _robustness_columns(robustness:models.RobustnessMetrics)->dict[str, Any]:
+    return {
+        "sharpe_ci_lower": robustness.sharpe_ratio_ci.lower,
+        "sharpe_ci_upper": robustness.sharpe_ratio_ci.upper,
+        "annualized_return_ci_lower": robustness.annualized_return_ci.lower,
+        "annualized_return_ci_upper": robustness.annualized_return_ci.upper,
+        "rolling_sharpe_min": robustness.rolling_sharpe_min,
+        "rolling_sharpe_median": robustness.rolling_sharpe_median,
+        "max_drawdown_days": robustness.max_drawdown_days,
+        "positive_years": sum(y.total_return > 0 for y in robustness.yearly) / max(len(robustness.yearly), 1),
+    }
+
+def results_table(results:list[models.StrategyRunResult])->pd.DataFrame:
+    """Flatten results into one row per configuration."""
+    rows = []
+    for rank, result in enumerate(results, start=1):
+        rows.append({
+            "rank": rank,
+            "strategy_name": result.strategy_config.strategy_name,
+            "parameters": json.dumps(result.strategy_config.parameters, sort_keys=True),
+            **result.backtest_result.model_dump(),
+            **(_robustness_columns(result.robustness) if result.robustness is not None else {}),
+        })
+    return pd.DataFrame(rows)
+
+def main()->None:
+    parser = argparse.ArgumentParser(description="Run a parallel parameter sweep over strategies.")
+    parser.add_argument("grid", type=Path,
+                        help='JSON file like {"momentum_strategy": {"top_n": [5, 10], "long_short": [true, false]}}')
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--rank-by", default="sharpe_ratio", help="BacktestMetrics field to rank by")
+    parser.add_argument("--output", type=Path, default=OUTPUT_DIR / "sweep_results.csv")
+    parser.add_argument("--robustness", action="store_true",
+                        help="add rolling Sharpe / per-year / block-bootstrap confidence intervals per configuration")
+    parser.add_argument("--resamples", type=int, default=analytics.N_RESAMPLES, help="bootstrap resamples with --robustness")
+    parser.add_argument("--portfolio", default=None,
+                        help='portfolio backtest settings as JSON, e.g. {"weighting": "volatility", "rebalance": "monthly"}')
+    args = parser.parse_args()
+    portfolio_kwargs = json.loads(args.portfolio) if args.portfolio else None
+    robustness = {"n_resamples": args.resamples} if args.robustness else None
+
+    grids = json.loads(args.grid.read_text())
+    data = backtest.load_factor_data(required_columns(sweep_configs(grids), portfolio_kwargs))
+    results = run_sweep(data, grids, n_workers=args.workers, rank_by=args.rank_by,
+                        robustness=robustness, portfolio_kwargs=portfolio_kwargs)
+    table = results_table(results)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    table.to_csv(args.output, index=False)
+    logger.info(f"Saved {len(table)} ranked configurations to {args.output}\n{table.head(10).to_string(index=False)}")
+
+if __name__ == "__main__":
+    main()
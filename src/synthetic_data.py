@@ -0,0 +1,87 @@
+"""Deterministic synthetic OHLCV panels for benchmarks and offline runs."""
+from __future__ import annotations
+import argparse
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from providers import BAR_COLUMNS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def generate_ohlcv(n_tickers:int,
+                n_days:int,
+                seed:int=0,
+                start_date:str="2015-01-02",
+                late_listing_frac:float=0.2,
+                delisting_frac:float=0.05,
+                gap_frac:float=0.01,
+                missing_price_frac:float=0.001)->pd.DataFrame:
+    """Long-format daily bars shaped like ``combined_stocks_data.csv``, sorted by ticker and date.
+
+    Prices follow a geometric random walk per ticker. To look like real
+    panels, ``late_listing_frac`` of tickers list after the first day,
+    ``delisting_frac`` stop trading early, ``gap_frac`` of the remaining
+    days are dropped (halts) and ``missing_price_frac`` of ``adj_close``
+    values are NaN. The same arguments always give the same frame.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start_date, periods=n_days)
+    tickers = np.array([f"SYN{i:04d}" for i in range(n_tickers)])
+
+    # 每只股票的上市 / 退市位置
+    first = np.where(rng.random(n_tickers) < late_listing_frac, rng.integers(0, max(n_days // 2, 1), n_tickers), 0)
+    last = np.where(rng.random(n_tickers) < delisting_frac, rng.integers(n_days // 2, n_days, n_tickers) + 1, n_days)
+    day = np.arange(n_days)[:, None]
+    present = (day >= first) & (day < last) & (rng.random((n_days, n_tickers)) >= gap_frac)
+
+    drift = rng.normal(0.0003, 0.0002, n_tickers)
+    vol = rng.uniform(0.01, 0.04, n_tickers)
+    log_returns = drift + vol * rng.standard_normal((n_days, n_tickers))
+    close = rng.uniform(10, 500, n_tickers) * np.exp(np.cumsum(log_returns, axis=0))
+    open_ = close * np.exp(-log_returns * rng.uniform(0, 1, (n_days, n_tickers)))
+    spread = vol * np.abs(rng.standard_normal((n_days, n_tickers)))
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread)
+    volume = np.round(rng.lognormal(13, 1, n_tickers) * rng.lognormal(0, 0.3, (n_days, n_tickers)))
+    dividends = np.where(rng.random((n_days, n_tickers)) < 0.004, close * 0.005, 0.0)
+    # 复权价：按分红逐步向前调整
+    adj_factor = np.cumprod((1 + dividends / close)[::-1], axis=0)[::-1]
+    adj_close = close / adj_factor
+    adj_close[rng.random((n_days, n_tickers)) < missing_price_frac] = np.nan
+
+    # 按 ticker 优先展开，与合并后 CSV 的顺序一致
+    rows, cols = np.nonzero(present.T)
+    data = pd.DataFrame({
+        "date": dates[cols],
+        "open": open_.T[rows, cols],
+        "high": high.T[rows, cols],
+        "low": low.T[rows, cols],
+        "close": close.T[rows, cols],
+        "adj_close": adj_close.T[rows, cols],
+        "volume": volume.T[rows, cols],
+        "dividends": dividends.T[rows, cols],
+        "stock_splits": 0.0,
+        "ticker": tickers[rows],
+    })
+    return data[BAR_COLUMNS]
+
+def main()->None:
+    parser = argparse.ArgumentParser(description="Write a synthetic OHLCV panel as CSV.")
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--tickers", type=int, default=50)
+    parser.add_argument("--days", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = generate_ohlcv(args.tickers, args.days, seed=args.seed)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    data.to_csv(args.output, index=False)
+    logger.info(f"Saved {len(data)} rows for {args.tickers} tickers to {args.output}")
+
+if __name__ == "__main__":
+    main()
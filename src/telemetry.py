@@ -0,0 +1,203 @@
+"""Per-stage wall / CPU time, peak memory and frame shapes, with optional cProfile dumps."""
+from __future__ import annotations
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+
+import models
+
+try:
+    import resource
+except ImportError:     # Windows 没有 resource 模块，不记录内存
+    resource = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# stage 打开期间多久采样一次当前 RSS（秒）
+RSS_SAMPLE_SECONDS = 0.01
+_STATM = Path("/proc/self/statm")
+
+
+def _current_rss_mb()->float|None:
+    """Resident set size right now from ``/proc/self/statm`` (Linux), None elsewhere."""
+    try:
+        resident = int(_STATM.read_text().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+def _max_rss_mb()->float|None:
+    """Peak resident set size of this process so far (``getrusage``, essentially free)."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return max_rss / 1024 / 1024 if sys.platform == "darwin" else max_rss / 1024
+
+
+class StageRecord:
+    """Handle yielded inside a stage; call ``observe`` with the frame the stage produced."""
+
+    def __init__(self):
+        self.rows: int|None = None
+        self.columns: int|None = None
+
+    def observe(self, data:pd.DataFrame)->pd.DataFrame:
+        self.rows, self.columns = data.shape
+        return data
+
+
+class _RssSampler:
+    """Background thread raising the running peak of every open stage to the sampled RSS."""
+
+    def __init__(self, open_stages:list[list[float]], lock:threading.Lock):
+        self._open = open_stages
+        self._lock = lock
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="telemetry-rss", daemon=True)
+        self._thread.start()
+
+    def _run(self)->None:
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            rss = _current_rss_mb()
+            with self._lock:
+                for entry in self._open:
+                    entry[1] = max(entry[1], rss)
+
+    def stop(self)->None:
+        self._stop.set()
+        self._thread.join()
+
+
+class Telemetry:
+    """Collects ``StageTelemetry`` for one run.
+
+    Stages may nest; a parent's peak memory includes its children. With
+    ``track_memory`` a stage's peak memory is its peak RSS minus the RSS at
+    its start: a background thread samples ``/proc/self/statm`` every
+    ``RSS_SAMPLE_SECONDS`` while stages are open, and a new process high
+    (``ru_maxrss``) reached during the stage is taken as exact, so only
+    spikes shorter than a sample that stay below an earlier high are missed.
+    ``trace_allocations`` (also the fallback without ``/proc``) measures the
+    peak of Python allocations above the stage's start with ``tracemalloc``
+    instead, but it slows allocation-heavy code down by half or more.
+    With ``profile`` the whole run is recorded by cProfile until ``finish``.
+    """
+
+    def __init__(self, track_memory:bool=True, trace_allocations:bool=False, profile:bool=False):
+        self.stages: list[models.StageTelemetry] = []
+        self.track_memory = track_memory
+        self.trace_allocations = trace_allocations
+        self.profile_file: Path|None = None
+        self._open: list[list[int]] = []    # 每层嵌套 stage 的 [起始占用, 目前为止的峰值]
+        self._open_rss: list[list[float]] = []  # 同上，RSS（MB），采样线程会更新峰值
+        self._rss_lock = threading.Lock()
+        self._sampler: _RssSampler|None = None
+        self._started_tracemalloc = False
+        self._profiler = cProfile.Profile() if profile else None
+        if self._profiler is not None:
+            self._profiler.enable()
+
+    @contextmanager
+    def stage(self, name:str)->Iterator[StageRecord]:
+        record = StageRecord()
+        rss_start = _current_rss_mb() if self.track_memory and not self.trace_allocations else None
+        # 没有 /proc 时退回 tracemalloc
+        tracing = self.trace_allocations or (self.track_memory and rss_start is None)
+        if rss_start is not None:
+            max_rss_start = _max_rss_mb()
+            with self._rss_lock:
+                self._open_rss.append([rss_start, rss_start])
+            if self._sampler is None:
+                self._sampler = _RssSampler(self._open_rss, self._rss_lock)
+        if tracing:
+            self._ensure_tracing()
+            current, peak = tracemalloc.get_traced_memory()
+            if self._open:
+                # reset_peak 之前把父 stage 已达到的峰值记下来
+                self._open[-1][1] = max(self._open[-1][1], peak)
+            tracemalloc.reset_peak()
+            self._open.append([current, current])
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            peak_mb = None
+            if tracing:
+                start, peak = self._open.pop()
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                if self._open:
+                    self._open[-1][1] = max(self._open[-1][1], peak)
+                peak_mb = (peak - start) / 1024 / 1024
+            elif rss_start is not None:
+                rss_end, max_rss_end = _current_rss_mb(), _max_rss_mb()
+                with self._rss_lock:
+                    start, peak = self._open_rss.pop()
+                    peak = max(peak, rss_end)
+                    if max_rss_start is not None and max_rss_end > max_rss_start:
+                        # 期间创了进程新高，新高就是本 stage 的准确峰值
+                        peak = max(peak, max_rss_end)
+                    if self._open_rss:
+                        self._open_rss[-1][1] = max(self._open_rss[-1][1], peak)
+                    idle = not self._open_rss
+                if idle:
+                    self._sampler.stop()
+                    self._sampler = None
+                peak_mb = peak - start
+            self.stages.append(models.StageTelemetry(name=name, wall_seconds=wall, cpu_seconds=cpu,
+                                                     peak_memory_mb=peak_mb, rows=record.rows, columns=record.columns))
+
+    def _ensure_tracing(self)->None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def finish(self, profile_file:Path|None=None)->models.RunTelemetry:
+        """Stop tracing / profiling and return the collected telemetry.
+
+        The cProfile dump (pstats format, readable by ``snakeviz`` or
+        ``flameprof`` for a flame graph) is written to ``profile_file``.
+        """
+        if self._profiler is not None:
+            self._profiler.disable()
+            if profile_file is not None:
+                profile_file.parent.mkdir(parents=True, exist_ok=True)
+                self._profiler.dump_stats(profile_file)
+                self.profile_file = profile_file
+            self._profiler = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return self.summary()
+
+    def summary(self)->models.RunTelemetry:
+        return models.RunTelemetry(stages=list(self.stages),
+                                   profile_file=None if self.profile_file is None else str(self.profile_file))
+
+    def prepend(self, other:Telemetry)->None:
+        """Prepend stages recorded elsewhere (e.g. a load shared by several runs)."""
+        self.stages[:0] = other.stages
+
+    def table(self)->pd.DataFrame:
+        return pd.DataFrame([s.model_dump() for s in self.stages])
+
+
+@contextmanager
+def track(telemetry:Telemetry|None, name:str)->Iterator[StageRecord]:
+    """``telemetry.stage(name)``, or a no-op stage when telemetry is off."""
+    if telemetry is None:
+        yield StageRecord()
+    else:
+        with telemetry.stage(name) as record:
+            yield record
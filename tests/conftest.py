@@ -0,0 +1,5 @@
+"""src/ 下的模块是平铺的脚本式模块，测试时直接加到 sys.path。"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
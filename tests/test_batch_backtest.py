@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import backtest
+import batch_backtest
+import factor_engine
+import strategies
+import synthetic_data
+from date_panel import DatePanel
+
+CONFIGS = [
+    ("momentum_strategy", {"long_short": True}),
+    ("momentum_strategy", {"long_short": False, "top_n": 3}),
+    ("mean_reversion_strategy", {"top_n": 4}),
+    ("ma_crossover_strategy", {}),
+    ("volume_breakout_strategy", {}),
+    ("rsi_strategy", {"lower_threshold": 30, "upper_threshold": 70, "rsi_col": "rsi_10"}),
+]
+
+
+@pytest.fixture(scope="module")
+def factors():
+    return factor_engine.compute_all_factors(synthetic_data.generate_ohlcv(n_tickers=10, n_days=320, seed=11))
+
+
+def test_batch_matches_per_ticker_backtest(factors):
+    frames = [strategies.STRATEGIES[name](factors, **kwargs) for name, kwargs in CONFIGS]
+    result = batch_backtest.backtest_frames(factors, frames)
+    panel = DatePanel.from_frame(factors)
+    for i, frame in enumerate(frames):
+        expected = backtest.calculate_strategy_returns(frame)
+        rows, cols = panel.locate(expected)
+        name = CONFIGS[i][0]
+        np.testing.assert_array_equal(result.positions[i, rows, cols], expected["position"].to_numpy(), err_msg=name)
+        np.testing.assert_allclose(result.strategy_returns[i, rows, cols], expected["strategy_return"], rtol=1e-12, err_msg=name)
+        np.testing.assert_allclose(result.equity_curve[i, rows, cols], expected["equity_curve"], rtol=1e-12, err_msg=name)
+        # 策略没有的行在矩阵里是 NaN
+        assert np.isnan(result.positions[i]).sum() == np.prod(panel.shape) - len(expected)
+        metrics = backtest.calculate_performance_metrics(expected)
+        batch = result.metrics[i].model_dump()
+        for key, value in metrics.items():
+            np.testing.assert_allclose(batch[key], value, rtol=1e-10, atol=1e-14, err_msg=f"{name} {key}")
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+import download_data
+from download_data import BarCache
+from providers import BAR_COLUMNS, PriceProvider
+
+
+class FakeProvider(PriceProvider):
+    """Business-day bars; ranges starting in ``failing`` raise like a network error."""
+
+    name = "fake"
+
+    def __init__(self, failing:set[str]=frozenset()):
+        self.failing = set(failing)
+        self.calls: list[tuple[str, str]] = []
+
+    def fetch(self, ticker:str, start_date:str, end_date:str)->pd.DataFrame|None:
+        self.calls.append((start_date, end_date))
+        if start_date in self.failing:
+            raise ConnectionError("rate limited")
+        dates = pd.bdate_range(start_date, end_date, inclusive="left")
+        bars = pd.DataFrame({c: 1.0 for c in BAR_COLUMNS if c not in ("date", "ticker")}, index=range(len(dates)))
+        return bars.assign(date=dates, ticker=ticker)[BAR_COLUMNS]
+
+
+def test_failed_range_is_not_recorded(tmp_path):
+    cache = BarCache(tmp_path)
+    with pytest.raises(ConnectionError):
+        download_data.load_ticker("AAA", FakeProvider({"2020-01-01"}), cache, "2020-01-01", "2020-02-01", max_retries=1, backoff=0)
+    assert cache.load("AAA") == (None, None)
+    provider = FakeProvider()
+    bars = download_data.load_ticker("AAA", provider, cache, "2020-01-01", "2020-02-01", backoff=0)
+    assert provider.calls == [("2020-01-01", "2020-02-01")]
+    assert len(bars) == len(pd.bdate_range("2020-01-01", "2020-01-31"))
+
+def test_partial_failure_keeps_the_successful_side(tmp_path):
+    cache = BarCache(tmp_path)
+    download_data.load_ticker("AAA", FakeProvider(), cache, "2020-02-01", "2020-03-01", backoff=0)
+    with pytest.raises(ConnectionError):
+        download_data.load_ticker("AAA", FakeProvider({"2020-01-01"}), cache, "2020-01-01", "2020-04-01", max_retries=0)
+    _, fetched = cache.load("AAA")
+    assert fetched == (pd.Timestamp("2020-02-01"), pd.Timestamp("2020-04-01"))
+    provider = FakeProvider()
+    download_data.load_ticker("AAA", provider, cache, "2020-01-01", "2020-04-01", backoff=0)
+    assert provider.calls == [("2020-01-01", "2020-02-01")]
+
+def test_interrupted_ingest_keeps_previous_combined_file(tmp_path):
+    class Interrupting(FakeProvider):
+        def fetch(self, ticker, start_date, end_date):
+            if ticker == "BBB":
+                raise KeyboardInterrupt
+            return super().fetch(ticker, start_date, end_date)
+
+    output_dir = tmp_path / "processed"
+    download_data.ingest(["AAA", "BBB"], FakeProvider(), "2020-01-01", "2020-02-01",
+                         cache=BarCache(tmp_path / "cache"), output_dir=output_dir)
+    combined = (output_dir / "combined_stocks_data.csv").read_text()
+    with pytest.raises(KeyboardInterrupt):
+        download_data.ingest(["AAA", "BBB"], Interrupting(), "2020-01-01", "2020-03-01",
+                             cache=BarCache(tmp_path / "cache2"), output_dir=output_dir)
+    assert (output_dir / "combined_stocks_data.csv").read_text() == combined
+
+def test_concat_dataframes_compact(tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for ticker in ("BBB", "AAA"):
+        dates = pd.date_range("2020-01-01", periods=5, tz="America/New_York", name="Date")
+        pd.DataFrame({"Open": 1.0, "High": 1.0, "Low": 1.0, "Close": 1.0, "Adj Close": 1.0, "Volume": 10},
+                     index=dates).to_csv(raw_dir / f"{ticker}.csv")
+    full = download_data.concat_dataframes(raw_dir, tmp_path / "full")
+    small = download_data.concat_dataframes(raw_dir, tmp_path / "small", compact=True)
+    assert isinstance(small["ticker"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(small.astype({"ticker": str}), full)
+    # 写出的 CSV 和非紧凑模式一样
+    assert (tmp_path / "small" / "combined_stocks_data.csv").read_bytes() == (tmp_path / "full" / "combined_stocks_data.csv").read_bytes()
@@ -0,0 +1,28 @@
+import numpy as np
+
+import factor_eval
+
+
+def test_newey_west_without_lags_is_plain_t_stat():
+    values = np.random.default_rng(0).normal(0.1, 1.0, 300)
+    expected = values.mean() / values.std(ddof=0) * np.sqrt(values.size)
+    assert np.isclose(factor_eval.newey_west_t_stat(values, 0), expected)
+
+
+def test_newey_west_deflates_overlapping_returns():
+    horizon = 10
+    daily = np.random.default_rng(1).normal(0.02, 1.0, 2000)
+    # 相邻两天的 h 天收益重叠 h-1 天
+    overlapping = np.convolve(daily, np.ones(horizon), mode="valid")
+    naive = factor_eval.newey_west_t_stat(overlapping, 0)
+    adjusted = factor_eval.newey_west_t_stat(overlapping, horizon - 1)
+    # 不重叠的样本（每 h 天取一个）给出的 t 值量级
+    sampled = factor_eval.newey_west_t_stat(overlapping[::horizon], 0)
+    assert abs(adjusted) < abs(naive) / 2
+    assert np.isclose(adjusted, sampled, rtol=0.5)
+
+
+def test_newey_west_skips_nan_dates():
+    values = np.array([np.nan, 1.0, 2.0, np.nan, 3.0])
+    assert np.isclose(factor_eval.newey_west_t_stat(values, 1), factor_eval.newey_west_t_stat(values[~np.isnan(values)], 1))
+    assert np.isnan(factor_eval.newey_west_t_stat(np.array([np.nan, 1.0]), 1))
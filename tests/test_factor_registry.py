@@ -0,0 +1,18 @@
+import numpy as np
+
+import factor_engine
+import factor_registry
+import synthetic_data
+
+
+def test_emas_share_one_recursion(monkeypatch):
+    bars = synthetic_data.generate_ohlcv(n_tickers=6, n_days=150, seed=5)
+    reference = factor_engine.compute_all_factors(bars)
+    calls = []
+    ewm_mean = factor_engine.ewm_mean
+    monkeypatch.setattr(factor_engine, "ewm_mean", lambda *args: calls.append(args[1]) or ewm_mean(*args))
+    columns = ["ema_5", "ema_20", "ma_20", "rsi_10"]
+    out = factor_registry.compute_factors(bars, columns)
+    assert len(calls) == 1
+    for column in columns:
+        assert np.array_equal(out[column].to_numpy(), reference[column].to_numpy(), equal_nan=True), column
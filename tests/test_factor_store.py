@@ -0,0 +1,45 @@
+import pytest
+
+import synthetic_data
+from factor_store import FactorStore
+
+
+@pytest.fixture
+def bars():
+    return synthetic_data.generate_ohlcv(n_tickers=6, n_days=40, seed=1)
+
+
+def test_write_replaces_dropped_tickers(tmp_path, bars):
+    store = FactorStore(tmp_path / "store")
+    store.write(bars)
+    kept = sorted(bars["ticker"].unique())[:2]
+    store.write(bars[bars["ticker"].isin(kept)])
+    assert sorted(store.read()["ticker"].unique()) == kept
+    # 临时目录换入之后不留痕迹
+    assert [p.name for p in tmp_path.iterdir()] == ["store"]
+
+
+def test_mismatched_append_is_rejected(tmp_path, bars):
+    FactorStore(tmp_path / "store").write(bars)
+    with pytest.raises(ValueError, match="partitioned by 'ticker'"):
+        FactorStore(tmp_path / "store", partition_by="year").append(bars.head(3))
+    assert len(FactorStore(tmp_path / "store").read()) == len(bars)
+
+
+def test_write_switches_scheme(tmp_path, bars):
+    FactorStore(tmp_path / "store").write(bars)
+    FactorStore(tmp_path / "store", partition_by="year").write(bars)
+    store = FactorStore(tmp_path / "store")
+    assert store.partition_by == "year"
+    # 旧的 ticker=... 分区整体被换掉
+    assert sorted(p.name.split("=")[0] for p in store.root.iterdir() if p.is_dir()) == ["year"] * bars["date"].dt.year.nunique()
+    assert len(store.read()) == len(bars)
+
+
+def test_recorded_scheme_is_used_by_readers(tmp_path, bars):
+    FactorStore(tmp_path / "store", partition_by="year").write(bars)
+    store = FactorStore(tmp_path / "store")
+    assert store.partition_by == "year"
+    assert len(store.read()) == len(bars)
+    store.append(bars.head(3))
+    assert len(store.read()) == len(bars) + 3
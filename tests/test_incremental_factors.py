@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+import factor_engine
+import incremental_factors
+import synthetic_data
+from incremental_factors import FactorState
+
+
+def test_chunked_updates_match_full_recompute(tmp_path):
+    bars = synthetic_data.generate_ohlcv(n_tickers=8, n_days=420, seed=7, missing_price_frac=0.01)
+    full = factor_engine.compute_all_factors(bars).set_index(["ticker", "date"]).sort_index()
+    dates = np.sort(bars["date"].unique())
+    cuts = [dates[300], dates[340], dates[341], dates[-1] + np.timedelta64(1, "D")]
+
+    history = bars[bars["date"] < cuts[0]]
+    parts = [factor_engine.compute_all_factors(history)]
+    incremental_factors.build_state(history).save(tmp_path)
+    for lo, hi in zip(cuts[:-1], cuts[1:]):
+        # 每次都从磁盘读回状态，和实际运行一样
+        new_rows, state = incremental_factors.update_factors(bars[(bars["date"] >= lo) & (bars["date"] < hi)],
+                                                             FactorState.load(tmp_path))
+        state.save(tmp_path)
+        parts.append(new_rows)
+    result = pd.concat(parts, ignore_index=True).set_index(["ticker", "date"]).sort_index()
+
+    assert result.index.equals(full.index)
+    for column in factor_engine.factor_columns():
+        np.testing.assert_allclose(result[column], full[column], rtol=1e-9, atol=1e-12, err_msg=column)
+
+
+def test_rows_already_processed_are_ignored(tmp_path):
+    bars = synthetic_data.generate_ohlcv(n_tickers=3, n_days=60, seed=8)
+    state = incremental_factors.build_state(bars)
+    new_rows, unchanged = incremental_factors.update_factors(bars.tail(10), state)
+    assert new_rows.empty and unchanged is state
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import factor_engine
+import parallel_factors
+import synthetic_data
+
+
+def assert_identical(out, ref):
+    assert list(out.columns) == list(ref.columns)
+    for column in ref.columns:
+        a, b = out[column].to_numpy(), ref[column].to_numpy()
+        assert a.dtype == b.dtype, column
+        if a.dtype.kind == "f":
+            assert np.array_equal(a, b, equal_nan=True), column
+        else:
+            assert (a == b).all(), column
+
+
+@pytest.mark.parametrize("n_tickers, shuffle", [(13, False), (20, True), (3, False)])
+@pytest.mark.parametrize("n_workers, n_shards", [(2, None), (3, 5), (2, 100)])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_bit_identical_to_single_process(n_tickers, shuffle, n_workers, n_shards, dtype):
+    # synthetic_data 带晚上市、退市、停牌缺行和缺失价格
+    raw = synthetic_data.generate_ohlcv(n_tickers=n_tickers, n_days=160, seed=1, gap_frac=0.05, missing_price_frac=0.01)
+    if shuffle:
+        raw = raw.sample(frac=1, random_state=0).reset_index(drop=True)
+    out = parallel_factors.compute_all_factors(raw, n_workers=n_workers, n_shards=n_shards, dtype=dtype)
+    assert_identical(out, factor_engine.compute_all_factors(raw, dtype=dtype))
+
+
+@pytest.mark.parametrize("lengths, n_shards", [
+    (np.full(33, 1000), 32),
+    (np.full(40, 1000), 32),
+    (np.full(5, 10), 4),
+    (np.array([7]), 4),
+    (np.array([2, 3]), 8),
+    (np.array([1, 1, 1000, 1, 1]), 3),
+    (np.array([5000, 1, 1, 1, 1, 1, 1]), 4),
+    (np.array([1, 1, 1, 1, 1, 1, 5000]), 4),
+    (np.random.default_rng(0).integers(1, 3000, 101), 16),
+])
+def test_shard_tickers_edge_cases(lengths, n_shards):
+    shards = parallel_factors.shard_tickers(lengths, n_shards)
+    # 连续、不重叠地覆盖所有 ticker
+    assert shards[0][0] == 0 and shards[-1][1] == len(lengths)
+    assert all(a[1] == b[0] for a, b in zip(shards, shards[1:]))
+    assert 1 <= len(shards) <= max(1, min(n_shards, len(lengths) // 2))
+    if len(lengths) >= 2:
+        assert all(stop - start >= 2 for start, stop in shards)
+
+
+def test_shard_tickers_keeps_one_shard_per_pair_of_tickers():
+    assert len(parallel_factors.shard_tickers(np.full(33, 1000), 32)) == 16
+    assert len(parallel_factors.shard_tickers(np.full(40, 1000), 32)) == 20
+    assert parallel_factors.shard_tickers(np.array([], dtype=np.int64), 4) == []
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import factor_engine
+import portfolio
+import strategies
+import synthetic_data
+from batch_backtest import TRADING_DAYS
+
+
+def _reference_weights(signal:np.ndarray, weighting:str, score:np.ndarray, volatility:np.ndarray, gross:float)->np.ndarray:
+    # 单个调仓日的目标权重，逐个 ticker 计算
+    raw = np.zeros(len(signal))
+    for j, s in enumerate(signal):
+        if np.isnan(s) or s == 0:
+            continue
+        if weighting == "equal":
+            raw[j] = s
+        elif weighting == "score":
+            raw[j] = 0.0 if np.isnan(score[j]) else s * abs(score[j])
+        elif np.isfinite(volatility[j]) and volatility[j] > 0:
+            raw[j] = s / volatility[j]
+    total = np.abs(raw).sum()
+    return raw * gross / total if total > 0 else raw
+
+def _reference_simulate(signals, returns, dates, weighting, rebalance, cost_bps, scores, volatility, gross, cash_rate)->dict:
+    # 逐日记账：持仓金额随收益漂移，调仓日按漂移后的权重算换手、扣成本、再换成目标权重
+    n_dates, n_tickers = returns.shape
+    mask = portfolio.rebalance_mask(dates, rebalance)
+    cash_daily = (1.0 + cash_rate) ** (1.0 / TRADING_DAYS) - 1.0
+    holdings, cash, value = np.zeros(n_tickers), 1.0, 1.0
+    started = False
+    out = {k: np.zeros(n_dates) for k in ("value", "turnover", "costs", "cash_weight", "gross_exposure")}
+    out["daily_returns"] = np.full(n_dates, np.nan)
+    for t in range(n_dates):
+        previous = value
+        if started:
+            holdings = holdings * (1.0 + np.nan_to_num(returns[t], nan=0.0))
+            cash *= 1.0 + cash_daily
+            value = holdings.sum() + cash
+        if mask[t]:
+            target = _reference_weights(signals[t], weighting, None if scores is None else scores[t],
+                                        None if volatility is None else volatility[t], gross)
+            drifted = holdings / value if started else np.zeros(n_tickers)
+            out["turnover"][t] = np.abs(target - drifted).sum()
+            out["costs"][t] = out["turnover"][t] * cost_bps / 10_000
+            value *= 1.0 - out["costs"][t]
+            holdings, cash = target * value, (1.0 - target.sum()) * value
+            started = True
+        if started:
+            out["daily_returns"][t] = value / previous - 1.0
+        out["value"][t] = value
+        out["cash_weight"][t] = cash / value
+        out["gross_exposure"][t] = np.abs(holdings).sum() / value
+    return out
+
+@pytest.fixture(scope="module")
+def panel():
+    rng = np.random.default_rng(5)
+    n_dates, n_tickers = 260, 12
+    dates = pd.bdate_range("2021-01-01", periods=n_dates)
+    signals = rng.choice([-1.0, 0.0, 1.0], size=(n_dates, n_tickers))
+    signals[rng.random(signals.shape) < 0.05] = np.nan
+    signals[:7] = 0.0                   # 开头几天没有信号，全是现金
+    returns = rng.normal(0.0005, 0.02, size=(n_dates, n_tickers))
+    returns[rng.random(returns.shape) < 0.03] = np.nan
+    scores = rng.normal(size=(n_dates, n_tickers))
+    scores[rng.random(scores.shape) < 0.05] = np.nan
+    volatility = rng.uniform(0.1, 0.5, size=(n_dates, n_tickers))
+    volatility[rng.random(volatility.shape) < 0.05] = np.nan
+    return signals, returns, dates, scores, volatility
+
+@pytest.mark.parametrize("weighting", portfolio.WEIGHTINGS)
+@pytest.mark.parametrize("rebalance", ["daily", "weekly", "monthly", 5])
+def test_simulate_matches_per_date_loop(panel, weighting, rebalance):
+    signals, returns, dates, scores, volatility = panel
+    kwargs = dict(weighting=weighting, rebalance=rebalance, cost_bps=7.5, gross=1.5, cash_rate=0.03)
+    # 小的 chunk 让每段持有期跨越多个分块
+    result = portfolio.simulate(signals, returns, dates, scores=scores, volatility=volatility,
+                                initial_capital=1000.0, max_chunk_cells=50, **kwargs)
+    expected = _reference_simulate(signals, returns, dates, scores=scores, volatility=volatility, **kwargs)
+    np.testing.assert_allclose(result.equity_curve, 1000.0 * expected["value"], rtol=1e-12)
+    np.testing.assert_allclose(result.daily_returns, expected["daily_returns"], rtol=1e-9, atol=1e-15)
+    for name in ("turnover", "costs", "cash_weight", "gross_exposure"):
+        np.testing.assert_allclose(getattr(result, name), expected[name], rtol=1e-12, atol=1e-15, err_msg=name)
+
+def test_run_portfolio_matches_per_date_loop():
+    factors = factor_engine.compute_all_factors(synthetic_data.generate_ohlcv(n_tickers=8, n_days=300, seed=2))
+    signal = strategies.strategy_signal(factors, "momentum_strategy", {"long_short": True})
+    result = portfolio.run_portfolio(factors, signal, weighting="volatility", rebalance="weekly", cash_rate=0.02)
+    wide = factors.assign(signal=signal).pivot(index="date", columns="ticker")
+    expected = _reference_simulate(wide["signal"].to_numpy(), wide["return_1day"].to_numpy(), wide.index,
+                                   "volatility", "weekly", portfolio.TRANSACTION_COST_BPS, None,
+                                   wide[portfolio.DEFAULT_VOLATILITY_COLUMN].to_numpy(), 1.0, 0.02)
+    np.testing.assert_allclose(result.equity_curve, portfolio.INITIAL_CAPITAL * expected["value"], rtol=1e-12)
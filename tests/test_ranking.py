@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import factor_engine
+import ranking
+import strategies
+import synthetic_data
+
+
+def _reference_long_short(row:np.ndarray, long_n:int, short_n:int)->np.ndarray:
+    # 原来逐日实现的选股规则：有效值按得分降序稳定排序，头部做多，剩下的尾部做空
+    signal = np.zeros(len(row))
+    valid = pd.Series(row).dropna().sort_values(ascending=False, kind="stable")
+    longs = valid.index[:min(long_n, len(valid))]
+    remaining = valid.index[len(longs):]
+    n_short = min(short_n, len(remaining))
+    signal[longs] = 1.0
+    if n_short > 0:
+        signal[remaining[-n_short:]] = -1.0
+    return signal
+
+def _reference_mean_reversion(data:pd.DataFrame, top_n:int)->pd.Series:
+    # 基线 mean_reversion_strategy 的逐日 sort_values 选股（不含滞后）
+    def assign(group:pd.DataFrame)->pd.Series:
+        order = group["return_5day"].sort_values(kind="stable").index
+        return pd.Series(np.arange(len(group)) < top_n, index=order, dtype=np.float64)
+    return pd.concat([assign(group) for _, group in data.groupby("date")]).reindex(data.index)
+
+@pytest.fixture(scope="module")
+def factors()->pd.DataFrame:
+    bars = synthetic_data.generate_ohlcv(n_tickers=40, n_days=120, seed=3)
+    return factor_engine.compute_all_factors(bars)
+
+@pytest.mark.parametrize("decimals", [None, 1])
+def test_long_short_matches_stable_sort(decimals):
+    rng = np.random.default_rng(0)
+    scores = rng.normal(size=(200, 30))
+    if decimals is not None:
+        scores = scores.round(decimals)      # 大量并列
+    scores[rng.random(scores.shape) < 0.1] = np.nan
+    expected = np.stack([_reference_long_short(row, 5, 4) for row in scores])
+    np.testing.assert_array_equal(ranking.long_short_signals(scores, 5, 4), expected)
+
+def test_mean_reversion_matches_baseline_without_ties(factors):
+    assert not factors.groupby("date")["return_5day"].apply(lambda x: x.dropna().duplicated().any()).any()
+    signal = strategies.mean_reversion_signal(factors, top_n=7)
+    pd.testing.assert_series_equal(signal, _reference_mean_reversion(factors, 7), check_names=False)
+
+def test_mean_reversion_ties_follow_ticker_order(factors):
+    tied = factors.assign(return_5day=factors["return_5day"].round(2))
+    signal = strategies.mean_reversion_signal(tied, top_n=7)
+    pd.testing.assert_series_equal(signal, _reference_mean_reversion(tied, 7), check_names=False)
+
+def test_frame_adapters_keep_baseline_row_order(factors):
+    # 基线 momentum 的逐日 apply 返回同索引的组，pandas 还原成输入顺序；
+    # mean_reversion 在组内 sort_values，结果按日期、日期内按 return_5day 排列
+    momentum = strategies.momentum_strategy(factors, long_short=True)
+    assert momentum.index.is_monotonic_increasing
+    reversion = strategies.mean_reversion_strategy(factors, top_n=7)
+    expected = factors.sort_values(["date", "return_5day"], kind="stable").index
+    assert reversion.index.equals(expected)
@@ -0,0 +1,32 @@
+import numpy as np
+
+import result_cache
+
+
+def test_put_scans_only_when_over_limit(tmp_path, monkeypatch):
+    cache = result_cache.ResultCache(tmp_path, max_mb=0.01)
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or entries())
+    for i in range(5):
+        cache.put_array(f"{i:02d}key", np.zeros(100))
+    # 第一次写入扫描一次，之后只累加
+    assert len(scans) == 1
+    for i in range(5, 20):
+        cache.put_array(f"{i:02d}key", np.zeros(100))
+    assert len(scans) > 1
+    assert cache.size_bytes() <= cache.max_bytes
+
+
+def test_evict_keeps_recently_used(tmp_path):
+    cache = result_cache.ResultCache(tmp_path, max_mb=1)
+    keys = [f"{i:02d}key" for i in range(4)]
+    for key in keys:
+        cache.put_array(key, np.zeros(1000))
+    for i, key in enumerate(keys):
+        path = cache._path(key, ".npy")
+        result_cache.os.utime(path, (i, i))
+    cache.get_array(keys[0])        # 读取会刷新 mtime
+    cache.max_bytes = 2 * cache._path(keys[0], ".npy").stat().st_size
+    cache.evict()
+    assert [cache.get_array(key) is not None for key in keys] == [True, False, False, True]
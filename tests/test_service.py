@@ -0,0 +1,73 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import factor_engine
+import service
+import sweep
+import synthetic_data
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    root = tmp_path_factory.mktemp("service")
+    data = factor_engine.compute_all_factors(synthetic_data.generate_ohlcv(n_tickers=8, n_days=80, seed=3))
+    data.to_csv(root / "factors.csv", index=False)
+    backtests = service.BacktestService(store_dir=root / "store", csv_file=root / "factors.csv")
+    httpd = service.make_server(backtests, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def post(url, body):
+    request = urllib.request.Request(f"{url}/backtest", data=json.dumps(body).encode(), method="POST")
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_valid_request(server):
+    status, body = post(server, {"strategy_name": "rsi_strategy",
+                                 "parameters": {"lower_threshold": 30, "upper_threshold": 70, "rsi_col": "rsi_20"}})
+    assert status == 200
+    assert body["strategy_config"]["strategy_name"] == "rsi_strategy"
+
+
+@pytest.mark.parametrize("body, message", [
+    ({"strategy_name": "nope"}, "Unknown strategy"),
+    ({"strategy_name": "rsi_strategy", "parameters": {"lower_threshold": 30, "upper_threshold": 70}}, "rsi_col"),
+    ({"strategy_name": "ma_crossover_strategy", "parameters": {"top_n": 3}}, "top_n"),
+    ({"strategy_name": "ma_crossover_strategy", "portfolio": {"weighting": "magic"}}, "weighting"),
+    ({"strategy_name": "ma_crossover_strategy", "portfolio": {"weighting": "score"}}, "score_column"),
+    ({"strategy_name": "ma_crossover_strategy", "robustness": {"windows": 3}}, "robustness"),
+    ({"strategy_name": "rsi_strategy", "parameters": {"lower_threshold": 30, "upper_threshold": 70, "rsi_col": "rsi_7"}},
+     "rsi_7"),
+])
+def test_bad_request_is_400(server, body, message):
+    status, reply = post(server, body)
+    assert status == 400
+    assert message in reply["error"]
+
+
+def test_internal_key_error_is_500(server, monkeypatch):
+    def broken(*args, **kwargs):
+        raise KeyError("return_1day")
+    monkeypatch.setattr(sweep, "evaluate", broken)
+    status, reply = post(server, {"strategy_name": "ma_crossover_strategy"})
+    assert status == 500
+    assert reply["error"].startswith("KeyError")
+
+
+@pytest.mark.parametrize("robustness, enabled", [({}, True), (True, True), ({"seed": 1}, True), (False, False), (None, False)])
+def test_any_robustness_object_enables_it(server, robustness, enabled):
+    status, body = post(server, {"strategy_name": "ma_crossover_strategy", "robustness": robustness})
+    assert status == 200
+    assert (body.get("robustness") is not None) == enabled
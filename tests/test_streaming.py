@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+import factor_engine
+import streaming
+import strategies
+import synthetic_data
+from factor_store import FactorStore
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    root = tmp_path_factory.mktemp("streaming")
+    bars = synthetic_data.generate_ohlcv(n_tickers=10, n_days=320, seed=12)
+    bars.to_csv(root / "bars.csv", index=False)
+    # 预算很小，强制分成很多批
+    total = streaming.stream_factors(root / "bars.csv", root / "store", memory_budget_mb=0.3)
+    assert total == len(bars)
+    return bars, FactorStore(root / "store")
+
+
+def test_stream_factors_match_in_memory(store):
+    bars, factor_store = store
+    expected = factor_engine.compute_all_factors(bars).set_index(["ticker", "date"]).sort_index()
+    result = factor_store.read().set_index(["ticker", "date"]).sort_index()
+    assert result.index.equals(expected.index)
+    for column in factor_engine.factor_columns():
+        np.testing.assert_allclose(result[column], expected[column], rtol=1e-9, atol=1e-12, err_msg=column)
+
+
+@pytest.mark.parametrize("name, kwargs", [
+    ("momentum_strategy", {"long_short": True}),
+    ("mean_reversion_strategy", {"top_n": 3}),
+    ("ma_crossover_strategy", {}),
+])
+def test_stream_backtest_matches_in_memory(store, tmp_path, name, kwargs):
+    _, factor_store = store
+    output_file = tmp_path / "rows.parquet"
+    result = streaming.stream_backtest(name, kwargs, factor_store.root, output_file=output_file, memory_budget_mb=0.05)
+
+    data = factor_store.read()
+    expected = backtest.calculate_strategy_returns(strategies.STRATEGIES[name](data, **kwargs))
+    keys = ["ticker", "date"]
+    rows = pd.read_parquet(output_file).sort_values(keys).reset_index(drop=True)
+    expected = expected.sort_values(keys).reset_index(drop=True)
+    pd.testing.assert_frame_equal(rows[keys], expected[keys])
+    for column in ["signal", "position", "strategy_return", "equity_curve"]:
+        np.testing.assert_allclose(rows[column], expected[column], rtol=1e-12, err_msg=column)
+    metrics = backtest.calculate_performance_metrics(expected)
+    for key, value in metrics.items():
+        np.testing.assert_allclose(getattr(result.backtest_result, key), value, rtol=1e-10, atol=1e-14, err_msg=key)
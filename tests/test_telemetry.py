@@ -0,0 +1,41 @@
+import time
+
+import numpy as np
+import pytest
+
+import telemetry
+from telemetry import Telemetry
+
+pytestmark = pytest.mark.skipif(telemetry._current_rss_mb() is None, reason="needs /proc/self/statm")
+
+
+def _allocate(mb:int)->None:
+    block = np.ones(mb * 1024 * 1024 // 8)
+    time.sleep(5 * telemetry.RSS_SAMPLE_SECONDS)
+    del block
+
+
+def test_stage_below_an_earlier_high_still_reports_its_peak():
+    run = Telemetry()
+    with run.stage("big"):
+        _allocate(200)
+    # 第二个阶段的峰值低于进程已有的最高 RSS，也要按阶段起点计算
+    with run.stage("small"):
+        _allocate(60)
+    with run.stage("idle"):
+        time.sleep(5 * telemetry.RSS_SAMPLE_SECONDS)
+    big, small, idle = (stage.peak_memory_mb for stage in run.stages)
+    assert big > 150
+    assert 40 < small < 150
+    assert idle < 20
+    assert run._sampler is None
+
+
+def test_parent_includes_children():
+    run = Telemetry()
+    with run.stage("parent"):
+        with run.stage("child"):
+            _allocate(80)
+    child, parent = run.stages
+    assert child.name == "child" and child.peak_memory_mb > 60
+    assert parent.peak_memory_mb >= child.peak_memory_mb